@@ -17,7 +17,7 @@ from PyQt5.QtWidgets import (
     QFormLayout
 )
 from PyQt5.QtCore import QDate
-import sqlite3
+from db_utils import execute_query, transaction
 
 
 class AddAccountDialog(QDialog):
@@ -100,8 +100,10 @@ class AddAccountDialog(QDialog):
             
             today = QDate.currentDate().toString('yyyy-MM-dd')
             
-            conn = sqlite3.connect('budget.db')
-            try:
+            # 口座と履歴の両方が成功したときだけ確定する。
+            # 失敗時は口座だけ登録され履歴が無い中途半端な状態を防ぐため全部取り消し、
+            # 例外は下のexceptでユーザーに通知する
+            with transaction() as conn:
                 c = conn.cursor()
 
                 # 資産データ挿入
@@ -118,14 +120,6 @@ class AddAccountDialog(QDialog):
                     VALUES (?, ?, ?)
                 ''', (asset_id, today, balance))
 
-                # 口座と履歴の両方が成功したときだけ確定する
-                conn.commit()
-            except Exception:
-                conn.rollback()  # 口座だけ登録され履歴が無い中途半端な状態を防ぐ
-                raise            # 下のexceptでユーザーに通知する
-            finally:
-                conn.close()     # 必ず接続を閉じる
-
             QMessageBox.information(self, '成功', '口座を追加しました')
             self.accept()
 
@@ -183,17 +177,11 @@ class EditAccountDialog(QDialog):
     
     def load_data(self):
         """データを読み込む"""
-        conn = sqlite3.connect('budget.db')
-        c = conn.cursor()
-        
-        c.execute('''
+        result = execute_query('''
             SELECT account_name, balance, notes
             FROM assets
             WHERE id = ?
-        ''', (self.asset_id,))
-        
-        result = c.fetchone()
-        conn.close()
+        ''', (self.asset_id,), fetch_one=True)
         
         if result:
             account_name, balance, notes = result
@@ -220,8 +208,9 @@ class EditAccountDialog(QDialog):
             
             today = QDate.currentDate().toString('yyyy-MM-dd')
             
-            conn = sqlite3.connect('budget.db')
-            try:
+            # 更新と履歴の両方が成功したときだけ確定する
+            # （失敗時は中途半端な更新を取り消し、下のexceptでユーザーに通知する）
+            with transaction() as conn:
                 c = conn.cursor()
 
                 # 資産データ更新
@@ -237,14 +226,6 @@ class EditAccountDialog(QDialog):
                     VALUES (?, ?, ?)
                 ''', (self.asset_id, today, balance))
 
-                # 更新と履歴の両方が成功したときだけ確定する
-                conn.commit()
-            except Exception:
-                conn.rollback()  # 中途半端な更新を防ぐ
-                raise            # 下のexceptでユーザーに通知する
-            finally:
-                conn.close()     # 必ず接続を閉じる
-
             QMessageBox.information(self, '成功', '口座情報を更新しました')
             self.accept()
             
@@ -305,18 +286,12 @@ class UpdateBalanceDialog(QDialog):
     
     def load_accounts(self):
         """口座データを読み込む"""
-        conn = sqlite3.connect('budget.db')
-        c = conn.cursor()
-        
-        c.execute('''
+        accounts = execute_query('''
             SELECT id, account_name, balance
             FROM assets
             WHERE account_type = ?
             ORDER BY account_name
-        ''', (self.account_type,))
-        
-        accounts = c.fetchall()
-        conn.close()
+        ''', (self.account_type,), fetch_all=True)
         
         self.accounts_table.setRowCount(len(accounts))
         
@@ -352,8 +327,9 @@ class UpdateBalanceDialog(QDialog):
                 QMessageBox.warning(self, '警告', '更新する残高を入力してください')
                 return
             
-            conn = sqlite3.connect('budget.db')
-            try:
+            # 全口座の更新が成功したときだけ確定する
+            # （失敗時は一部の口座だけ更新された状態を取り消し、下のexceptで通知する）
+            with transaction() as conn:
                 c = conn.cursor()
 
                 for asset_id, new_balance in updates:
@@ -370,14 +346,6 @@ class UpdateBalanceDialog(QDialog):
                         VALUES (?, ?, ?)
                     ''', (asset_id, today, new_balance))
 
-                # 全口座の更新が成功したときだけ確定する
-                conn.commit()
-            except Exception:
-                conn.rollback()  # 一部の口座だけ更新された中途半端な状態を防ぐ
-                raise            # 下のexceptでユーザーに通知する
-            finally:
-                conn.close()     # 必ず接続を閉じる
-
             type_name = '銀行' if self.account_type == 'bank' else '証券'
             QMessageBox.information(self, '成功', f'{len(updates)}件の{type_name}口座を更新しました')
             self.accept()
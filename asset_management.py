@@ -29,7 +29,7 @@ from PyQt5.QtChart import (
     QAreaSeries,
     QCategoryAxis
 )
-import sqlite3
+from db_utils import execute_query, get_db_connection, transaction
 from datetime import datetime
 from common import BaseWidget
 from account_dialogs import AddAccountDialog, EditAccountDialog, UpdateBalanceDialog
@@ -277,18 +277,12 @@ class AssetManagementWidget(BaseWidget):
     
     def load_assets(self):
         """資産データを読み込む"""
-        conn = sqlite3.connect('budget.db')
-        c = conn.cursor()
-        
         # 全資産取得
-        c.execute('''
+        all_assets = execute_query('''
             SELECT id, account_type, account_name, balance, last_updated, notes
             FROM assets
             ORDER BY account_type, account_name
-        ''')
-        
-        all_assets = c.fetchall()
-        conn.close()
+        ''', fetch_all=True)
         
         # 総資産計算
         total_assets = sum(asset[3] for asset in all_assets)
@@ -420,30 +414,24 @@ class AssetManagementWidget(BaseWidget):
         )
         
         if reply == QMessageBox.Yes:
-            conn = sqlite3.connect('budget.db')
             try:
-                c = conn.cursor()
+                # 2つの削除が両方成功したときだけ確定する。
+                # 途中で失敗したら transaction() が rollback で削除を全部なかったことにするので、
+                # 「履歴だけ消えて口座が残る」ような中途半端な状態にはならない
+                with transaction() as conn:
+                    c = conn.cursor()
 
-                # 履歴データも削除
-                c.execute('DELETE FROM asset_history WHERE asset_id = ?', (asset_id,))
+                    # 履歴データも削除
+                    c.execute('DELETE FROM asset_history WHERE asset_id = ?', (asset_id,))
 
-                # 資産データ削除
-                c.execute('DELETE FROM assets WHERE id = ?', (asset_id,))
-
-                # 2つの削除が両方成功したときだけ確定する
-                conn.commit()
+                    # 資産データ削除
+                    c.execute('DELETE FROM assets WHERE id = ?', (asset_id,))
 
                 QMessageBox.information(self, '成功', '口座を削除しました')
                 self.load_assets()
 
             except Exception as e:
-                # 途中で失敗したら rollback で削除を全部なかったことにする。
-                # これで「履歴だけ消えて口座が残る」ような中途半端な状態を防ぐ
-                conn.rollback()
                 QMessageBox.critical(self, 'エラー', f'削除中にエラーが発生しました: {str(e)}')
-            finally:
-                # 成功・失敗にかかわらず必ず接続を閉じる（閉じ忘れ防止）
-                conn.close()
     
     def update_bank_balance(self):
         """銀行口座残高を一括更新"""
@@ -474,9 +462,8 @@ class AssetManagementWidget(BaseWidget):
             days = None
         
         
-        # データベース接続
-        conn = sqlite3.connect('budget.db')
-        c = conn.cursor()
+        # データベース接続（使い回しの共有接続）
+        c = get_db_connection().cursor()
         
         try:
             # まず現在の資産データを確認
@@ -497,16 +484,15 @@ class AssetManagementWidget(BaseWidget):
             if history_count == 0 and asset_count > 0:
                 today = datetime.now().strftime('%Y-%m-%d')
                 
-                c.execute('SELECT id, balance FROM assets WHERE balance > 0')
-                assets = c.fetchall()
-                
-                for asset_id, balance in assets:
-                    c.execute('''
-                        INSERT INTO asset_history (asset_id, record_date, balance)
-                        VALUES (?, ?, ?)
-                    ''', (asset_id, today, balance))
-                
-                conn.commit()
+                with transaction():
+                    c.execute('SELECT id, balance FROM assets WHERE balance > 0')
+                    assets = c.fetchall()
+                    
+                    for asset_id, balance in assets:
+                        c.execute('''
+                            INSERT INTO asset_history (asset_id, record_date, balance)
+                            VALUES (?, ?, ?)
+                        ''', (asset_id, today, balance))
             
             # 履歴データを取得
             if days:
@@ -533,8 +519,6 @@ class AssetManagementWidget(BaseWidget):
                 for date, balance in history_data:
                     pass
             
-            conn.close()
-            
             # チャート作成
             chart = QChart()
             chart.setAnimationOptions(QChart.SeriesAnimations)
@@ -677,102 +661,77 @@ class AssetManagementWidget(BaseWidget):
             error_chart = QChart()
             error_chart.setTitle(f"エラーが発生しました: {str(e)}")
             self.history_chart_view.setChart(error_chart)
-            
-            try:
-                conn.close()
-            except Exception as e:
-                print(f"DB接続クローズエラー: {e}")
         
 
     def create_initial_asset_history(self):
         """現在の資産データから初期履歴データを作成（重複チェック付き）"""
         try:
-            conn = sqlite3.connect('budget.db')
-            c = conn.cursor()
-            
-            today = datetime.now().strftime('%Y-%m-%d')
-            
-            # 今日の履歴データが既にあるかチェック
-            c.execute('SELECT COUNT(*) FROM asset_history WHERE record_date = ?', (today,))
-            existing_count = c.fetchone()[0]
-            
-            if existing_count > 0:
-                conn.close()
-                return
-            
-            # 既存の履歴データ数をチェック
-            c.execute('SELECT COUNT(*) FROM asset_history')
-            history_count = c.fetchone()[0]
-            
-            if history_count == 0:
-                # 現在の資産データを取得
-                c.execute('''
-                    SELECT id, balance
-                    FROM assets
-                    WHERE balance > 0
-                ''')
-                assets = c.fetchall()
+            with transaction() as conn:
+                c = conn.cursor()
                 
-                if assets:
+                today = datetime.now().strftime('%Y-%m-%d')
+                
+                # 今日の履歴データが既にあるかチェック
+                c.execute('SELECT COUNT(*) FROM asset_history WHERE record_date = ?', (today,))
+                existing_count = c.fetchone()[0]
+                
+                if existing_count > 0:
+                    return
+                
+                # 既存の履歴データ数をチェック
+                c.execute('SELECT COUNT(*) FROM asset_history')
+                history_count = c.fetchone()[0]
+                
+                if history_count == 0:
+                    # 現在の資産データを取得
+                    c.execute('''
+                        SELECT id, balance
+                        FROM assets
+                        WHERE balance > 0
+                    ''')
+                    assets = c.fetchall()
+                    
                     # 各資産の現在の残高を履歴として追加
                     for asset_id, balance in assets:
                         c.execute('''
                             INSERT INTO asset_history (asset_id, record_date, balance)
                             VALUES (?, ?, ?)
                         ''', (asset_id, today, balance))
-                    
-                    conn.commit()
-            
-            conn.close()
             
         except Exception as e:
             print(f"履歴データ作成エラー: {e}")
-            try:
-                conn.close()
-            except Exception as e:
-                print(f"DB接続クローズエラー: {e}")
 
     def record_daily_asset_history(self):
         """日次の資産履歴を記録（重複チェック付き）"""
         try:
-            conn = sqlite3.connect('budget.db')
-            c = conn.cursor()
-            
-            today = datetime.now().strftime('%Y-%m-%d')
-            
-            # 今日の履歴が既にあるかチェック
-            c.execute('SELECT COUNT(*) FROM asset_history WHERE record_date = ?', (today,))
-            existing_count = c.fetchone()[0]
-            
-            if existing_count > 0:
-                conn.close()
-                return
-            
-            # 現在の資産データを取得
-            c.execute('''
-                SELECT id, balance
-                FROM assets
-                WHERE balance > 0
-            ''')
-            assets = c.fetchall()
-            
-            if assets:
+            with transaction() as conn:
+                c = conn.cursor()
+                
+                today = datetime.now().strftime('%Y-%m-%d')
+                
+                # 今日の履歴が既にあるかチェック
+                c.execute('SELECT COUNT(*) FROM asset_history WHERE record_date = ?', (today,))
+                existing_count = c.fetchone()[0]
+                
+                if existing_count > 0:
+                    return
+                
+                # 現在の資産データを取得
+                c.execute('''
+                    SELECT id, balance
+                    FROM assets
+                    WHERE balance > 0
+                ''')
+                assets = c.fetchall()
+                
                 for asset_id, balance in assets:
                     c.execute('''
                         INSERT INTO asset_history (asset_id, record_date, balance)
                         VALUES (?, ?, ?)
                     ''', (asset_id, today, balance))
-                
-                conn.commit()
-            
-            conn.close()
             
         except Exception as e:
             print(f"日次履歴記録エラー: {e}")
-            try:
-                conn.close()
-            except Exception as e:
-                print(f"DB接続クローズエラー: {e}")    
 
     def setup_asset_composition_tab(self):
         """資産構成タブのUI（円グラフ）"""
@@ -853,19 +812,13 @@ class AssetManagementWidget(BaseWidget):
     def update_asset_composition_charts(self):
         """資産構成円グラフを更新"""
         # データベースから資産データを取得
-        conn = sqlite3.connect('budget.db')
-        c = conn.cursor()
-        
         # 全資産取得
-        c.execute('''
+        assets = execute_query('''
             SELECT account_type, account_name, balance, notes
             FROM assets
             WHERE balance > 0
             ORDER BY balance DESC
-        ''')
-        
-        assets = c.fetchall()
-        conn.close()
+        ''', fetch_all=True)
         
         if not assets:
             # データがない場合の処理
@@ -43,6 +43,10 @@ class BackupManager:
         dst = sqlite3.connect(dest_path)     # コピー先のDBを作る（無ければ新規作成）
         try:
             src.backup(dst)                  # SQLiteが安全にコピーしてくれる
+            if os.path.abspath(dest_path) != os.path.abspath(self.db_path):
+                # 本体DBはWALモードなので、コピーもWALのまま引き継がれる。
+                # バックアップは1ファイルで持ち運べるよう通常のジャーナルに戻しておく
+                dst.execute('PRAGMA journal_mode=DELETE')
         finally:
             # 成功・失敗にかかわらず必ず接続を閉じる
             dst.close()
@@ -17,6 +17,7 @@ from PyQt5.QtGui import QFont, QColor
 from PyQt5.QtChart import QChart, QChartView, QPieSeries, QPieSlice
 from db_utils import execute_query, fetch_df
 from common import DateHelper, BaseWidget, YearMonthDialog, CHART_PALETTE
+from events import CategoryChanged, ExpenseChanged, GoalChanged, IncomeChanged
 
 
 class BreakdownWidget(BaseWidget):
@@ -24,6 +25,10 @@ class BreakdownWidget(BaseWidget):
         super().__init__(parent)
         self.current_year, self.current_month = DateHelper.get_current_year_month()
         self.initUI()
+        self.watch_changes(ExpenseChanged, IncomeChanged, GoalChanged, CategoryChanged)
+
+    def is_affected_by(self, event):
+        return event.affects_month(self.current_year, self.current_month)
 
     def initUI(self):
         layout = QVBoxLayout()
@@ -100,14 +105,13 @@ class BreakdownWidget(BaseWidget):
             WHERE year = ? AND month = ?
         ''', (self.current_year, self.current_month), fetch_one=True)
         
-        # 支出データの取得
+        # 支出データの取得（トリガーで更新される集計テーブルから読む）
         df = fetch_df('''
-            SELECT category, SUM(amount) as total_amount 
-            FROM expenses 
-            WHERE strftime('%Y', date) = ? 
-            AND strftime('%m', date) = ?
-            GROUP BY category
-        ''', params=(str(self.current_year), f"{self.current_month:02d}"))
+            SELECT category, total as total_amount 
+            FROM monthly_category_totals 
+            WHERE year = ? AND month = ?
+            ORDER BY category
+        ''', params=(self.current_year, self.current_month))
         
         return income_result[0] if income_result else 0, df
 
@@ -7,6 +7,10 @@
   common.py                 … 日付ヘルパー・基底ウィジェット・共用ダイアログ
   main_window.py            … メインウィンドウ（画面の生成・切替）
   income_expense.py         … 入出金管理画面（メイン画面）
+  expense_table_model.py    … 支出一覧テーブルのモデルとカテゴリ編集デリゲート
+  expense_query.py          … 支出一覧の検索条件（絞り込み・並び替え・ページ読み込みのSQL）
+  query_scheduler.py        … DB問い合わせのバックグラウンド実行（デバウンス・取り消し）
+  month_summary.py          … 表示中の月の収入・支出・目標の集計（編集の差分で更新）
   breakdown.py              … 内訳画面（円グラフ）
   monthly_report.py         … 月次レポート画面
   goal_management.py        … 目標管理画面
@@ -15,7 +19,12 @@
   asset_management.py       … 資産管理画面
   account_dialogs.py        … 口座の追加・編集・残高更新ダイアログ
   credit_card_import.py     … クレジットカード明細取込
+  card_formats.py           … カード明細CSVのフォーマット定義と明細への変換（GUI・CLI共通）
+  sheet_fetch.py            … Google Sheets公開CSVの取得（条件付きリクエスト・前回の本文を保存）
+  keyword_matcher.py        … 明細取込のキーワード一括照合（カテゴリ振り分け・除外）
   pasmo_import.py           … PASMO明細取込（PDF解析）
+  pasmo_parser.py           … PASMO明細PDFの解析（ページの並列読み取り）
+  parse_cache.py            … 明細ファイルの解析結果キャッシュ（中身のハッシュがキー・LRUで削除）
   category_management.py    … カテゴリ管理ダイアログ
   backup.py                 … バックアップ作成・復元
 """
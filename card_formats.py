@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""カード明細CSVのフォーマット定義と明細への変換（Qtに依存しない）
+
+取込ダイアログ（credit_card_import.py）と cli_import.py の一括取込の両方から使う。
+一括取込ではワーカープロセスがこのモジュールだけを読み込んで解析するので、Qt（PyQt5）は使わない。
+"""
+import numpy as np
+import pandas as pd
+from db_utils import normalize_text
+from keyword_matcher import KeywordMatcher
+
+
+# フォーマットプリセット（ダイアログでは複製してから編集する。ここを直接書き換えないこと）
+FORMAT_PRESETS = {
+    '一般的なクレジットカード': {
+        'encoding': 'utf-8',
+        'date_format': '%Y/%m/%d',
+        'skip_rows': 0,
+        'negation_needed': True,
+        'date_column': '利用日',
+        'amount_column': '利用金額',
+        'description_column': '利用店名・商品名',
+        'description_prefix': 'クレジットカード: ',
+        'category_mapping': {
+            'ﾏﾙｴﾂ': '食費',
+            'ﾄｳｷﾖｳﾃﾞﾝﾘﾖｸ': '水道光熱費',
+            'CLAUDE.AI SUBSCRIPTI': '娯楽',
+            'ｽｲﾄﾞｳﾘ': '水道光熱費'
+        },
+        'exclude_keywords': [
+            'ﾓﾊﾞｲﾙﾊﾟｽﾓ',
+            '楽天証券投信積立０．５％～',
+            '楽天キャッシュ　チャージ',
+            'APPLE COM BILL',
+            'ﾄｳｴﾝﾃｲ',
+            'ｸﾗｽ',
+            'ソフトバンク（Ｂ）',
+            'ｾｲﾌﾞﾃﾂﾄﾞｳ'
+        ]
+    },
+    '楽天PAY': {
+        'encoding': 'utf-8',
+        'date_format': '%Y/%m/%d',
+        'skip_rows': 0,
+        'negation_needed': False,
+        'date_column': '日付',
+        'amount_column': '金額',
+        'description_column': '店舗名',
+        'description_prefix': '楽天PAY: ',
+        'category_mapping': {},
+        'exclude_keywords': []
+    },
+    'PayPay': {
+        'encoding': 'utf-8-sig',
+        'date_format': '%Y/%m/%d %H:%M:%S',
+        'skip_rows': 0,
+        'negation_needed': False,
+        'date_column': '取引日',
+        'amount_column': '出金金額（円）',
+        'description_column': '取引先',
+        'description_prefix': 'PayPay: ',
+        'category_mapping': {},
+        'exclude_keywords': []
+    }
+}
+
+
+def read_encoding(fmt):
+    """CSVを読むときの文字コード（utf-8 はBOM付きのファイルも読めるよう utf-8-sig で読む）"""
+    encoding = fmt['encoding']
+    return 'utf-8-sig' if encoding.lower().replace('_', '-') in ('utf-8', 'utf8') else encoding
+
+
+def header_mapping(fmt):
+    """フォーマットの列名を transform_rows の header_mapping にする"""
+    return {
+        'date': fmt['date_column'],
+        'amount': fmt['amount_column'],
+        'description': fmt['description_column']
+    }
+
+
+def detect_format(file_path, presets=FORMAT_PRESETS):
+    """CSVの見出し行からフォーマットを推定し、プリセット名を返す（どれにも合わなければ None）
+
+    日付・金額・説明の列がすべてそろっている最初のプリセットを選ぶ。
+    """
+    for name, fmt in presets.items():
+        try:
+            columns = pd.read_csv(
+                file_path, encoding=read_encoding(fmt), skiprows=fmt['skip_rows'], nrows=0
+            ).columns
+        except (UnicodeDecodeError, ValueError):
+            continue  # 文字コードが違う・見出しが読めない
+        if set(header_mapping(fmt).values()) <= set(columns):
+            return name
+    return None
+
+
+def keyword_matchers(fmt):
+    """正規化したキーワードで作った (除外キーワードの照合器, カテゴリマッピングの照合器) を返す"""
+    # 除外キーワードに接頭辞付きで登録されていても、明細の説明文と比べられるように外す
+    credit_prefix = normalize_text(fmt.get('description_prefix', 'クレジットカード: '))
+    excludes = []
+    for exclude_keyword in fmt['exclude_keywords']:
+        normalized_exclude = normalize_text(exclude_keyword)
+        if normalized_exclude.startswith(credit_prefix):
+            normalized_exclude = normalized_exclude[len(credit_prefix):]
+        if normalized_exclude:
+            excludes.append(normalized_exclude)
+    mapping = [(normalize_text(keyword), category)
+               for keyword, category in fmt['category_mapping'].items()]
+    return KeywordMatcher((keyword, True) for keyword in excludes), KeywordMatcher(mapping)
+
+
+def transform_rows(csv_data, fmt, columns, matchers=None):
+    """CSVの行（DataFrame）を取り込む明細 [{'date', 'amount', 'description', 'category'}, ...] にする
+
+    columns は {'date', 'amount', 'description'} → CSVの列名、matchers は keyword_matchers(fmt) の結果
+    （省略するとその場で作る）。
+    以前は1行ずつ iterrows() で日付の変換・キーワードの照合をしていたため、
+    PayPay や楽天の長い明細では数十秒かかっていた。ここでは列ごとにまとめて処理する。
+    説明文の正規化とキーワードの照合は、同じ店名が何度も出てくるので説明文の種類ごとに1回だけ行う。
+    """
+    exclude_matcher, category_matcher = matchers or keyword_matchers(fmt)
+
+    # 日付処理（読めない日付は NaT になり、その行は取り込まない）
+    dates = pd.to_datetime(
+        csv_data[columns['date']].map(str), format=fmt['date_format'], errors='coerce'
+    )
+
+    # 金額処理（空欄・「-」・数値でないものは NaN になり、その行は取り込まない）
+    # 全角の数字・符号・カンマ（「１，２３４」「－５００」）も読めるよう、先に半角にそろえる
+    amount_text = (csv_data[columns['amount']].map(str)
+                   .str.normalize('NFKC')
+                   .str.replace(',', '', regex=False)
+                   .str.replace('円', '', regex=False)
+                   .str.strip())
+    amounts = pd.to_numeric(amount_text.where(~amount_text.isin(['', 'nan', '-'])), errors='coerce')
+    # 金額の絶対値を使用（支出として記録するため。negation_needed で符号を反転しても絶対値は同じ）
+    amounts = amounts.abs().astype(float)
+
+    # 説明処理（説明文の種類ごとに正規化し、codes で各行に対応付ける）
+    descriptions = csv_data[columns['description']].map(str)
+    codes, unique_descriptions = pd.factorize(descriptions)
+    normalized = [normalize_text(text) for text in unique_descriptions]
+
+    # 除外キーワードチェック・カテゴリ推定（マッピングの先に書いたキーワードを優先する）
+    # 説明文を1回なぞるだけで全キーワードを照合する（keyword_matcher.py）
+    excluded = np.array([exclude_matcher.match(text, False) for text in normalized], dtype=bool)
+    categories = np.array([category_matcher.match(text, 'その他') for text in normalized], dtype=object)
+
+    keep = (dates.notna() & amounts.notna() & (amounts != 0)).to_numpy() & ~excluded[codes]
+    return [
+        {'date': date, 'amount': amount, 'description': description, 'category': category}
+        for date, amount, description, category in zip(
+            dates[keep].dt.strftime('%Y-%m-%d').tolist(),
+            amounts[keep].tolist(),
+            descriptions[keep].tolist(),
+            categories[codes[keep]].tolist()
+        )
+    ]
+
+
+def expense_rows(data, prefix):
+    """明細を import_expenses に渡す (date, category, amount, description) の行にする
+
+    戻り値は (行のリスト, 取り込めなかった件数)。
+    """
+    failed_count = 0  # 取込に失敗した行数（黙って欠落させないためカウントする）
+    rows = []
+    for item in data:
+        try:
+            amount = abs(item['amount'])  # 支出なので絶対値を使用
+            if not item['date'] or not item['category']:
+                raise ValueError('日付またはカテゴリがありません')
+            rows.append((item['date'], item['category'], amount, f"{prefix}{item['description']}"))
+        except Exception as e:
+            print(f"取込できない行: {e}")
+            failed_count += 1  # 失敗を記録して次の行へ
+    return rows, failed_count
@@ -17,6 +17,8 @@ from PyQt5.QtWidgets import (
 )
 from PyQt5.QtCore import Qt
 import sqlite3
+from db_utils import execute_query, transaction, recategorize_expenses
+from events import get_event_bus, CategoryChanged, ExpenseChanged
 
 
 class CategoryManagementDialog(QDialog):
@@ -77,12 +79,10 @@ class CategoryManagementDialog(QDialog):
         self.setLayout(layout)
     
     def load_categories(self):
-        conn = sqlite3.connect('budget.db')
-        c = conn.cursor()
-        c.execute('SELECT id, name, sort_order, is_default FROM categories ORDER BY sort_order')
-        
-        categories = c.fetchall()
-        conn.close()
+        categories = execute_query(
+            'SELECT id, name, sort_order, is_default FROM categories ORDER BY sort_order',
+            fetch_all=True
+        )
         
         self.category_table.setRowCount(len(categories))
         
@@ -109,28 +109,26 @@ class CategoryManagementDialog(QDialog):
             QMessageBox.warning(self, '警告', 'カテゴリ名を入力してください')
             return
         
-        conn = sqlite3.connect('budget.db')
-        c = conn.cursor()
-        
         try:
-            # 現在の最大表示順を取得
-            c.execute('SELECT MAX(sort_order) FROM categories')
-            max_order = c.fetchone()[0]
-            if max_order is None:
-                max_order = 0
-            
-            # 新しいカテゴリを追加
-            c.execute('INSERT INTO categories (name, sort_order) VALUES (?, ?)', 
-                     (category_name, max_order + 1))
-            conn.commit()
+            with transaction() as conn:
+                c = conn.cursor()
+
+                # 現在の最大表示順を取得
+                c.execute('SELECT MAX(sort_order) FROM categories')
+                max_order = c.fetchone()[0]
+                if max_order is None:
+                    max_order = 0
+                
+                # 新しいカテゴリを追加
+                c.execute('INSERT INTO categories (name, sort_order) VALUES (?, ?)', 
+                         (category_name, max_order + 1))
             
             self.new_category_input.clear()
             self.load_categories()
+            get_event_bus().publish(CategoryChanged())
             
         except sqlite3.IntegrityError:
             QMessageBox.warning(self, '警告', f'カテゴリ「{category_name}」は既に存在します')
-        finally:
-            conn.close()
     
     def edit_category(self):
         selected_items = self.category_table.selectedItems()
@@ -153,19 +151,14 @@ class CategoryManagementDialog(QDialog):
         )
         
         if ok and new_name.strip():
-            conn = sqlite3.connect('budget.db')
-            c = conn.cursor()
-            
             try:
-                c.execute('UPDATE categories SET name = ? WHERE id = ?', 
-                         (new_name, category_id))
-                conn.commit()
+                execute_query('UPDATE categories SET name = ? WHERE id = ?', 
+                              (new_name, category_id))
                 self.load_categories()
+                get_event_bus().publish(CategoryChanged())
                 
             except sqlite3.IntegrityError:
                 QMessageBox.warning(self, '警告', f'カテゴリ「{new_name}」は既に存在します')
-            finally:
-                conn.close()
     
     def delete_category(self):
         selected_items = self.category_table.selectedItems()
@@ -183,14 +176,12 @@ class CategoryManagementDialog(QDialog):
             QMessageBox.warning(self, '警告', 'デフォルトカテゴリは削除できません')
             return
         
-        # 確認ダイアログ
-        conn = sqlite3.connect('budget.db')
-        c = conn.cursor()
-        
         # このカテゴリを使用しているデータがあるか確認
-        c.execute('SELECT COUNT(*) FROM expenses WHERE category = ?', (category_name,))
-        usage_count = c.fetchone()[0]
+        usage_count = execute_query(
+            'SELECT COUNT(*) FROM expenses WHERE category = ?', (category_name,), fetch_one=True
+        )[0]
         
+        # 確認ダイアログ
         if usage_count > 0:
             reply = QMessageBox.question(
                 self, '確認', 
@@ -210,16 +201,20 @@ class CategoryManagementDialog(QDialog):
         
         if reply == QMessageBox.Yes:
             try:
-                # 関連データを「その他」カテゴリに変更
-                if usage_count > 0:
-                    c.execute('UPDATE expenses SET category = "その他" WHERE category = ?',
-                             (category_name,))
-                
-                # カテゴリを削除
-                c.execute('DELETE FROM categories WHERE id = ?', (category_id,))
-                conn.commit()
+                # 付け替えと削除の両方が成功したときだけ確定する
+                with transaction() as conn:
+                    # 関連データを「その他」カテゴリに変更
+                    if usage_count > 0:
+                        recategorize_expenses('その他', where='e.category = ?', params=(category_name,))
+                    
+                    # カテゴリを削除
+                    conn.execute('DELETE FROM categories WHERE id = ?', (category_id,))
                 
                 self.load_categories()
+                get_event_bus().publish(CategoryChanged())
+                if usage_count > 0:
+                    # 「その他」への付け替えで支出の集計も変わる
+                    get_event_bus().publish(ExpenseChanged())
                 
                 if usage_count > 0:
                     QMessageBox.information(
@@ -229,8 +224,6 @@ class CategoryManagementDialog(QDialog):
                 
             except Exception as e:
                 QMessageBox.critical(self, 'エラー', f'削除中にエラーが発生しました: {e}')
-            finally:
-                conn.close()
     
     def move_category(self, direction):
         selected_items = self.category_table.selectedItems()
@@ -253,24 +246,20 @@ class CategoryManagementDialog(QDialog):
         target_order = int(self.category_table.item(target_row, 1).text())
         
         # データベースで順序を入れ替え
-        conn = sqlite3.connect('budget.db')
         try:
-            c = conn.cursor()
-
-            c.execute('UPDATE categories SET sort_order = ? WHERE id = ?', (target_order, current_id))
-            c.execute('UPDATE categories SET sort_order = ? WHERE id = ?', (current_order, target_id))
-
             # 2つのUPDATEが両方成功したときだけ確定する
-            conn.commit()
+            # （失敗時は片方だけ入れ替わった中途半端な状態を取り消す）
+            with transaction() as conn:
+                c = conn.cursor()
+                c.execute('UPDATE categories SET sort_order = ? WHERE id = ?', (target_order, current_id))
+                c.execute('UPDATE categories SET sort_order = ? WHERE id = ?', (current_order, target_id))
         except Exception as e:
-            conn.rollback()  # 片方だけ入れ替わった中途半端な状態を防ぐ
             QMessageBox.critical(self, 'エラー', f'カテゴリの並び替えに失敗しました: {e}')
             return
-        finally:
-            conn.close()     # 必ず接続を閉じる
 
         # テーブル表示を更新
         self.load_categories()
+        get_event_bus().publish(CategoryChanged())
         
         # 選択状態を移動先の行に移す
         self.category_table.selectRow(target_row)
@@ -1,201 +1,486 @@
-#!/usr/bin/env python3
-# -*- coding: utf-8 -*-
-"""
-楽天カードCSVを家計簿アプリに自動インポートするCLIツール
-"""
-import sys
-import sqlite3
-import pandas as pd
-from datetime import datetime
-import os
-
-def classify_category(store_name):
-    """店舗名からカテゴリを自動判定"""
-    # カテゴリ分類ルール
-    rules = {
-        # 食費
-        'マルエツ': '食費',
-        'カ)マルエツ': '食費',
-        'イオン': '食費',
-        'イオンモール': '食費',
-        'セブン': '食費',
-        'ローソン': '食費',
-        'ファミ': '食費',
-        'スーパー': '食費',
-        'マクドナルド': '食費',
-        'スタバ': '食費',
-        'ドトール': '食費',
-        
-        
-        # 交通費
-        '電車': '交通費',
-        'バス': '交通費',
-        '定期': '交通費',
-        
-        # 娯楽
-        'CLAUDE': '娯楽',
-        'APPLE': '娯楽',
-        'NETFLIX': '娯楽',
-        'AMAZON': '娯楽',
-        'SPOTIFY': '娯楽',
-        
-        # 日用品
-        'ドラッグ': '日用品',
-        'マツキヨ': '日用品',
-        'ココカラ': '日用品',
-        'ウェルシア': '日用品',
-        
-        # 住宅
-        '家賃': '住宅',
-        '不動産': '住宅',
-        
-        # 水道光熱費
-        '電気': '水道光熱費',
-        'ガス': '水道光熱費',
-        '水道': '水道光熱費',
-        '東京': '水道光熱費',
-        
-        
-        # 通信費
-        'ソフトバンク': '通信費',
-        'オプテージ': '通信費',
-        'Wi-Fi': '通信費',
-        '携帯': '通信費',
-
-        
-        # 美容
-        '美容': '美容',
-        '理容': '美容',
-        'サロン': '美容',
-        'ララルー': '美容',
-        'スクエア': '美容',
-        
-        # 健康
-        '病院': '健康',
-        'クリニック': '健康',
-        '薬局': '健康',
-        'ジム': '健康',
-        'トウエンティーフォージム': '健康',
-        
-        # その他
-        '楽天証券': 'その他',
-        'E-ビーシーマート': 'その他',
-        'ドン キホーテ': 'その他',
-    }
-    
-    # 店舗名に含まれるキーワードでマッチング
-    for keyword, category in rules.items():
-        if keyword.upper() in store_name.upper():
-            return category
-    
-    return 'その他'
-
-def import_rakuten_csv(csv_path, db_path='budget.db'):
-    """楽天カードCSVをインポート"""
-    
-    if not os.path.exists(csv_path):
-        print(f"❌ エラー: ファイルが見つかりません: {csv_path}")
-        return False
-    
-    try:
-        # CSVを読み込み（楽天カードの形式）
-        # UTF-8 BOM付きで読み込み
-        df = pd.read_csv(csv_path, encoding='utf-8-sig')
-        
-        print(f"📄 CSVファイル読み込み: {len(df)}件")
-        print(f"   カラム: {df.columns.tolist()}")
-        
-        # 必要な列を抽出
-        # 列名: 利用日, 利用店名・商品名, 利用金額
-        df = df[['利用日', '利用店名・商品名', '利用金額']]
-        df.columns = ['date', 'store', 'amount']
-        
-        # データクレンジング
-        df['date'] = pd.to_datetime(df['date'], format='%Y/%m/%d', errors='coerce')
-        df = df.dropna(subset=['date'])  # 日付が無効な行を削除
-        
-        # 金額をカンマ除去して数値に変換
-        if df['amount'].dtype == 'object':
-            df['amount'] = df['amount'].astype(str).str.replace(',', '').astype(float)
-        
-        # カテゴリ自動分類
-        df['category'] = df['store'].apply(classify_category)
-        
-        # データベースに挿入
-        # try/finally で囲み、途中でエラーが起きても必ず接続を閉じる。
-        # 閉じ忘れるとDBのロックが残り、GUIアプリ側の操作が
-        # 「database is locked」で失敗する原因になる
-        conn = sqlite3.connect(db_path)
-        try:
-            cursor = conn.cursor()
-
-            inserted_count = 0
-            duplicate_count = 0
-
-            for _, row in df.iterrows():
-                date_str = row['date'].strftime('%Y-%m-%d')
-                store = row['store']
-                amount = row['amount']
-                category = row['category']
-
-                # 重複チェック（同じ日付・店舗・金額の組み合わせ）
-                cursor.execute('''
-                    SELECT COUNT(*) FROM expenses
-                    WHERE date=? AND description LIKE ? AND amount=?
-                ''', (date_str, f"%{store}%", amount))
-
-                if cursor.fetchone()[0] == 0:
-                    # 新規レコードを挿入
-                    cursor.execute('''
-                        INSERT INTO expenses (date, category, amount, description)
-                        VALUES (?, ?, ?, ?)
-                    ''', (
-                        date_str,
-                        category,
-                        amount,
-                        f"クレジットカード: {store}"
-                    ))
-                    inserted_count += 1
-                else:
-                    duplicate_count += 1
-
-            # 全行の処理が成功したときだけ確定する
-            conn.commit()
-        except Exception:
-            conn.rollback()  # 途中まで挿入した分を取り消す（半端な取込を防ぐ）
-            raise            # エラー内容は下のexceptでprintされる
-        finally:
-            conn.close()     # 成功・失敗にかかわらず必ず接続を閉じる
-        
-        print(f"✅ インポート完了!")
-        print(f"   新規登録: {inserted_count}件")
-        print(f"   重複スキップ: {duplicate_count}件")
-        
-        # カテゴリ別集計を表示
-        if inserted_count > 0:
-            print(f"\n📊 カテゴリ別登録件数:")
-            category_counts = df.groupby('category').size().to_dict()
-            for cat, count in sorted(category_counts.items(), key=lambda x: x[1], reverse=True):
-                print(f"   {cat}: {count}件")
-        
-        return True
-        
-    except Exception as e:
-        print(f"❌ エラー発生: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        return False
-
-if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("使い方: python cli_import.py <CSVファイルパス> [データベースパス]")
-        print("例: python cli_import.py enavi202510.csv")
-        print("例: python cli_import.py enavi202510.csv budget.db")
-        sys.exit(1)
-    
-    csv_path = sys.argv[1]
-    db_path = sys.argv[2] if len(sys.argv) > 2 else 'budget.db'
-    
-    success = import_rakuten_csv(csv_path, db_path)
-    
-    sys.exit(0 if success else 1)
\ No newline at end of file
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+楽天カードCSVを家計簿アプリに自動インポートするCLIツール
+
+--batch を付けると、ディレクトリ（またはglobパターン）の中のCSVをまとめて取り込む。
+各ファイルのフォーマットは card_formats.py のプリセットから見出し行で推定し、
+解析はワーカープロセスで並列に行う。書き込みはこのプロセスだけが1ファイル1トランザクションで行い、
+ファイルごとの結果を1行1件のJSONで標準出力に出す（数年分の明細を1回で取り込める）。
+
+--watch を付けると、ディレクトリを見張り続け、置かれた・書き換えられたCSVをその都度取り込む。
+取り込んだファイルの中身のハッシュを credit_card_imports に記録し、同じ中身のファイルは取り込み直さない。
+"""
+import argparse
+import contextlib
+import glob
+import json
+import sys
+import time
+import pandas as pd
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+import os
+from db_utils import (
+    close_db_connection, ensure_import_file_hashes, get_imported_file_hashes,
+    import_expenses, import_expenses_in_chunks, transaction
+)
+from keyword_matcher import KeywordMatcher
+from card_formats import FORMAT_PRESETS, detect_format, expense_rows, header_mapping, read_encoding, transform_rows
+from parse_cache import file_digest
+
+# カテゴリ分類ルール（店舗名に含まれるキーワード → カテゴリ。上に書いたものほど優先）
+CATEGORY_RULES = {
+    # 食費
+    'マルエツ': '食費',
+    'カ)マルエツ': '食費',
+    'イオン': '食費',
+    'イオンモール': '食費',
+    'セブン': '食費',
+    'ローソン': '食費',
+    'ファミ': '食費',
+    'スーパー': '食費',
+    'マクドナルド': '食費',
+    'スタバ': '食費',
+    'ドトール': '食費',
+    
+    
+    # 交通費
+    '電車': '交通費',
+    'バス': '交通費',
+    '定期': '交通費',
+    
+    # 娯楽
+    'CLAUDE': '娯楽',
+    'APPLE': '娯楽',
+    'NETFLIX': '娯楽',
+    'AMAZON': '娯楽',
+    'SPOTIFY': '娯楽',
+    
+    # 日用品
+    'ドラッグ': '日用品',
+    'マツキヨ': '日用品',
+    'ココカラ': '日用品',
+    'ウェルシア': '日用品',
+    
+    # 住宅
+    '家賃': '住宅',
+    '不動産': '住宅',
+    
+    # 水道光熱費
+    '電気': '水道光熱費',
+    'ガス': '水道光熱費',
+    '水道': '水道光熱費',
+    '東京': '水道光熱費',
+    
+    
+    # 通信費
+    'ソフトバンク': '通信費',
+    'オプテージ': '通信費',
+    'Wi-Fi': '通信費',
+    '携帯': '通信費',
+
+    
+    # 美容
+    '美容': '美容',
+    '理容': '美容',
+    'サロン': '美容',
+    'ララルー': '美容',
+    'スクエア': '美容',
+    
+    # 健康
+    '病院': '健康',
+    'クリニック': '健康',
+    '薬局': '健康',
+    'ジム': '健康',
+    'トウエンティーフォージム': '健康',
+    
+    # その他
+    '楽天証券': 'その他',
+    'E-ビーシーマート': 'その他',
+    'ドン キホーテ': 'その他',
+}
+
+
+# CSVを一度に読み込む行数（数GBの明細でも、メモリに載るのはこの行数分だけになる）
+CHUNK_SIZE = 50000
+
+# CATEGORY_RULES から作った照合器（最初の呼び出しで1回だけ作る）
+_category_matcher = None
+
+
+def classify_category(store_name):
+    """店舗名からカテゴリを自動判定"""
+    global _category_matcher
+    if _category_matcher is None:
+        _category_matcher = KeywordMatcher(
+            (keyword.upper(), category) for keyword, category in CATEGORY_RULES.items()
+        )
+
+    # 店舗名に含まれるキーワードでマッチング（大文字小文字は区別しない）
+    return _category_matcher.match(str(store_name).upper(), 'その他')
+
+def _prepare_chunk(df):
+    """楽天カードCSVの1かたまりを date, store, amount, category の列にそろえる（日付が無効な行は除く）"""
+    # 必要な列を抽出
+    # 列名: 利用日, 利用店名・商品名, 利用金額
+    df = df[['利用日', '利用店名・商品名', '利用金額']]
+    df.columns = ['date', 'store', 'amount']
+
+    # データクレンジング
+    df['date'] = pd.to_datetime(df['date'], format='%Y/%m/%d', errors='coerce')
+    df = df.dropna(subset=['date'])  # 日付が無効な行を削除
+
+    # 金額をカンマ除去して数値に変換
+    if not pd.api.types.is_numeric_dtype(df['amount']):
+        df['amount'] = df['amount'].astype(str).str.replace(',', '').astype(float)
+
+    # カテゴリ自動分類
+    df['store'] = df['store'].map(str)
+    df['category'] = df['store'].map(classify_category)
+    return df
+
+
+def import_rakuten_csv(csv_path, db_path='budget.db', chunksize=CHUNK_SIZE):
+    """楽天カードCSVをインポート
+
+    CSVは chunksize 行ずつ読み込み、かたまりごとに変換・重複除外・書き込み（確定）を行う。
+    """
+
+    if not os.path.exists(csv_path):
+        print(f"❌ エラー: ファイルが見つかりません: {csv_path}")
+        return False
+
+    try:
+        file_size = os.path.getsize(csv_path)
+        total_rows = 0
+        category_counts = Counter()
+
+        # CSVを読み込み（楽天カードの形式）
+        # UTF-8 BOM付きで読み込み
+        with open(csv_path, 'rb') as csv_file:
+            reader = pd.read_csv(csv_file, encoding='utf-8-sig', chunksize=chunksize)
+
+            def chunks():
+                nonlocal total_rows
+                for index, chunk in enumerate(reader):
+                    if index == 0:
+                        print(f"   カラム: {chunk.columns.tolist()}")
+                    total_rows += len(chunk)
+                    df = _prepare_chunk(chunk)
+                    category_counts.update(df['category'])
+                    yield list(zip(
+                        df['date'].dt.strftime('%Y-%m-%d'),
+                        df['category'],
+                        df['amount'].astype(float),
+                        'クレジットカード: ' + df['store']
+                    ))
+
+            def report(inserted, skipped):
+                percent = csv_file.tell() / file_size * 100 if file_size else 100
+                print(f"   … {percent:5.1f}%  {total_rows:,}行を処理"
+                      f"（新規 {inserted:,}件 / 重複 {skipped:,}件）")
+
+            # データベースに挿入
+            # かたまりごとに1回の INSERT OR IGNORE で書き込んで確定し、同じ日付・金額・説明文の支出が
+            # 既にある行は指紋（fingerprint）の UNIQUE インデックスでスキップする。
+            # 途中で失敗しても確定済みのかたまりは残るが、重複判定があるので
+            # 同じファイルをもう一度取り込めば残りの分だけが追加される（エラー内容は下のexceptでprintされる）。
+            # 最後に必ず接続を閉じる。閉じ忘れるとDBのロックが残り、GUIアプリ側の操作が
+            # 「database is locked」で失敗する原因になる
+            try:
+                inserted_count, duplicate_count = import_expenses_in_chunks(
+                    chunks(), db_path=db_path, progress=report
+                )
+            finally:
+                close_db_connection(db_path)  # 成功・失敗にかかわらず必ず接続を閉じる
+
+        print(f"📄 CSVファイル読み込み: {total_rows}件")
+        print(f"✅ インポート完了!")
+        print(f"   新規登録: {inserted_count}件")
+        print(f"   重複スキップ: {duplicate_count}件")
+
+        # カテゴリ別集計を表示
+        if inserted_count > 0:
+            print(f"\n📊 カテゴリ別登録件数:")
+            for cat, count in category_counts.most_common():
+                print(f"   {cat}: {count}件")
+
+        return True
+
+    except Exception as e:
+        print(f"❌ エラー発生: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+# --- 一括取込（--batch） -------------------------------------------------------
+
+def expand_statement_paths(target):
+    """ディレクトリ（直下の *.csv）またはglobパターンを、取り込むCSVファイルのリストにする"""
+    if os.path.isdir(target):
+        paths = glob.glob(os.path.join(target, '*.csv'))
+    else:
+        paths = glob.glob(target)
+    return sorted(path for path in paths if os.path.isfile(path))
+
+
+def parse_statement(csv_path):
+    """（ワーカープロセスで実行）CSVのフォーマットを推定して、取り込む行にする
+
+    カテゴリはプリセットのマッピングで決め、「その他」になった明細だけ CATEGORY_RULES で振り分ける。
+    戻り値は dict（file, file_hash, format, rows, total_rows, skipped_rows, failed, error, parse_seconds）。
+    失敗しても例外は投げず、error に内容を入れて返す。
+    """
+    started = time.perf_counter()
+    result = {'file': csv_path, 'file_hash': None, 'format': None, 'rows': [], 'total_rows': 0,
+              'skipped_rows': 0, 'failed': 0, 'error': None}
+    # 標準出力はJSONの結果専用なので、途中のメッセージは標準エラーに出す
+    with contextlib.redirect_stdout(sys.stderr):
+        try:
+            result['file_hash'] = file_digest(csv_path)
+            format_name = detect_format(csv_path)
+            if format_name is None:
+                raise ValueError('どのフォーマットにも合いません（見出しの列名・文字コードを確認してください）')
+            fmt = FORMAT_PRESETS[format_name]
+            df = pd.read_csv(csv_path, encoding=read_encoding(fmt), skiprows=fmt['skip_rows'])
+            data = transform_rows(df, fmt, header_mapping(fmt))
+            for item in data:
+                if item['category'] == 'その他':
+                    item['category'] = classify_category(item['description'])
+            rows, failed = expense_rows(data, fmt['description_prefix'])
+            result.update(format=format_name, rows=rows, total_rows=len(df),
+                          skipped_rows=len(df) - len(data), failed=failed)
+        except Exception as e:
+            result['error'] = str(e)
+    result['parse_seconds'] = round(time.perf_counter() - started, 3)
+    return result
+
+
+def write_statement(result, db_path):
+    """1ファイル分の行と取込履歴（ファイルの中身のハッシュ付き）を1つのトランザクションで書き込み、
+    (追加した件数, 重複件数) を返す（呼び出し側のトランザクションの中で呼べば、その一部になる）
+    """
+    with transaction(db_path) as conn:
+        inserted, skipped = import_expenses(result['rows'], db_path=db_path)
+        conn.execute('''
+            INSERT INTO credit_card_imports (import_date, file_name, format_name, record_count, file_hash)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (date.today().isoformat(), os.path.basename(result['file']), result['format'], inserted,
+              result['file_hash']))
+    return inserted, skipped
+
+
+def _file_stats(result):
+    """parse_statement の結果から、出力するJSONの1行分（書き込みの件数は0のまま）を作る"""
+    stats = {
+        'type': 'file',
+        'file': result['file'],
+        'format': result['format'],
+        'status': 'ok',
+        'rows': result['total_rows'],
+        'imported': 0,
+        'duplicates': 0,
+        'skipped_rows': result['skipped_rows'],
+        'failed': result['failed'],
+        'parse_seconds': result['parse_seconds'],
+        'write_seconds': 0.0,
+    }
+    if result['error'] is not None:
+        stats['status'] = 'error'
+        stats['error'] = result['error']
+    return stats
+
+
+def import_statements(target, db_path='budget.db', workers=None):
+    """ディレクトリ・globパターンのCSVをまとめて取り込み、ファイルごとの結果をJSONで出力する
+
+    解析はワーカープロセスで並列に行い、書き込みはファイル名の順にこのプロセスだけで行う
+    （SQLiteへの書き込みを1か所にまとめ、ロックの取り合いをなくす）。
+    1ファイルが失敗しても他のファイルは続けて取り込む。全ファイル成功なら True を返す。
+    """
+    paths = expand_statement_paths(target)
+    if not paths:
+        print(f"❌ エラー: CSVファイルが見つかりません: {target}", file=sys.stderr)
+        return False
+
+    workers = max(1, min(workers or os.cpu_count() or 1, len(paths)))
+    totals = Counter()
+    try:
+        ensure_import_file_hashes(db_path)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(parse_statement, path) for path in paths]
+            for future in futures:
+                result = future.result()
+                stats = _file_stats(result)
+                if result['error'] is None:
+                    started = time.perf_counter()
+                    try:
+                        stats['imported'], stats['duplicates'] = write_statement(result, db_path)
+                    except Exception as e:
+                        stats['status'] = 'error'
+                        stats['error'] = str(e)
+                    stats['write_seconds'] = round(time.perf_counter() - started, 3)
+
+                totals['files'] += 1
+                totals['errors'] += stats['status'] == 'error'
+                for key in ('rows', 'imported', 'duplicates', 'skipped_rows', 'failed'):
+                    totals[key] += stats[key]
+                print(json.dumps(stats, ensure_ascii=False), flush=True)
+    finally:
+        close_db_connection(db_path)  # 成功・失敗にかかわらず必ず接続を閉じる
+
+    summary = {'type': 'summary', 'workers': workers}
+    summary.update((key, totals[key]) for key in
+                   ('files', 'errors', 'rows', 'imported', 'duplicates', 'skipped_rows', 'failed'))
+    print(json.dumps(summary, ensure_ascii=False), flush=True)
+    return totals['errors'] == 0
+
+
+# --- 見張り取込（--watch） -----------------------------------------------------
+
+# ディレクトリを見に行く間隔（秒）。見に行くのは os.scandir 1回だけなので、待っている間のCPUはほぼ使わない
+WATCH_INTERVAL = 1.0
+# サイズ・更新日時がこの秒数変わらなかったら書き込みが終わったとみなす（コピー途中のファイルを読まない）
+WATCH_SETTLE_SECONDS = 2.0
+
+
+def _scan_statements(directory):
+    """ディレクトリ直下のCSVの {パス: (サイズ, 更新日時)} （隠しファイル・Excelの一時ファイルは除く）"""
+    found = {}
+    with os.scandir(directory) as it:
+        for entry in it:
+            if entry.name.startswith(('.', '~$')) or not entry.name.lower().endswith('.csv'):
+                continue
+            try:
+                if entry.is_file():
+                    stat = entry.stat()
+                    found[entry.path] = (stat.st_size, stat.st_mtime_ns)
+            except OSError:
+                continue  # 見ている間に消された
+    return found
+
+
+def _import_ready_statements(paths, db_path, imported_hashes):
+    """書き込みの終わったファイルを解析し、まとめて1つのトランザクションで書き込む
+
+    同じ中身のファイルを前に取り込んでいれば書き込まない。書き込みに失敗したときは全部を取り消して
+    False を返す（呼び出し側は次の見回りでもう一度試す）。
+    """
+    results = []
+    for path in paths:
+        try:
+            unchanged = file_digest(path) in imported_hashes
+        except OSError:
+            unchanged = False  # 読めないときのエラーは parse_statement に任せる
+        if unchanged:
+            # 同じ中身のファイルは取り込み済みなので、解析もしない
+            result = {'file': path, 'file_hash': None, 'format': None, 'total_rows': 0,
+                      'skipped_rows': 0, 'failed': 0, 'error': None, 'parse_seconds': 0.0}
+            stats = _file_stats(result)
+            stats['status'] = 'unchanged'
+        else:
+            result = parse_statement(path)
+            stats = _file_stats(result)
+        results.append((result, stats))
+
+    to_write = [(result, stats) for result, stats in results if stats['status'] == 'ok']
+    started = time.perf_counter()
+    try:
+        with transaction(db_path):
+            for result, stats in to_write:
+                stats['imported'], stats['duplicates'] = write_statement(result, db_path)
+    except Exception as e:
+        print(f"❌ 書き込みに失敗しました（次の見回りでもう一度試します）: {e}", file=sys.stderr)
+        return False
+    write_seconds = round(time.perf_counter() - started, 3)
+
+    for result, stats in results:
+        if stats['status'] == 'ok':
+            stats['write_seconds'] = write_seconds  # まとめて書き込んだので、全体にかかった時間
+            imported_hashes.add(result['file_hash'])
+        print(json.dumps(stats, ensure_ascii=False), flush=True)
+    return True
+
+
+def watch_statements(directory, db_path='budget.db', interval=WATCH_INTERVAL, settle=WATCH_SETTLE_SECONDS):
+    """ディレクトリを見張り、置かれた・書き換えられたCSVを取り込み続ける（Ctrl+C で終了）
+
+    ファイルのサイズ・更新日時が settle 秒変わらなくなってから取り込む。同じ見回りで
+    書き込みの終わったファイルはまとめて1つのトランザクションで書き込み、結果を1件1行のJSONで出力する。
+    起動時に既にあるファイルも、取り込んだことのない中身なら取り込む。
+    """
+    if not os.path.isdir(directory):
+        print(f"❌ エラー: ディレクトリが見つかりません: {directory}", file=sys.stderr)
+        return False
+
+    imported_hashes = get_imported_file_hashes(db_path)
+    close_db_connection(db_path)
+    handled = {}  # 取り込み済み（または取り込めないと分かった）ファイルの {パス: (サイズ, 更新日時)}
+    pending = {}  # 書き込み中かもしれないファイルの {パス: ((サイズ, 更新日時), 最後に変化を見た時刻)}
+    print(f"👀 {directory} を見張っています（Ctrl+C で終了）", file=sys.stderr)
+
+    try:
+        while True:
+            now = time.monotonic()
+            found = _scan_statements(directory)
+            ready = []
+            for path, signature in found.items():
+                if handled.get(path) == signature:
+                    continue
+                if path not in pending or pending[path][0] != signature:
+                    pending[path] = (signature, now)  # 新しく見つかった・まだ書き込まれている
+                elif now - pending[path][1] >= settle:
+                    ready.append(path)
+            # 消されたファイルは忘れる（同じ名前で置き直されたら取り込み直す）
+            for path in set(pending) - set(found):
+                del pending[path]
+            for path in set(handled) - set(found):
+                del handled[path]
+
+            if ready and _import_ready_statements(sorted(ready), db_path, imported_hashes):
+                for path in ready:
+                    handled[path] = pending.pop(path)[0]
+                # 同じ接続を開いたままだとGUIアプリ側の書き込みを妨げることがあるので、書き込みのたびに閉じる
+                close_db_connection(db_path)
+
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        print("見張りを終了しました", file=sys.stderr)
+    finally:
+        close_db_connection(db_path)  # 成功・失敗にかかわらず必ず接続を閉じる
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='カード明細CSVを家計簿アプリにインポートする',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=(
+            "例: python cli_import.py enavi202510.csv\n"
+            "例: python cli_import.py enavi202510.csv budget.db\n"
+            "例: python cli_import.py --batch statements/ budget.db\n"
+            "例: python cli_import.py --batch 'statements/*/enavi*.csv' --workers 4\n"
+            "例: python cli_import.py --watch statements/ budget.db"
+        )
+    )
+    parser.add_argument('csv_path',
+                        help='楽天カードCSVのパス（--batch ならディレクトリまたはglobパターン、--watch ならディレクトリ）')
+    parser.add_argument('db_path', nargs='?', default='budget.db', help='データベースのパス（既定: budget.db）')
+    parser.add_argument('--batch', action='store_true',
+                        help='複数のCSVをフォーマットを推定してまとめて取り込み、結果をJSONで出力する')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='--batch で解析に使うプロセス数（既定: CPUの数）')
+    parser.add_argument('--watch', action='store_true',
+                        help='ディレクトリを見張り、置かれた・書き換えられたCSVを取り込み続ける')
+    args = parser.parse_args()
+
+    if args.watch:
+        success = watch_statements(args.csv_path, args.db_path)
+    elif args.batch:
+        success = import_statements(args.csv_path, args.db_path, args.workers)
+    else:
+        success = import_rakuten_csv(args.csv_path, args.db_path)
+
+    sys.exit(0 if success else 1)
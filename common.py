@@ -19,8 +19,8 @@ from PyQt5.QtWidgets import (
     QFormLayout
 )
 from PyQt5.QtCore import Qt, QDate
-import sqlite3
-from db_utils import get_categories
+from db_utils import execute_query, get_categories, transaction
+from events import get_event_bus
 
 
 # グラフ用の共通カラーパレット
@@ -83,6 +83,22 @@ class DateHelper:
         start_date, end_date = DateHelper.get_month_range(year, month)
         return start_date.toString('yyyy-MM-dd'), end_date.toString('yyyy-MM-dd')
     
+    @staticmethod
+    def month_filter(year, month, column='date'):
+        """指定した月で絞り込むWHERE条件とパラメータを取得
+
+        strftime('%Y', date) = ? のように列を関数で包むとインデックス(idx_expenses_date)が
+        使えず全件走査になるため、「月初 <= date < 翌月初」の範囲条件にする。
+        終端を翌月初の未満にしているので、時刻つきの日付も取りこぼさない。
+
+        使い方:
+            where, params = DateHelper.month_filter(year, month)
+            execute_query(f'SELECT SUM(amount) FROM expenses WHERE {where}', params)
+        """
+        start, _ = DateHelper.get_month_range_str(year, month)
+        next_start, _ = DateHelper.get_month_range_str(*DateHelper.get_next_month(year, month))
+        return f'{column} >= ? AND {column} < ?', (start, next_start)
+    
     @staticmethod
     def get_months_between(start_year, start_month, end_year, end_month):
         """指定した範囲の年月リストを取得"""
@@ -117,7 +133,63 @@ class BaseWidget(QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.parent = parent
+        self._dirty = False  # データが変わって再計算が必要かどうか
         self.setup_navigation_buttons()
+    
+    # --- 変更通知と遅延再計算 -------------------------------------------------
+    
+    def watch_changes(self, *event_types):
+        """指定した変更イベント（events.py）を購読する
+
+        関係するイベントが届くと「要再計算」の印を付け、
+        表示中ならすぐ、非表示なら次に表示されたときに refresh() を呼ぶ。
+        """
+        bus = get_event_bus()
+        for event_type in event_types:
+            bus.subscribe(event_type, self.on_data_changed, owner=self)
+    
+    def publish_change(self, event):
+        """変更イベントを他の画面に配信する（自分自身には届かない）"""
+        get_event_bus().publish(event, sender=self)
+    
+    def on_data_changed(self, event):
+        if self.is_affected_by(event):
+            self.mark_dirty()
+    
+    def is_affected_by(self, event):
+        """このイベントで表示内容が変わるかどうか（画面ごとに上書きして絞り込む）"""
+        return True
+    
+    def mark_dirty(self):
+        self._dirty = True
+        if self.isVisible():
+            self.refresh_if_dirty()
+    
+    def refresh_if_dirty(self):
+        if self._dirty:
+            self._dirty = False
+            self.refresh()
+    
+    def refresh(self):
+        """画面の内容を作り直す（画面ごとに上書きする）"""
+        if hasattr(self, 'update_display'):
+            self.update_display()
+    
+    def showEvent(self, event):
+        super().showEvent(event)
+        # 非表示の間に届いた変更はここでまとめて反映する
+        self.refresh_if_dirty()
+    
+    def reload_category_combo(self, combo):
+        """カテゴリ選択のコンボボックスを最新のカテゴリ一覧に入れ替える（選択は維持）"""
+        current_category = combo.currentText()
+        combo.blockSignals(True)
+        combo.clear()
+        combo.addItems(get_categories())
+        index = combo.findText(current_category)
+        if index >= 0:
+            combo.setCurrentIndex(index)
+        combo.blockSignals(False)
         
     def setup_navigation_buttons(self):
         """ナビゲーションボタンを設定"""
@@ -244,11 +316,10 @@ class RecurringExpenseDialog(QDialog):
 
     def load_recurring_expenses(self):
         """定期支払いの一覧を読み込む"""
-        conn = sqlite3.connect('budget.db')
-        c = conn.cursor()
-        c.execute('SELECT id, category, amount, description, payment_day, is_active FROM recurring_expenses')
-        expenses = c.fetchall()
-        conn.close()
+        expenses = execute_query(
+            'SELECT id, category, amount, description, payment_day, is_active FROM recurring_expenses',
+            fetch_all=True
+        )
 
         self.expense_table.setRowCount(len(expenses))
         for row, expense in enumerate(expenses):
@@ -271,20 +342,12 @@ class RecurringExpenseDialog(QDialog):
             description = self.description_input.text()
             payment_day = self.payment_day_input.value()
             
-            conn = sqlite3.connect('budget.db')
-            try:
-                c = conn.cursor()
-                c.execute('''
-                    INSERT INTO recurring_expenses
-                    (category, amount, description, payment_day)
-                    VALUES (?, ?, ?, ?)
-                ''', (category, amount, description, payment_day))
-                conn.commit()
-            except Exception:
-                conn.rollback()  # 保存に失敗したら書きかけを取り消す
-                raise            # 下のexceptでユーザーに通知する
-            finally:
-                conn.close()     # 成功・失敗にかかわらず必ず接続を閉じる
+            # 保存に失敗したら書きかけを取り消し、下のexceptでユーザーに通知する
+            execute_query('''
+                INSERT INTO recurring_expenses
+                (category, amount, description, payment_day)
+                VALUES (?, ?, ?, ?)
+            ''', (category, amount, description, payment_day))
 
             self.load_recurring_expenses()
             self.amount_input.clear()
@@ -315,19 +378,14 @@ class RecurringExpenseDialog(QDialog):
             amount = float(self.expense_table.item(row, 1).text().replace(',', ''))
             payment_day = int(self.expense_table.item(row, 3).text())
             
-            conn = sqlite3.connect('budget.db')
             try:
-                c = conn.cursor()
-                c.execute('''
-                    DELETE FROM recurring_expenses
-                    WHERE category = ? AND amount = ? AND payment_day = ?
-                ''', (category, amount, payment_day))
-                conn.commit()
+                with transaction() as conn:  # 削除に失敗したら取り消す
+                    conn.execute('''
+                        DELETE FROM recurring_expenses
+                        WHERE category = ? AND amount = ? AND payment_day = ?
+                    ''', (category, amount, payment_day))
             except Exception as e:
-                conn.rollback()  # 削除に失敗したら取り消す
                 QMessageBox.critical(self, 'エラー', f'定期支払いの削除に失敗しました: {e}')
                 return
-            finally:
-                conn.close()     # 必ず接続を閉じる
 
             self.load_recurring_expenses()
@@ -26,11 +26,13 @@ from PyQt5.QtWidgets import (
 from PyQt5.QtCore import Qt, QDate
 from PyQt5.QtGui import QColor, QPen
 from PyQt5.QtChart import QChart, QChartView, QPieSeries, QLineSeries
-import sqlite3
 import pandas as pd
 from datetime import datetime
 import json
+from db_utils import get_db_connection
+from expense_store import get_expense_store
 from common import BaseWidget, CHART_PALETTE
+from events import ExpenseChanged, GoalChanged, IncomeChanged
 
 
 class ComprehensiveAnalysisWidget(BaseWidget):
@@ -40,6 +42,10 @@ class ComprehensiveAnalysisWidget(BaseWidget):
         super().__init__(parent)
         self.initUI()
         self.load_all_data()
+        self.watch_changes(ExpenseChanged, IncomeChanged, GoalChanged)
+    
+    def refresh(self):
+        self.load_all_data()
         
     def initUI(self):
         layout = QVBoxLayout()
@@ -119,15 +125,10 @@ class ComprehensiveAnalysisWidget(BaseWidget):
     
     def load_all_data(self):
         """データベースから全データを読み込む"""
-        conn = sqlite3.connect('budget.db')
+        conn = get_db_connection()
         
-        # 支出データ
-        self.expenses_df = pd.read_sql_query(
-            'SELECT * FROM expenses ORDER BY date',
-            conn
-        )
-        if not self.expenses_df.empty:
-            self.expenses_df['date'] = pd.to_datetime(self.expenses_df['date'])
+        # 支出データ（共有の支出ストアから。日付は変換済み）
+        self.expenses_df = get_expense_store().all()
         
         # 収入データ
         self.income_df = pd.read_sql_query(
@@ -152,8 +153,6 @@ class ComprehensiveAnalysisWidget(BaseWidget):
             conn
         )
         
-        conn.close()
-        
         # 初回分析
         self.update_analysis()
     
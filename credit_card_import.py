@@ -1,7 +1,8 @@
 # -*- coding: utf-8 -*-
 """クレジットカード明細取込ダイアログ
 
-楽天カード/楽天PAY/PayPay等のCSV取込。URL経由のGoogle Sheets取得にも対応。"""
+楽天カード/楽天PAY/PayPay等のCSV取込。URL経由のGoogle Sheets取得にも対応
+（取得はワーカースレッドで行い、前回から変わっていなければ残しておいた本文を使う。sheet_fetch.py）。"""
 from PyQt5.QtWidgets import (
     QWidget,
     QDialog,
@@ -25,16 +26,57 @@ from PyQt5.QtWidgets import (
     QListWidget,
     QListWidgetItem,
     QFileDialog,
-    QInputDialog
+    QInputDialog,
+    QProgressDialog,
+    QApplication
 )
-from PyQt5.QtCore import Qt, QDate
-import sqlite3
+from PyQt5.QtCore import Qt, QDate, QThread, pyqtSignal
 import pandas as pd
+import copy
+import os
 import json
 import csv
 import io
-import requests
-from db_utils import get_categories
+from db_utils import get_categories, transaction, import_expenses, import_expenses_in_chunks, normalize_text
+from sheet_fetch import fetch_sheet_csv, rows_since
+from card_formats import FORMAT_PRESETS, keyword_matchers, transform_rows, expense_rows
+
+
+# これより大きいCSVは分割読み込みで取り込む（プレビューは先頭の PREVIEW_ROWS 行だけ読む）
+STREAMING_THRESHOLD_BYTES = 20 * 1024 * 1024
+PREVIEW_ROWS = 1000
+# 分割読み込みで一度に読み込み・確定する行数
+IMPORT_CHUNK_SIZE = 50000
+
+
+class SheetFetchThread(QThread):
+    """Google Sheetsの公開CSVをGUIスレッドの外で取得する"""
+
+    fetched = pyqtSignal(str, bool)  # (CSVの本文, 前回から変わっていなかったか)
+    failed = pyqtSignal(str)
+
+    def __init__(self, url, parent=None):
+        super().__init__(parent)
+        self.url = url
+
+    def run(self):
+        try:
+            text, unchanged = fetch_sheet_csv(self.url)
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
+        self.fetched.emit(text, unchanged)
+
+
+# 取得中の SheetFetchThread（ダイアログを閉じても、通信が終わるまでここで持っておく）
+# スレッドには親を持たせないので、走っているままダイアログと一緒に破棄されることはない
+_running_fetches = set()
+
+
+def _forget_fetch(thread):
+    """終わったスレッドを手放す（finished の直後なので wait はすぐ返る）"""
+    thread.wait()
+    _running_fetches.discard(thread)
 
 
 class CreditCardImportDialog(QDialog):
@@ -44,63 +86,18 @@ class CreditCardImportDialog(QDialog):
         self.setMinimumWidth(600)
         self.setMinimumHeight(500)
         
-        # フォーマットプリセット
-        self.format_presets = {
-            '一般的なクレジットカード': {
-                'encoding': 'utf-8',
-                'date_format': '%Y/%m/%d',
-                'skip_rows': 0,
-                'negation_needed': True,
-                'date_column': '利用日',
-                'amount_column': '利用金額',
-                'description_column': '利用店名・商品名',
-                'description_prefix': 'クレジットカード: ',
-                'category_mapping': {
-                    'ﾏﾙｴﾂ': '食費',
-                    'ﾄｳｷﾖｳﾃﾞﾝﾘﾖｸ': '水道光熱費',
-                    'CLAUDE.AI SUBSCRIPTI': '娯楽',
-                    'ｽｲﾄﾞｳﾘ': '水道光熱費'
-                },
-                'exclude_keywords': [
-                    'ﾓﾊﾞｲﾙﾊﾟｽﾓ',
-                    '楽天証券投信積立０．５％～',
-                    '楽天キャッシュ　チャージ',
-                    'APPLE COM BILL',
-                    'ﾄｳｴﾝﾃｲ',
-                    'ｸﾗｽ',
-                    'ソフトバンク（Ｂ）',
-                    'ｾｲﾌﾞﾃﾂﾄﾞｳ'
-                ]
-            },
-            '楽天PAY': {
-                'encoding': 'utf-8',
-                'date_format': '%Y/%m/%d',
-                'skip_rows': 0,
-                'negation_needed': False,
-                'date_column': '日付',
-                'amount_column': '金額',
-                'description_column': '店舗名',
-                'description_prefix': '楽天PAY: ',
-                'category_mapping': {},
-                'exclude_keywords': []
-            },
-            'PayPay': {
-                'encoding': 'utf-8-sig',
-                'date_format': '%Y/%m/%d %H:%M:%S',
-                'skip_rows': 0,
-                'negation_needed': False,
-                'date_column': '取引日',
-                'amount_column': '出金金額（円）',
-                'description_column': '取引先',
-                'description_prefix': 'PayPay: ',
-                'category_mapping': {},
-                'exclude_keywords': []
-            }
-        }
+        # フォーマットプリセット（card_formats.py の定義を複製して使う）
+        self.format_presets = copy.deepcopy(FORMAT_PRESETS)
 
         # 現在のフォーマット設定（デフォルト値）
         self.current_format = dict(self.format_presets['一般的なクレジットカード'])
-        
+        # 正規化済みの除外キーワード・マッピングキーワード（(設定, 正規化した結果)。設定が変わったら作り直す）
+        self._keyword_cache = None
+        # 分割読み込みで取り込むCSVのパス（None ならファイル全体を csv_data に読み込んである）
+        self.stream_path = None
+        # 結果を待っているGoogle Sheetsの取得（ファイルを選んだ・閉じたときは None にして結果を捨てる）
+        self.fetch_thread = None
+
         self.initUI()
         
     def initUI(self):
@@ -364,7 +361,6 @@ class CreditCardImportDialog(QDialog):
 
     def toggle_custom_settings(self, index):
         """フォーマット選択に応じてカスタム設定の表示/非表示とプリセット切替え"""
-        import copy
         format_name = self.format_combo.currentText()
 
         if format_name == 'その他':
@@ -393,13 +389,73 @@ class CreditCardImportDialog(QDialog):
             return 'PayPay明細'
         return 'クレジットカード明細'
 
-    def load_from_url(self, url):
-        """Google Sheets公開URLからCSVデータを取得"""
-        response = requests.get(url, timeout=15)
-        response.raise_for_status()
-        response.encoding = 'utf-8'
-        self.csv_data = pd.read_csv(io.StringIO(response.text))
-        self.file_path_input.setText('Google Sheets URL')
+    def load_csv_text(self, text, since=None):
+        """取得したCSVの本文を読み込む（since 'YYYY-MM-DD' を渡すと、その日以降の行だけを読む）"""
+        text = rows_since(text, self.current_format['date_column'], self.current_format['date_format'], since)
+        self.csv_data = pd.read_csv(io.StringIO(text))
+        self.stream_path = None
+        self.file_path_input.setText(f'Google Sheets URL（{since}以降の明細）' if since else 'Google Sheets URL')
+
+    def start_url_load(self, url, since=None):
+        """Google Sheets公開URLからの取得をワーカースレッドで始める（取得できたらStep2に進む）
+
+        取得中もダイアログは操作でき、失敗したときはファイル選択のまま続けられる。
+        """
+        self.url_since = since
+        self.step_label.setText('Google Sheetsから明細を取得しています...')
+        thread = SheetFetchThread(url)
+        thread.fetched.connect(self._on_sheet_fetched)
+        thread.failed.connect(self._on_sheet_failed)
+        thread.finished.connect(lambda: _forget_fetch(thread))
+        _running_fetches.add(thread)
+        self.fetch_thread = thread
+        thread.start()
+
+    def discard_sheet_fetch(self):
+        """取得中のGoogle Sheetsの結果を使わないようにする
+
+        スレッドは止められない（通信は FETCH_TIMEOUT で終わる）ので、待たずに切り離し、
+        終わるまで走らせて結果だけ捨てる。取得を待っていたときは True を返す。
+        """
+        thread = self.fetch_thread
+        if thread is None:
+            return False
+        self.fetch_thread = None
+        thread.fetched.disconnect(self._on_sheet_fetched)
+        thread.failed.disconnect(self._on_sheet_failed)
+        return True
+
+    def done(self, result):
+        """閉じるときは取得中の結果を捨てる（スレッドは待たない）"""
+        self.discard_sheet_fetch()
+        super().done(result)
+
+    def _on_sheet_fetched(self, text, unchanged):
+        if self.sender() is not self.fetch_thread:
+            return  # 切り離す前に送られていた結果（ファイルを選んだ・閉じたあとに届いたもの）は使わない
+        try:
+            self.load_csv_text(text, self.url_since)
+        except Exception as e:
+            self._on_sheet_failed(str(e))
+            return
+        self.fetch_thread = None
+        if self.url_since and self.csv_data.empty:
+            QMessageBox.information(
+                self, '新しい明細なし',
+                f'{self.url_since}以降の明細はありませんでした'
+                f'{"（シートは前回の取得から変わっていません）" if unchanged else ""}。'
+            )
+        self.proceed_to_step2_from_url()
+
+    def _on_sheet_failed(self, message):
+        if self.sender() is not self.fetch_thread:
+            return
+        self.fetch_thread = None
+        self.step_label.setText('ステップ 1/3: CSVファイルの選択とフォーマット設定')
+        QMessageBox.warning(
+            self, '取得失敗',
+            f'URLからのデータ取得に失敗しました:\n{message}\n\nファイル選択に切り替えます。'
+        )
 
     def proceed_to_step2_from_url(self):
         """URL経由でCSVデータ読込済みの状態からStep2に進む"""
@@ -433,12 +489,14 @@ class CreditCardImportDialog(QDialog):
         )
         
         if file_path:
+            # ファイルを選んだら、あとから届くGoogle Sheetsの取得結果で上書きしない
+            if self.discard_sheet_fetch():
+                self.step_label.setText('ステップ 1/3: CSVファイルの選択とフォーマット設定')
             self.file_path_input.setText(file_path)
     
     def normalize_text(self, text):
         """全角/半角を統一する（全角→半角に変換）"""
-        import unicodedata
-        return unicodedata.normalize('NFKC', text).lower()
+        return normalize_text(text)
 
     def delete_category_mapping(self):
         """選択されたカテゴリマッピングを削除"""
@@ -543,12 +601,16 @@ class CreditCardImportDialog(QDialog):
         # CSVファイルの読み込み
         try:
             # PandasでCSVを読み込む
+            # 大きなファイルは先頭だけ読んでプレビューに使い、取り込み時に分割して読み直す
+            file_path = self.file_path_input.text()
+            self.stream_path = file_path if os.path.getsize(file_path) > STREAMING_THRESHOLD_BYTES else None
             self.csv_data = pd.read_csv(
-                self.file_path_input.text(),
+                file_path,
                 encoding=self.current_format['encoding'],
-                skiprows=self.current_format['skip_rows']
+                skiprows=self.current_format['skip_rows'],
+                nrows=PREVIEW_ROWS if self.stream_path else None
             )
-            
+
             # 列マッピングのドロップダウンを更新
             column_names = self.csv_data.columns.tolist()
             
@@ -620,84 +682,45 @@ class CreditCardImportDialog(QDialog):
         except Exception as e:
             QMessageBox.critical(self, 'エラー', f'データ処理に失敗しました:\n{str(e)}')
     
+    def _keyword_matchers(self):
+        """正規化したキーワードで作った (除外キーワードの照合器, カテゴリマッピングの照合器) を返す
+
+        フォーマットの設定（説明の接頭辞・除外キーワード・マッピング）が変わるまでは作り直さない。
+        """
+        fmt = self.current_format
+        prefix = fmt.get('description_prefix', 'クレジットカード: ')
+        key = (prefix, tuple(fmt['exclude_keywords']), tuple(fmt['category_mapping'].items()))
+        if self._keyword_cache is None or self._keyword_cache[0] != key:
+            self._keyword_cache = (key, keyword_matchers(fmt))
+        return self._keyword_cache[1]
+
     def generate_preview_data(self):
         """プレビューデータを生成"""
-        self.preview_data = []
-        
-        date_col = self.header_mapping['date']
-        amount_col = self.header_mapping['amount']
-        description_col = self.header_mapping['description']
-        
-        for _, row in self.csv_data.iterrows():
-            try:
-                # 日付処理
-                date_str = str(row[date_col])
-                date_obj = pd.to_datetime(date_str, format=self.current_format['date_format'])
-                formatted_date = date_obj.strftime('%Y-%m-%d')
-                
-                # 金額処理
-                amount_str = str(row[amount_col]).replace(',', '').replace('円', '').strip()
-                if amount_str == '' or amount_str == 'nan' or amount_str == '-':
-                    continue
-                amount = float(amount_str)
-                if self.current_format['negation_needed']:
-                    amount = -amount
-
-                # 金額の絶対値を使用（支出として記録するため）
-                amount = abs(amount)
-                if amount == 0:
-                    continue
-                
-                # 説明処理
-                description = str(row[description_col])
-                
-                # 説明文を正規化して比較用に準備
-                normalized_description = self.normalize_text(description)
-
-                # 除外キーワードチェック
-                excluded = False
-                credit_prefix = self.normalize_text(self.current_format.get('description_prefix', 'クレジットカード: '))
-                for exclude_keyword in self.current_format['exclude_keywords']:
-                    normalized_exclude = self.normalize_text(exclude_keyword)
-                    if normalized_exclude.startswith(credit_prefix):
-                        normalized_exclude = normalized_exclude[len(credit_prefix):]
-                    if normalized_exclude and normalized_exclude in normalized_description:
-                        excluded = True
-                        break
-                if excluded:
-                    continue
-
-                # カテゴリ推定
-                category = 'その他'  # デフォルト
-                for keyword, mapped_category in self.current_format['category_mapping'].items():
-                    normalized_keyword = self.normalize_text(keyword)
-                    if normalized_keyword in normalized_description:
-                        category = mapped_category
-                        break
-                
-                self.preview_data.append({
-                    'date': formatted_date,
-                    'amount': amount,
-                    'description': description,
-                    'category': category
-                })
-                
-            except Exception as e:
-                print(f"行の処理中にエラー: {e}")
-                continue
-    
+        self.preview_data = self.transform_rows(self.csv_data)
+
+    def transform_rows(self, csv_data):
+        """CSVの行（DataFrame）を取り込む明細にする（card_formats.transform_rows）
+
+        分割読み込みでは、読み込んだかたまりごとに呼ばれる。
+        """
+        return transform_rows(csv_data, self.current_format, self.header_mapping, self._keyword_matchers())
+
+    def filter_date_range(self, data):
+        """期間指定がオンなら、期間内の明細だけにする"""
+        if not self.date_range_check.isChecked():
+            return data
+        start_date = self.start_date_edit.date().toString('yyyy-MM-dd')
+        end_date = self.end_date_edit.date().toString('yyyy-MM-dd')
+        return [item for item in data if start_date <= item['date'] <= end_date]
+
     def execute_import(self):
         """取り込みを実行"""
+        if self.stream_path:
+            self.execute_streaming_import()
+            return
+
         # 期間制限の処理
-        filtered_data = self.preview_data
-        if self.date_range_check.isChecked():
-            start_date = self.start_date_edit.date().toString('yyyy-MM-dd')
-            end_date = self.end_date_edit.date().toString('yyyy-MM-dd')
-            
-            filtered_data = [
-                data for data in self.preview_data
-                if start_date <= data['date'] <= end_date
-            ]
+        filtered_data = self.filter_date_range(self.preview_data)
         
         total_records = len(filtered_data)
         if total_records == 0:
@@ -729,54 +752,96 @@ class CreditCardImportDialog(QDialog):
         except Exception as e:
             QMessageBox.critical(self, 'エラー', f'取り込み処理に失敗しました:\n{str(e)}')
     
-    def import_to_database(self, data):
-        """データベースへの取り込み処理"""
-        conn = sqlite3.connect('budget.db')
-        c = conn.cursor()
-        
-        imported_count = 0
-        duplicate_count = 0
-        failed_count = 0  # 取込に失敗した行数（黙って欠落させないためカウントする）
+    def execute_streaming_import(self):
+        """大きなCSVをかたまりごとに読み込み・変換・重複除外・確定しながら取り込む
+
+        ファイル全体をメモリに読み込まないので、数GBの明細でも使うメモリはかたまりの分だけで済む。
+        """
+        size_mb = os.path.getsize(self.stream_path) / (1024 * 1024)
+        reply = QMessageBox.question(
+            self, '確認',
+            f'{self._get_format_label()}のファイル全体（{size_mb:,.0f}MB）を'
+            f'{IMPORT_CHUNK_SIZE:,}行ずつ取り込みます。よろしいですか？',
+            QMessageBox.Yes | QMessageBox.No, QMessageBox.No
+        )
+        if reply != QMessageBox.Yes:
+            return
+
+        file_size = os.path.getsize(self.stream_path)
+        progress = QProgressDialog('明細を取り込んでいます...', 'キャンセル', 0, max(1, file_size // 1024), self)
+        progress.setWindowTitle('取り込み中')
+        progress.setWindowModality(Qt.WindowModal)
+        progress.setMinimumDuration(0)
+        failed_count = 0
 
-        # try/finally で囲み、途中で何が起きても接続を必ず閉じる
-        # （閉じ忘れはDBロックの原因になり、後続の操作が失敗しやすくなる）
         try:
-            for item in data:
-                date = item['date']
-                category = item['category']
-                amount = abs(item['amount'])  # 支出なので絶対値を使用
-                prefix = self.current_format.get('description_prefix', 'クレジットカード: ')
-                description = f"{prefix}{item['description']}"
-
-                # 重複チェック
-                if self.duplicate_check.isChecked():
-                    c.execute('''
-                        SELECT id FROM expenses
-                        WHERE date = ? AND category = ? AND amount = ? AND description = ?
-                    ''', (date, category, amount, description))
-
-                    if c.fetchone():
-                        duplicate_count += 1
-                        continue
+            with open(self.stream_path, 'rb') as csv_file:
+                reader = pd.read_csv(
+                    csv_file,
+                    encoding=self.current_format['encoding'],
+                    skiprows=self.current_format['skip_rows'],
+                    chunksize=IMPORT_CHUNK_SIZE
+                )
+
+                def chunks():
+                    nonlocal failed_count
+                    for chunk in reader:
+                        rows, chunk_failed = self.expense_rows(self.filter_date_range(self.transform_rows(chunk)))
+                        failed_count += chunk_failed
+                        yield rows
+
+                def report(inserted, skipped):
+                    progress.setValue(min(progress.maximum(), csv_file.tell() // 1024))
+                    progress.setLabelText(f'取り込み済み: {inserted:,}件（重複スキップ: {skipped:,}件）')
+                    QApplication.processEvents()
+                    return not progress.wasCanceled()
+
+                imported_count, duplicate_count = import_expenses_in_chunks(
+                    chunks(), skip_duplicates=self.duplicate_check.isChecked(), progress=report
+                )
+            cancelled = progress.wasCanceled()
+        except Exception as e:
+            progress.close()
+            QMessageBox.critical(
+                self, 'エラー',
+                f'取り込み処理に失敗しました:\n{str(e)}\n\n'
+                'それまでに取り込んだ分は登録済みです。同じファイルをもう一度取り込むと続きから登録されます。'
+            )
+            return
+        progress.close()
+
+        self.show_import_warnings(duplicate_count, failed_count)
+        if cancelled:
+            QMessageBox.information(
+                self, '取り込み中断',
+                f'{imported_count}件を取り込んだところで中断しました。\n'
+                '同じファイルをもう一度取り込むと続きから登録されます。'
+            )
+            return
+        QMessageBox.information(
+            self, '取り込み完了',
+            f'{imported_count}件の{self._get_format_label()}を取り込みました。'
+        )
+        self.accept()
 
-                # データベースに追加
-                try:
-                    c.execute('''
-                        INSERT INTO expenses (date, category, amount, description)
-                        VALUES (?, ?, ?, ?)
-                    ''', (date, category, amount, description))
+    def expense_rows(self, data):
+        """明細を import_expenses に渡す行にする（戻り値は (行のリスト, 取り込めなかった件数)）"""
+        return expense_rows(data, self.current_format.get('description_prefix', 'クレジットカード: '))
 
-                    imported_count += 1
+    def import_to_database(self, data):
+        """データベースへの取り込み処理"""
+        rows, failed_count = self.expense_rows(data)
 
-                except Exception as e:
-                    print(f"行の挿入中にエラー: {e}")
-                    failed_count += 1  # 失敗を記録して次の行へ
-                    continue
+        # 全行を1回の INSERT OR IGNORE でまとめて書き込む（重複は指紋の UNIQUE インデックスで除く）
+        imported_count, duplicate_count = import_expenses(
+            rows, skip_duplicates=self.duplicate_check.isChecked()
+        )
 
-            conn.commit()
-        finally:
-            conn.close()
+        self.show_import_warnings(duplicate_count, failed_count)
+        return imported_count
 
+    def show_import_warnings(self, duplicate_count, failed_count):
+        """重複でスキップした件数・取り込めなかった件数を知らせる"""
         if duplicate_count > 0:
             QMessageBox.information(
                 self, '重複スキップ',
@@ -792,30 +857,21 @@ class CreditCardImportDialog(QDialog):
                 '取込結果と元の明細を照合して確認してください。'
             )
 
-        return imported_count
-    
     # インポート履歴の保存
     def save_import_history(self, file_name, format_name, record_count):
-        conn = sqlite3.connect('budget.db')
         try:
-            c = conn.cursor()
-
             import_date = QDate.currentDate().toString('yyyy-MM-dd')
 
-            c.execute('''
-                INSERT INTO credit_card_imports
-                (import_date, file_name, format_name, record_count)
-                VALUES (?, ?, ?, ?)
-            ''', (import_date, file_name, format_name, record_count))
-
-            conn.commit()
+            with transaction() as conn:
+                conn.execute('''
+                    INSERT INTO credit_card_imports
+                    (import_date, file_name, format_name, record_count)
+                    VALUES (?, ?, ?, ?)
+                ''', (import_date, file_name, format_name, record_count))
         except Exception as e:
-            conn.rollback()
             # 履歴の保存は補助機能なので、失敗しても取込自体は成功している。
             # ダイアログは出さずログだけ残す
             print(f"インポート履歴の保存に失敗: {e}")
-        finally:
-            conn.close()  # 必ず接続を閉じる
 
     def clear_all_category_mappings(self):
         """カテゴリマッピングをすべて削除する"""
@@ -1,26 +1,163 @@
 # -*- coding: utf-8 -*-
 """データベース操作の共通関数
 
-全画面から使われるDB接続・クエリ実行のヘルパー。"""
+全画面から使われるDB接続・クエリ実行のヘルパー。
+
+接続はスレッドごとに1本だけ開いて使い回す（接続プール）。
+以前は execute_query などを呼ぶたびに sqlite3.connect / close していたが、
+画面の再描画1回で10〜20回も接続し直すことになり、
+DBが大きくなるとその開閉コストが表示の遅さの大半を占めていた。"""
+import hashlib
 import sqlite3
+import threading
+import unicodedata
+from contextlib import contextmanager
 import pandas as pd
 
 
+# 既定のデータベースファイル
+DB_PATH = 'budget.db'
+
+# 接続を開いたときに必ず適用するPRAGMA設定（上から順に実行）
+# journal_mode=WAL  : 読み取り中でも書き込みがブロックされない（GUIとcli_import.pyの同時実行で
+#                     「database is locked」になるのを防ぐ）
+# synchronous=NORMAL: WALと組み合わせれば電源断でもDBは壊れず、1行ごとのfsyncを省ける
+# cache_size        : 負の値はKiB単位（-16000 ≒ 16MB）
+# mmap_size         : バイト単位。0にするとメモリマップを使わない
+# temp_store=MEMORY : ORDER BY/GROUP BY用の一時領域をメモリに置く
+# 設定を変えたいときは、最初の接続を開く前にこの辞書を書き換える
+PRAGMA_PROFILE = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -16000,
+    'mmap_size': 64 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+# スレッドごとの接続置き場
+# sqlite3の接続は作ったスレッドでしか使えないため、threading.localで分ける。
+# connections: {DBパス: 接続}, depths: {DBパス: transaction()の入れ子の深さ}
+# search_index: 全文検索インデックスがあると分かったDBパス（接続を閉じるまで確認し直さない）
+_local = threading.local()
+
+
+def _thread_state():
+    """このスレッドの接続置き場を取得（無ければ作る）"""
+    if not hasattr(_local, 'connections'):
+        _local.connections = {}
+        _local.depths = {}
+        _local.search_index = set()
+    return _local
+
+
+def normalize_text(text):
+    """検索用に文字列をそろえる（NFKCで全角英数→半角・半角カナ→全角にし、英字は小文字にする）
+
+    SQLからも normalize_text(列) として呼べるよう、接続を開くときに登録している
+    （全文検索インデックス expenses_fts に入れるとき・索引が無いときの LIKE 検索で使う）。
+    """
+    if text is None:
+        return None
+    return unicodedata.normalize('NFKC', str(text)).lower()
+
+
+def expense_fingerprint(date, amount, description):
+    """支出の重複判定用の指紋（日付・金額・説明文をそろえてからハッシュにした文字列）
+
+    取込元は説明文の先頭（「クレジットカード: 」など）に入っているので、説明文ごとハッシュにする。
+    カテゴリは振り分けのルールを変えると変わるので含めない。
+    SQLからも expense_fingerprint(date, amount, description) として呼べる。
+    """
+    try:
+        amount = f'{float(amount):.2f}'
+    except (TypeError, ValueError):
+        amount = str(amount)
+    description = ' '.join((normalize_text(description) or '').split())
+    key = f'{str(date).strip()[:10]}\x1f{amount}\x1f{description}'
+    return hashlib.blake2b(key.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def apply_pragmas(conn, profile=None):
+    """接続にPRAGMA設定を適用する（profile省略時は PRAGMA_PROFILE）"""
+    profile = PRAGMA_PROFILE if profile is None else profile
+    for name, value in profile.items():
+        conn.execute(f'PRAGMA {name}={value}')
+
+
 # データベースユーティリティ関数
-def get_db_connection():
-    """データベース接続を取得"""
-    return sqlite3.connect('budget.db')
+def get_db_connection(db_path=None):
+    """このスレッド用の使い回し接続を取得
+
+    返した接続は共有物なので、呼び出し側で close してはいけない。
+    アプリ終了時などに明示的に閉じたいときは close_db_connection() を使う。
+    """
+    db_path = db_path or DB_PATH
+    state = _thread_state()
+    conn = state.connections.get(db_path)
+    if conn is None:
+        conn = sqlite3.connect(db_path)
+        apply_pragmas(conn)
+        conn.create_function('normalize_text', 1, normalize_text, deterministic=True)
+        conn.create_function('expense_fingerprint', 3, expense_fingerprint, deterministic=True)
+        state.connections[db_path] = conn
+        state.depths[db_path] = 0
+    return conn
+
+
+def close_db_connection(db_path=None):
+    """このスレッドの使い回し接続を閉じる（次に使うときは開き直される）"""
+    db_path = db_path or DB_PATH
+    state = _thread_state()
+    conn = state.connections.pop(db_path, None)
+    state.depths.pop(db_path, None)
+    state.search_index.discard(db_path)
+    if conn is not None:
+        conn.close()
+
+
+def _in_transaction(db_path):
+    """transaction() の範囲内で呼ばれているかどうか"""
+    return _thread_state().depths.get(db_path or DB_PATH, 0) > 0
+
+
+@contextmanager
+def transaction(db_path=None):
+    """明示的なトランザクション範囲を作るコンテキストマネージャー
+
+    with transaction() as conn:
+        conn.execute(...)
+        conn.execute(...)
+
+    ブロックを抜けるとまとめて commit、途中で例外が起きたら rollback する。
+    入れ子にした場合は一番外側のブロックだけが commit/rollback を行うので、
+    内側で execute_query などを呼んでも途中で確定されることはない。
+    """
+    db_path = db_path or DB_PATH
+    conn = get_db_connection(db_path)
+    state = _thread_state()
+    state.depths[db_path] += 1
+    try:
+        yield conn
+    except BaseException:
+        state.depths[db_path] -= 1
+        if state.depths[db_path] == 0:
+            conn.rollback()  # 途中まで実行した変更をなかったことにする
+        raise
+    else:
+        state.depths[db_path] -= 1
+        if state.depths[db_path] == 0:
+            conn.commit()
 
 
 def execute_query(query, params=(), fetch_one=False, fetch_all=False):
     """SQLクエリを実行し、必要に応じて結果を取得
 
-    try/finally で囲むことで、SQL実行中にエラーが起きても
-    必ず rollback（書きかけの変更を取り消し）と close（接続を閉じる）が
-    行われる。閉じ忘れた接続はDBのロックを握り続け、
-    後続の操作が「database is locked」で失敗する原因になる。
+    エラー時は rollback（書きかけの変更を取り消し）してから例外を伝える。
+    transaction() の中で呼ばれた場合は commit/rollback をそのブロックに任せる。
+    接続は使い回しなので close はしない。
     """
     conn = get_db_connection()
+    nested = _in_transaction(None)
     try:
         c = conn.cursor()
         c.execute(query, params)
@@ -31,13 +168,23 @@ def execute_query(query, params=(), fetch_one=False, fetch_all=False):
         elif fetch_all:
             result = c.fetchall()
 
-        conn.commit()
+        if not nested:
+            conn.commit()
         return result
     except Exception:
-        conn.rollback()  # 途中まで実行した変更をなかったことにする
-        raise            # エラー自体は呼び出し側にそのまま伝える（既存のexcept処理を活かすため）
-    finally:
-        conn.close()     # 成功・失敗にかかわらず必ず接続を閉じる
+        if not nested:
+            conn.rollback()  # 途中まで実行した変更をなかったことにする
+        raise                # エラー自体は呼び出し側にそのまま伝える（既存のexcept処理を活かすため）
+
+
+def get_change_token(db_path=None):
+    """DBが変更されたかを判定するための値を取得（前回取得した値と違えば変更あり）
+
+    total_changes はこの接続で書き込んだ行数の累計、
+    data_version は他の接続（cli_import.py など）がコミットすると変わる値。
+    """
+    conn = get_db_connection(db_path)
+    return conn.total_changes, conn.execute('PRAGMA data_version').fetchone()[0]
 
 
 def get_categories():
@@ -48,24 +195,478 @@ def get_categories():
     return ['食費', '交通費', '娯楽', 'その他', '住宅', '水道光熱費', '美容', '通信費', '日用品', '健康', '教育']
 
 
+def get_last_import_date(description_prefix):
+    """説明が description_prefix で始まる支出（その取込元から取り込んだ明細）の最新の日付（無ければ None）
+
+    全文検索インデックス expenses_fts があれば、接頭辞を含む支出だけをインデックスから探す
+    （説明文を全件読むと数百万件で数秒かかる）。
+    """
+    term = normalize_text(description_prefix).strip()
+    if search_index_available() and len(term) >= 3:  # trigram なので3文字以上の語しかインデックスで探せない
+        candidates = 'id IN (SELECT rowid FROM expenses_fts WHERE expenses_fts MATCH ?) AND '
+        params = ('"' + term.replace('"', '""') + '"',)
+    else:
+        candidates, params = '', ()
+    result = execute_query(
+        f'SELECT MAX(date) FROM expenses WHERE {candidates}substr(description, 1, length(?)) = ?',
+        params + (description_prefix, description_prefix), fetch_one=True
+    )
+    return result[0][:10] if result and result[0] else None
+
+
 def execute_many(query, param_list):
-    """複数のクエリを一括実行（エラー時はrollback、接続は必ず閉じる）"""
-    conn = get_db_connection()
-    try:
-        c = conn.cursor()
-        c.executemany(query, param_list)
-        conn.commit()
-    except Exception:
-        conn.rollback()  # 一括実行の途中で失敗したら全部取り消す（半端な取込を防ぐ）
-        raise
-    finally:
-        conn.close()
+    """複数のクエリを一括実行（エラー時は全部取り消す）"""
+    # 一括実行の途中で失敗したら全部取り消す（半端な取込を防ぐ）
+    with transaction() as conn:
+        conn.executemany(query, param_list)
 
 
 def fetch_df(query, params=()):
-    """SQLクエリを実行し、結果をPandasのDataFrameとして取得（接続は必ず閉じる）"""
-    conn = get_db_connection()
-    try:
-        return pd.read_sql_query(query, conn, params=params)
-    finally:
-        conn.close()  # 読み取り専用なのでrollback不要だが、closeは必ず行う
+    """SQLクエリを実行し、結果をPandasのDataFrameとして取得"""
+    return pd.read_sql_query(query, get_db_connection(), params=params)
+
+
+# 一括変更で1文の WHERE id IN (...) に入れるIDの最大数
+BULK_CHUNK_SIZE = 500
+
+
+def _refresh_fingerprints(conn, ids):
+    """ids の支出の指紋（fingerprint）を今の日付・金額・説明文から付け直す
+
+    日付や金額を書き換えた支出の指紋が古いままだと、元の明細をもう一度取り込んだときに
+    実在しない支出と重複していると判定されてしまう。
+    先に対象の指紋を全部消してから付け直すので、対象どうしで指紋が入れ替わっても付けられる。
+    同じ指紋の支出が他にあるとき（同じ日に同じ金額・説明文の支出を2件入力したときなど）は
+    UNIQUE インデックスに当たるので、その支出は NULL のまま（重複判定には使われない）にする。
+    """
+    ids = list(ids)
+    chunks = [ids[start:start + BULK_CHUNK_SIZE] for start in range(0, len(ids), BULK_CHUNK_SIZE)]
+    for chunk in chunks:
+        conn.execute(f"UPDATE expenses SET fingerprint = NULL WHERE id IN ({','.join('?' * len(chunk))})", chunk)
+    for chunk in chunks:
+        conn.execute(f'''
+            UPDATE OR IGNORE expenses SET fingerprint = expense_fingerprint(date, amount, description)
+            WHERE id IN ({','.join('?' * len(chunk))})
+        ''', chunk)
+
+
+def _mutate_expenses(action, action_params=(), ids=None, where=None, params=(), refresh_fingerprints=False):
+    """支出の一括変更の共通処理（1回のトランザクションで実行し、変更した件数を返す）
+
+    action は 'DELETE FROM expenses AS e' や 'UPDATE expenses AS e SET ...' のような文の前半。
+    対象は ids（支出IDのリスト）か where（e. を付けた列名で書いた条件）で指定する。
+    where/params には expense_query.ExpenseQuery.where() の結果もそのまま渡せる。
+    両方指定したときは両方に当てはまるものだけが対象になる。
+    日付・金額・説明文を変える action では refresh_fingerprints=True にして指紋を付け直す。
+    カテゴリを変えた支出は同じトランザクションで全文検索インデックスにも入れ直す。
+    """
+    if ids is None and where is None:
+        raise ValueError('ids か where のどちらかを指定してください')
+
+    condition = where or '1'
+    returning = ' RETURNING id' if refresh_fingerprints else ''
+    with transaction() as conn:
+        if refresh_fingerprints:
+            ensure_expense_fingerprints()
+        if ids is None:
+            batches = [(f'{action} WHERE {condition}{returning}', (*action_params, *params))]
+        else:
+            # 1件ずつ実行するより WHERE id IN (...) でまとめたほうが速い。
+            # SQLのパラメータ数の上限を超えないよう BULK_CHUNK_SIZE 件ずつに分ける
+            ids = list(ids)
+            batches = []
+            for start in range(0, len(ids), BULK_CHUNK_SIZE):
+                chunk = ids[start:start + BULK_CHUNK_SIZE]
+                placeholders = ','.join('?' * len(chunk))
+                batches.append((f'{action} WHERE e.id IN ({placeholders}) AND ({condition}){returning}',
+                                (*action_params, *chunk, *params)))
+
+        if not refresh_fingerprints:
+            changed = sum(conn.execute(sql, batch_params).rowcount for sql, batch_params in batches)
+        else:
+            ids = [row[0] for sql, batch_params in batches for row in conn.execute(sql, batch_params).fetchall()]
+            _refresh_fingerprints(conn, ids)
+            changed = len(ids)
+        sync_search_index()
+    return changed
+
+
+def delete_expenses(ids=None, where=None, params=()):
+    """支出をまとめて削除し、削除した件数を返す
+
+    delete_expenses(ids=[1, 2, 3])
+    delete_expenses(where='e.date >= ? AND e.date < ?', params=('2025-04-01', '2025-05-01'))
+    """
+    return _mutate_expenses('DELETE FROM expenses AS e', ids=ids, where=where, params=params)
+
+
+def recategorize_expenses(category, ids=None, where=None, params=()):
+    """支出のカテゴリをまとめて変更し、変更した件数を返す"""
+    return _mutate_expenses(
+        'UPDATE expenses AS e SET category = ?', (category,), ids=ids, where=where, params=params
+    )
+
+
+def shift_expense_dates(days, ids=None, where=None, params=()):
+    """支出の日付をまとめて days 日ずらし（負の値なら前へ）、変更した件数を返す"""
+    return _mutate_expenses(
+        'UPDATE expenses AS e SET date = date(e.date, ?)', (f'{int(days):+d} days',),
+        ids=ids, where=where, params=params, refresh_fingerprints=True
+    )
+
+
+def insert_expense(date, category, amount, description, db_path=None):
+    """支出を1件追加し、追加した支出のIDを返す（手入力・定期支払いなど、明細の取込以外の追加用）
+
+    取込と同じ指紋を付けるので、あとで同じ内容の明細を取り込んでも二重には登録されない。
+    同じ内容の支出が既にあっても追加はする（指紋は付けない）。
+    """
+    ensure_expense_fingerprints(db_path)
+    with transaction(db_path) as conn:
+        expense_id = conn.execute(
+            'INSERT INTO expenses (date, category, amount, description) VALUES (?, ?, ?, ?)',
+            (date, category, amount, description)
+        ).lastrowid
+        _refresh_fingerprints(conn, [expense_id])
+        sync_search_index(db_path)
+    return expense_id
+
+
+def update_expense(expense_id, date, category, amount, description, db_path=None):
+    """支出を1件書き換える（指紋も書き換えた内容から付け直す）"""
+    ensure_expense_fingerprints(db_path)
+    with transaction(db_path) as conn:
+        conn.execute(
+            'UPDATE expenses SET date = ?, category = ?, amount = ?, description = ? WHERE id = ?',
+            (date, category, amount, description, expense_id)
+        )
+        _refresh_fingerprints(conn, [expense_id])
+        sync_search_index(db_path)
+
+
+def ensure_expense_fingerprints(db_path=None):
+    """expenses に重複判定用の fingerprint 列と UNIQUE インデックスが無ければ作る
+
+    列を追加したときは既存の支出にも指紋を付ける（同じ内容の支出が既にいくつもあるときは
+    最初の1件にだけ付け、残りは NULL のままにする）。
+    """
+    conn = get_db_connection(db_path)
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(expenses)')]
+    if 'fingerprint' in columns:
+        return
+    with transaction(db_path) as conn:
+        conn.execute('ALTER TABLE expenses ADD COLUMN fingerprint TEXT')
+        conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_expenses_fingerprint ON expenses(fingerprint)')
+        conn.execute('UPDATE OR IGNORE expenses SET fingerprint = expense_fingerprint(date, amount, description)')
+
+
+def init_expense_change_log(db_path=None):
+    """支出の変更ログ expense_changes と、それを読む支出ストアの一覧を作り、どちらも空にする
+
+    expenses のトリガーが、追加・変更・削除された支出のIDを expense_changes に記録する
+    （cli_import.py などアプリ外からの書き込みも記録されるので取りこぼさない）。
+    ログを読む支出ストア（expense_store.ExpenseStore）は expense_change_readers に
+    どこまで読んだか（seq）を登録し、全員が読み終えた分だけを消す。
+    読む人がいないあいだはトリガーも記録しないので、分析画面を開かなければログは増えない。
+    起動時（main_window.init_database）に呼ぶ。前回までのログと、終了し損ねたストアの登録を消す
+    （同時に動いている別のアプリのストアは、登録が消えたことに気づいて全件を読み直す）。
+    """
+    with transaction(db_path) as conn:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS expense_changes (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                expense_id INTEGER NOT NULL
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS expense_change_readers (
+                reader TEXT PRIMARY KEY,
+                seq INTEGER NOT NULL
+            )
+        ''')
+        # 以前のトリガーは読む人がいなくても記録していたので作り直す
+        for name in ('trg_expenses_log_insert', 'trg_expenses_log_update',
+                     'trg_expenses_log_row_update', 'trg_expenses_log_delete'):
+            conn.execute(f'DROP TRIGGER IF EXISTS {name}')
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_expenses_changes_insert
+            AFTER INSERT ON expenses
+            WHEN EXISTS (SELECT 1 FROM expense_change_readers)
+            BEGIN INSERT INTO expense_changes (expense_id) VALUES (NEW.id); END
+        ''')
+        # 表示に関係する列の変更だけを記録する（fingerprint の付け直しなどでは記録しない）
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_expenses_changes_update
+            AFTER UPDATE OF id, date, category, amount, description ON expenses
+            WHEN EXISTS (SELECT 1 FROM expense_change_readers)
+            BEGIN
+                INSERT INTO expense_changes (expense_id) VALUES (OLD.id);
+                INSERT INTO expense_changes (expense_id) SELECT NEW.id WHERE NEW.id != OLD.id;
+            END
+        ''')
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_expenses_changes_delete
+            AFTER DELETE ON expenses
+            WHEN EXISTS (SELECT 1 FROM expense_change_readers)
+            BEGIN INSERT INTO expense_changes (expense_id) VALUES (OLD.id); END
+        ''')
+        conn.execute('DELETE FROM expense_change_readers')
+        conn.execute('DELETE FROM expense_changes')
+
+
+def ensure_import_file_hashes(db_path=None):
+    """credit_card_imports に取り込んだファイルの中身のハッシュを入れる file_hash 列が無ければ作る"""
+    conn = get_db_connection(db_path)
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(credit_card_imports)')]
+    if 'file_hash' in columns:
+        return
+    with transaction(db_path) as conn:
+        conn.execute('ALTER TABLE credit_card_imports ADD COLUMN file_hash TEXT')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_credit_card_imports_file_hash ON credit_card_imports(file_hash)')
+
+
+def get_imported_file_hashes(db_path=None):
+    """これまでに取り込んだファイルの中身のハッシュの集合"""
+    ensure_import_file_hashes(db_path)
+    conn = get_db_connection(db_path)
+    return {row[0] for row in conn.execute(
+        'SELECT DISTINCT file_hash FROM credit_card_imports WHERE file_hash IS NOT NULL'
+    )}
+
+
+def import_expenses(rows, skip_duplicates=True, db_path=None):
+    """取込明細をまとめて expenses に追加し、(追加した件数, 重複でスキップした件数) を返す
+
+    rows は (date, category, amount, description) の並び。
+    skip_duplicates=True なら、日付・金額・説明文が同じ支出が既にある行（明細の中での重複も含む）を
+    fingerprint の UNIQUE インデックスを使った INSERT OR IGNORE でスキップする
+    （以前は1行ごとに SELECT で重複を調べていたので、明細が長いほど遅くなっていた）。
+    skip_duplicates=False なら全行を追加する。指紋は付けないので、次回の取込の重複判定には使われない。
+    INSERT OR IGNORE は NOT NULL 違反の行も黙ってスキップするので、日付・カテゴリ・金額が空の行は
+    呼び出し側で除いておくこと。
+    """
+    ensure_expense_fingerprints(db_path)
+    if skip_duplicates:
+        records = [(date, category, amount, description, expense_fingerprint(date, amount, description))
+                   for date, category, amount, description in rows]
+    else:
+        records = [(date, category, amount, description, None)
+                   for date, category, amount, description in rows]
+
+    with transaction(db_path) as conn:
+        inserted = conn.executemany('''
+            INSERT OR IGNORE INTO expenses (date, category, amount, description, fingerprint)
+            VALUES (?, ?, ?, ?, ?)
+        ''', records).rowcount
+        sync_search_index(db_path)  # 取り込んだ分を全文検索インデックスにも入れる（同じトランザクションで）
+    return inserted, len(records) - inserted
+
+
+def import_expenses_in_chunks(chunks, skip_duplicates=True, db_path=None, progress=None):
+    """明細をかたまりごとに import_expenses で書き込み、かたまりごとに確定する（巨大な明細ファイル用）
+
+    chunks は (date, category, amount, description) の行リストを順に返すイテラブル
+    （ジェネレーターにすれば、ファイル全体をメモリに読み込まずに済む）。
+    progress(inserted, skipped) を渡すと、かたまりを1つ確定するたびに累計の件数で呼ぶ。
+    progress が False を返したらそこで中断する（確定済みのかたまりは残るが、
+    重複判定があるので同じファイルをもう一度取り込めば続きから追加される）。
+    戻り値は (追加した件数, 重複でスキップした件数)。
+    """
+    inserted = skipped = 0
+    for rows in chunks:
+        chunk_inserted, chunk_skipped = import_expenses(rows, skip_duplicates, db_path)
+        inserted += chunk_inserted
+        skipped += chunk_skipped
+        if progress is not None and progress(inserted, skipped) is False:
+            break
+    return inserted, skipped
+
+
+def get_monthly_history(end_year, end_month, months=6):
+    """end_year/end_month までの直近 months ヶ月分の収入・支出・収支と月間目標を1回のクエリで取得
+
+    データが無い月も収入0・支出0・貯蓄目標0として含める（古い月から順）。
+    支出は monthly_category_totals から読むので、支出の件数が増えても速さは変わらない。
+    戻り値: [{'year', 'month', 'income', 'expense', 'balance',
+              'savings_goal', 'expense_limit'}, ...]（expense_limitは未設定ならNone）
+    """
+    start_index = end_year * 12 + (end_month - 1) - (months - 1)
+    start_year, start_month = divmod(start_index, 12)
+    start_month += 1
+
+    rows = execute_query('''
+        WITH RECURSIVE months(year, month) AS (
+            SELECT ?, ?
+            UNION ALL
+            SELECT CASE WHEN month = 12 THEN year + 1 ELSE year END,
+                   CASE WHEN month = 12 THEN 1 ELSE month + 1 END
+            FROM months
+            WHERE (year, month) < (?, ?)
+        ),
+        expenses_by_month AS (
+            SELECT year, month, SUM(total) AS expense
+            FROM monthly_category_totals
+            WHERE (year, month) BETWEEN (?, ?) AND (?, ?)
+            GROUP BY year, month
+        )
+        SELECT m.year, m.month, COALESCE(i.income, 0), COALESCE(e.expense, 0),
+               COALESCE(g.savings_goal, 0), g.expense_limit
+        FROM months m
+        LEFT JOIN monthly_income i ON i.year = m.year AND i.month = m.month
+        LEFT JOIN expenses_by_month e ON e.year = m.year AND e.month = m.month
+        LEFT JOIN monthly_goals g ON g.year = m.year AND g.month = m.month
+        ORDER BY m.year, m.month
+    ''', (start_year, start_month, end_year, end_month,
+          start_year, start_month, end_year, end_month), fetch_all=True)
+
+    return [
+        {'year': year, 'month': month, 'income': income, 'expense': expense,
+         'balance': income - expense,
+         'savings_goal': savings_goal, 'expense_limit': expense_limit}
+        for year, month, income, expense, savings_goal, expense_limit in rows
+    ]
+
+
+# 集計テーブルに支出 NEW を足す／支出 OLD を引く処理（トリガー本体で使い回す）
+# strftime で読めない日付の支出は集計しない
+_ROLLUP_ADD = '''
+    INSERT INTO monthly_category_totals (year, month, category, total, count)
+    SELECT CAST(strftime('%Y', NEW.date) AS INTEGER),
+           CAST(strftime('%m', NEW.date) AS INTEGER),
+           NEW.category, NEW.amount, 1
+    WHERE strftime('%Y', NEW.date) IS NOT NULL
+    ON CONFLICT(year, month, category)
+    DO UPDATE SET total = total + excluded.total, count = count + 1;
+'''
+_ROLLUP_SUBTRACT = '''
+    UPDATE monthly_category_totals
+    SET total = total - OLD.amount, count = count - 1
+    WHERE year = CAST(strftime('%Y', OLD.date) AS INTEGER)
+      AND month = CAST(strftime('%m', OLD.date) AS INTEGER)
+      AND category = OLD.category;
+    DELETE FROM monthly_category_totals
+    WHERE year = CAST(strftime('%Y', OLD.date) AS INTEGER)
+      AND month = CAST(strftime('%m', OLD.date) AS INTEGER)
+      AND category = OLD.category
+      AND count <= 0;
+'''
+
+
+def init_monthly_category_totals(db_path=None):
+    """月別・カテゴリ別の支出集計テーブル monthly_category_totals と、それを更新するトリガーを作る
+
+    各画面が毎回 expenses を SUM/GROUP BY し直さなくて済むよう、
+    トリガーで expenses の追加・変更・削除のたびに差分だけ反映する。
+    初めて集計テーブルを作ったときは既存データから一括で作る。
+    起動時（main_window.init_database）に呼ぶ。
+    """
+    with transaction(db_path) as conn:
+        rollup_exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name='monthly_category_totals'"
+        ).fetchone()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS monthly_category_totals (
+                year INTEGER NOT NULL,
+                month INTEGER NOT NULL,
+                category TEXT NOT NULL,
+                total REAL NOT NULL DEFAULT 0,
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (year, month, category)
+            )
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_expenses_rollup_insert
+            AFTER INSERT ON expenses
+            BEGIN {_ROLLUP_ADD} END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_expenses_rollup_delete
+            AFTER DELETE ON expenses
+            BEGIN {_ROLLUP_SUBTRACT} END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_expenses_rollup_update
+            AFTER UPDATE OF date, category, amount ON expenses
+            BEGIN {_ROLLUP_SUBTRACT} {_ROLLUP_ADD} END
+        ''')
+        if not rollup_exists:
+            rebuild_monthly_category_totals(db_path)
+
+
+def rebuild_monthly_category_totals(db_path=None):
+    """月別・カテゴリ別の集計テーブル(monthly_category_totals)を expenses から作り直す
+
+    普段はexpensesのトリガーで自動的に更新されるので呼ぶ必要はない。
+    トリガーが無かった頃のDBを復元したときや、集計がずれた疑いがあるときに使う。
+    """
+    with transaction(db_path) as conn:
+        conn.execute('DELETE FROM monthly_category_totals')
+        conn.execute('''
+            INSERT INTO monthly_category_totals (year, month, category, total, count)
+            SELECT CAST(strftime('%Y', date) AS INTEGER),
+                   CAST(strftime('%m', date) AS INTEGER),
+                   category, SUM(amount), COUNT(*)
+            FROM expenses
+            WHERE strftime('%Y', date) IS NOT NULL
+            GROUP BY 1, 2, 3
+        ''')
+
+
+def search_index_available(db_path=None):
+    """全文検索インデックス expenses_fts と、その更新待ちの表 expenses_fts_pending があるかどうか
+
+    あると分かったらこのスレッドの接続を閉じるまで覚えておき、検索のたびに sqlite_master を読まない。
+    """
+    db_path = db_path or DB_PATH
+    state = _thread_state()
+    if db_path in state.search_index:
+        return True
+    conn = get_db_connection(db_path)
+    found = conn.execute(
+        "SELECT COUNT(*) FROM sqlite_master WHERE type='table' AND name IN ('expenses_fts', 'expenses_fts_pending')"
+    ).fetchone()[0] == 2
+    if found:
+        state.search_index.add(db_path)
+    return found
+
+
+def sync_search_index(db_path=None):
+    """トリガーが expenses_fts_pending に記録した支出を、全文検索インデックスに入れる
+
+    索引には normalize_text（Pythonの関数）でそろえた文字列を入れるが、トリガーの中で呼ぶと
+    この関数を登録していない接続（sqlite3 コマンドやDBブラウザ）からの書き込みが
+    「no such function」で失敗してしまう。そのためトリガーは変わった支出のIDを記録するだけにし、
+    索引への反映は支出を書き込んだ関数（取込・追加・書き換え・一括変更）の最後に、
+    同じトランザクションの中でここでまとめて行う。アプリ外からの書き込みの分は起動時
+    （main_window.init_database）に入れる。検索（expense_query）は読むだけで、ここは呼ばない。
+    """
+    if not search_index_available(db_path):
+        return
+    conn = get_db_connection(db_path)
+    if conn.execute('SELECT 1 FROM expenses_fts_pending LIMIT 1').fetchone() is None:
+        return
+    with transaction(db_path) as conn:
+        pending = 'SELECT expense_id FROM expenses_fts_pending'
+        conn.execute(f'DELETE FROM expenses_fts WHERE rowid IN ({pending})')
+        conn.execute(f'''
+            INSERT INTO expenses_fts (rowid, description, category)
+            SELECT id, normalize_text(description), normalize_text(category)
+            FROM expenses
+            WHERE id IN ({pending})
+        ''')
+        conn.execute('DELETE FROM expenses_fts_pending')
+
+
+def rebuild_search_index(db_path=None):
+    """支出の全文検索インデックス(expenses_fts)を expenses から作り直す
+
+    普段はexpensesのトリガーと sync_search_index で更新されるので呼ぶ必要はない。
+    """
+    with transaction(db_path) as conn:
+        conn.execute('DELETE FROM expenses_fts_pending')
+        conn.execute('DELETE FROM expenses_fts')
+        conn.execute('''
+            INSERT INTO expenses_fts (rowid, description, category)
+            SELECT id, normalize_text(description), normalize_text(category)
+            FROM expenses
+        ''')
@@ -16,7 +16,7 @@ from PyQt5.QtWidgets import (
     QFrame,
     QTabWidget
 )
-from PyQt5.QtCore import Qt, QDate
+from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QColor
 from PyQt5.QtChart import (
     QChart,
@@ -27,8 +27,13 @@ from PyQt5.QtChart import (
     QBarCategoryAxis,
     QLineSeries
 )
-from db_utils import execute_query, fetch_df
+from db_utils import execute_query, fetch_df, get_monthly_history
 from common import DateHelper, BaseWidget
+from events import ExpenseChanged, GoalChanged, IncomeChanged
+
+
+# トレンド分析の期間として選べる月数（最大60ヶ月）
+TREND_WINDOW_OPTIONS = (3, 6, 12, 24, 36, 60)
 
 
 class DiagnosticReportWidget(BaseWidget):
@@ -36,11 +41,17 @@ class DiagnosticReportWidget(BaseWidget):
         super().__init__(parent)
         self.current_year, self.current_month = DateHelper.get_current_year_month()
         
+        # トレンド分析の期間（月数）
+        self.trend_months = 6
+        
         # 健全性スコアの初期値
         self.health_score = 0
         
         # UIの初期化
         self.initUI()
+        
+        # トレンド分析は過去の月も使うので、月を問わず再計算する
+        self.watch_changes(ExpenseChanged, IncomeChanged, GoalChanged)
 
     def initUI(self):
         layout = QVBoxLayout()
@@ -61,6 +72,15 @@ class DiagnosticReportWidget(BaseWidget):
         date_layout.addWidget(self.period_label)
         date_layout.addWidget(self.next_month_button)
         
+        # トレンド分析の期間選択
+        self.trend_combo = QComboBox()
+        for n_months in TREND_WINDOW_OPTIONS:
+            self.trend_combo.addItem(f'過去{n_months}ヶ月', n_months)
+        self.trend_combo.setCurrentIndex(TREND_WINDOW_OPTIONS.index(self.trend_months))
+        self.trend_combo.currentIndexChanged.connect(self.change_trend_window)
+        date_layout.addWidget(QLabel('トレンド期間:'))
+        date_layout.addWidget(self.trend_combo)
+        
         layout.addLayout(date_layout)
         
         # タブウィジェット
@@ -192,6 +212,10 @@ class DiagnosticReportWidget(BaseWidget):
         self.update_period_label()
         self.generate_report()
 
+    def change_trend_window(self):
+        self.trend_months = self.trend_combo.currentData()
+        self.generate_report()
+
     def update_display(self):
         """現在選択されている年月に応じた表示を更新する"""
         self.update_period_label()  # 期間表示を更新
@@ -231,12 +255,11 @@ class DiagnosticReportWidget(BaseWidget):
         
         # 支出データ（カテゴリ別）
         df = fetch_df('''
-            SELECT category, SUM(amount) as total_amount 
-            FROM expenses 
-            WHERE strftime('%Y', date) = ? 
-            AND strftime('%m', date) = ?
-            GROUP BY category
-        ''', params=(str(self.current_year), f"{self.current_month:02d}"))
+            SELECT category, total as total_amount 
+            FROM monthly_category_totals 
+            WHERE year = ? AND month = ?
+            ORDER BY category
+        ''', params=(self.current_year, self.current_month))
         
         self.expense_by_category = {}
         self.total_expense = 0
@@ -262,40 +285,10 @@ class DiagnosticReportWidget(BaseWidget):
         
         self.category_goals = {category: amount for category, amount in category_goals_result} if category_goals_result else {}
         
-        # 過去6ヶ月のデータ（トレンド分析用）
-        start_date = QDate(self.current_year, self.current_month, 1).addMonths(-5)
-        self.historical_data = []
-        
-        current_date = start_date
-        while current_date <= QDate(self.current_year, self.current_month, 1):
-            year = current_date.year()
-            month = current_date.month()
-            
-            # 収入
-            income_result = execute_query('''
-                SELECT income FROM monthly_income 
-                WHERE year = ? AND month = ?
-            ''', (year, month), fetch_one=True)
-            
-            month_income = income_result[0] if income_result else 0
-            
-            # 支出
-            expense_result = execute_query('''
-                SELECT SUM(amount) FROM expenses
-                WHERE strftime('%Y', date) = ? AND strftime('%m', date) = ?
-            ''', (str(year), f"{month:02d}"), fetch_one=True)
-            
-            month_expense = expense_result[0] if expense_result and expense_result[0] else 0
-            
-            self.historical_data.append({
-                'year': year,
-                'month': month,
-                'income': month_income,
-                'expense': month_expense,
-                'balance': month_income - month_expense
-            })
-            
-            current_date = current_date.addMonths(1)
+        # 過去 trend_months ヶ月のデータ（トレンド分析用、1回のクエリでまとめて取得）
+        self.historical_data = get_monthly_history(
+            self.current_year, self.current_month, self.trend_months
+        )
         
         # 分析結果の計算
         self.balance = self.current_income - self.total_expense
@@ -475,8 +468,12 @@ class DiagnosticReportWidget(BaseWidget):
         
         # データの確認
         if hasattr(self, 'historical_data') and self.historical_data:
-            # 過去6ヶ月の収入と支出をグラフ化
-            months = [f"{data['month']}月" for data in self.historical_data]
+            # トレンド期間の収入と支出をグラフ化
+            # （1年を超える期間では同じ月名が重なるので年も付ける）
+            if len(self.historical_data) > 12:
+                months = [f"{data['year'] % 100:02d}/{data['month']}" for data in self.historical_data]
+            else:
+                months = [f"{data['month']}月" for data in self.historical_data]
             
             # 収入用のライン
             income_series = QLineSeries()
@@ -625,11 +622,18 @@ class DiagnosticReportWidget(BaseWidget):
                 ratio_text = f'これにより、貯蓄率は現在の<b>{savings_ratio:.1f}%</b>から<b>{potential_ratio:.1f}%</b>に向上します。'
             else:
                 ratio_text = ""
+            
+            # トレンド期間の平均収支（参考値）
+            if getattr(self, 'historical_data', None):
+                avg_balance = sum(data['balance'] for data in self.historical_data) / len(self.historical_data)
+                trend_text = f'\n\n参考: 過去{len(self.historical_data)}ヶ月の平均収支は<b>{avg_balance:,.0f}円</b>です。'
+            else:
+                trend_text = ""
                 
             self.prediction_text.setText(
                 f'提案した改善策をすべて実行した場合、月間の貯蓄額が<b>約{monthly_increase:,.0f}円増加</b>し、'
                 f'年間では<b>約{yearly_increase:,.0f}円の追加貯蓄</b>が期待できます。\n\n'
-                f'{ratio_text}'
+                f'{ratio_text}{trend_text}'
             )
         else:
             self.prediction_text.setText('現在の家計状況では、大きな改善効果は期待できません。収入を増やすか、支出の内訳を見直すことを検討してください。')
@@ -681,7 +685,7 @@ class DiagnosticReportWidget(BaseWidget):
             years = 10
             months = years * 12
             
-            # 初期資産（直近6ヶ月の貯蓄総額とする）
+            # 初期資産（トレンド期間の貯蓄総額とする）
             if hasattr(self, 'historical_data'):
                 initial_assets = sum(data['balance'] for data in self.historical_data if data['balance'] > 0)
             else:
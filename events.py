@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""データ変更の通知（イベントバス）
+
+以前は目標を1件保存するだけで BudgetApp.update_goal_data_across_widgets が
+非表示の画面も含めて全画面を作り直していた。
+ここでは「何が・どの月で」変わったかをイベントとして配信し、
+受け取った画面は「要再計算」の印だけ付けて、次に表示されたときに作り直す
+（BaseWidget.watch_changes / mark_dirty を参照）。
+
+使い方:
+    get_event_bus().publish(ExpenseChanged(2025, 4), sender=self)"""
+
+
+class ChangeEvent:
+    """変更イベントの基底クラス
+
+    year/month が None のときは「どの月が変わったか特定しない（全期間）」の意味。
+    """
+
+    def __init__(self, year=None, month=None):
+        self.year = year
+        self.month = month
+
+    def affects_month(self, year, month):
+        """指定した月に関係する変更かどうか"""
+        return self.year is None or (self.year, self.month) == (year, month)
+
+    def affects_range(self, start, end):
+        """(year, month) の start〜end（両端含む）の期間に関係する変更かどうか"""
+        return self.year is None or start <= (self.year, self.month) <= end
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.year}, {self.month})'
+
+
+class ExpenseChanged(ChangeEvent):
+    """支出の追加・変更・削除"""
+
+
+class IncomeChanged(ChangeEvent):
+    """月次収入の変更"""
+
+
+class GoalChanged(ChangeEvent):
+    """月間目標・カテゴリ別目標の変更"""
+
+
+class CategoryChanged(ChangeEvent):
+    """カテゴリの追加・名前変更・削除・並び替え（月には関係しない）"""
+
+
+class EventBus:
+    """変更イベントの購読・配信"""
+
+    def __init__(self):
+        self._subscribers = {}  # {イベントの型: [(owner, callback), ...]}
+
+    def subscribe(self, event_type, callback, owner=None):
+        """event_type（とその派生型）のイベントを受け取る
+
+        owner を指定すると、その owner 自身が sender として配信したイベントは届かない
+        （自分で変更して自分で表示を更新済みの画面に二重で通知しないため）。
+        """
+        self._subscribers.setdefault(event_type, []).append((owner, callback))
+
+    def publish(self, event, sender=None):
+        """イベントを購読者に配信する"""
+        for event_type in type(event).__mro__:
+            for owner, callback in list(self._subscribers.get(event_type, [])):
+                if sender is not None and owner is sender:
+                    continue
+                try:
+                    callback(event)
+                except Exception as e:
+                    # 1つの画面の失敗で他の画面への通知が止まらないようにする
+                    print(f"変更通知の処理中にエラー ({event!r}): {e}")
+
+
+_bus = None
+
+
+def get_event_bus():
+    """アプリ全体で共有する EventBus を取得"""
+    global _bus
+    if _bus is None:
+        _bus = EventBus()
+    return _bus
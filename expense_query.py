@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+"""支出一覧の検索条件（SQLの組み立て）
+
+入出金画面の検索欄・カテゴリ・金額範囲・並び替え・表示件数の条件を
+WHERE / ORDER BY / LIMIT OFFSET に変換し、絞り込みと並び替えをSQLite側で行う。
+以前は表示中の月を全件取ってきて Python のリスト内包表記で絞り込んでいたため、
+1文字入力するたびに全件を処理し直していて、全期間を対象にすることもできなかった。
+
+キーワード検索は全文検索インデックス expenses_fts（main_window.init_database で作成）を使う。
+説明文・カテゴリもキーワードも normalize_text でそろえてから比べるので、
+「ｺﾝﾋﾞﾆ」と「コンビニ」、「ＡＭＡＺＯＮ」と「amazon」は同じ語として見つかる。
+索引への反映は支出を書き込む側（db_utils.sync_search_index）で済ませておくので、
+ここでは読むだけにする（QueryScheduler のワーカースレッドから書き込まないように）。
+
+使い方:
+    query = ExpenseQuery(year=2025, month=4, keyword='コンビニ', sort='金額順（高い順）')
+    query.count()                  # 条件に合う件数
+    query.fetch_page(0, 200)       # 先頭から200件
+    search_expenses('ｺﾝﾋﾞﾆ')        # 全期間を関連度順に検索
+"""
+from db_utils import execute_query, normalize_text, search_index_available
+from common import DateHelper
+
+
+# 並び替えの表示名 → ORDER BY（同じ値の行の順番が毎回変わらないよう最後に id を付ける）
+# 日付・金額の順は idx_expenses_date / idx_expenses_amount をそのまま使える。
+# カテゴリ別はカテゴリごとに分けて読み込み、各カテゴリの中を idx_expenses_category_date の順で返す
+# （カテゴリの並び順 categories.sort_order で全件を並べ替えると全期間では数秒かかるため）
+SORT_ORDERS = {
+    '日付順（新しい順）': 'e.date DESC, e.id DESC',
+    '日付順（古い順）': 'e.date ASC, e.id ASC',
+    'カテゴリ別': 'e.date DESC, e.id DESC',
+    '金額順（高い順）': 'e.amount DESC, e.id DESC',
+    '金額順（安い順）': 'e.amount ASC, e.id ASC',
+    # キーワードに3文字以上の語があるときは全文検索の関連度順（bm25）、無ければ日付の新しい順
+    '関連度順': 'e.date DESC, e.id DESC',
+}
+DEFAULT_SORT = '日付順（新しい順）'
+
+# 「全てのカテゴリ」など、カテゴリで絞り込まないことを表す値
+ALL_CATEGORIES = '全てのカテゴリ'
+
+# trigram の全文検索で MATCH に使える語の最短の長さ（これより短い語は LIKE で探す）
+MIN_MATCH_LENGTH = 3
+
+
+def _escape_like(text):
+    """LIKE の特殊文字（% _ \\）をエスケープする"""
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _match_phrase(term):
+    """語を FTS5 のフレーズ（"..."）にする（記号を演算子として解釈させない）"""
+    return '"' + term.replace('"', '""') + '"'
+
+
+def search_expenses(keyword, limit=50, offset=0):
+    """全期間の支出をキーワードで検索し、関連度の高い順に返す
+
+    戻り値: [(id, date, category, amount, description), ...]
+    """
+    return ExpenseQuery(keyword=keyword, sort='関連度順').fetch_page(offset, limit)
+
+
+class ExpenseQuery:
+    """支出一覧の検索条件
+
+    year/month が None のときは全期間が対象。
+    category が None か ALL_CATEGORIES のときはカテゴリで絞り込まない。
+    keyword は説明文・カテゴリ名の部分一致。空白で区切ると全ての語を含むものに絞り込む
+    （全角/半角・英字の大文字小文字は区別しない）。
+    limit は表示件数の上限（None なら上限なし）。
+    """
+
+    def __init__(self, year=None, month=None, category=None, keyword='',
+                 amount_min=None, amount_max=None, sort=DEFAULT_SORT, limit=None):
+        self.year = year
+        self.month = month
+        self.category = None if category == ALL_CATEGORIES else category
+        self.keyword = normalize_text(keyword or '').strip()
+        self.amount_min = amount_min
+        self.amount_max = amount_max
+        self.sort = sort if sort in SORT_ORDERS else DEFAULT_SORT
+        self.limit = limit
+        self._groups = None  # group_summaries() の結果（ページを読むたびに数え直さない）
+
+    @property
+    def grouped(self):
+        """カテゴリ別（見出し行つき）の表示かどうか"""
+        return self.sort == 'カテゴリ別'
+
+    def _match_expression(self):
+        """キーワードのうち全文検索の MATCH に使える語の検索式（無ければ None）"""
+        terms = [term for term in self.keyword.split() if len(term) >= MIN_MATCH_LENGTH]
+        if not terms or not search_index_available():
+            return None
+        return ' AND '.join(_match_phrase(term) for term in terms)
+
+    def _keyword_condition(self, include_match=True):
+        """キーワードの WHERE 条件とパラメータ
+
+        3文字以上の語は expenses_fts の MATCH でインデックスから探す。
+        それより短い語は trigram のインデックスが使えないので、expenses_fts の正規化済みの列へ LIKE をかける。
+        MATCH や月で行が絞られているときはその行だけを1件ずつ調べ、
+        そうでなければ expenses_fts を1回通して読む（全期間の2文字検索は全件を見ることになる）。
+        include_match=False のときは MATCH の分を含めない（関連度順で別に結合するとき用）。
+        """
+        conditions = []
+        params = []
+        if not search_index_available():
+            # 全文検索インデックスが無い SQLite では expenses を直接 LIKE で探す
+            for term in self.keyword.split():
+                pattern = f'%{_escape_like(term)}%'
+                conditions.append("(normalize_text(e.description) LIKE ? ESCAPE '\\' "
+                                  "OR normalize_text(e.category) LIKE ? ESCAPE '\\')")
+                params.extend([pattern, pattern])
+            return conditions, params
+
+        match = self._match_expression()
+        if match and include_match:
+            conditions.append('e.id IN (SELECT rowid FROM expenses_fts WHERE expenses_fts MATCH ?)')
+            params.append(match)
+        narrowed = match is not None or (self.year is not None and self.month is not None)
+        for term in self.keyword.split():
+            if len(term) < MIN_MATCH_LENGTH:
+                pattern = f'%{_escape_like(term)}%'
+                like = "(s.description LIKE ? ESCAPE '\\' OR s.category LIKE ? ESCAPE '\\')"
+                if narrowed:
+                    conditions.append(f"EXISTS (SELECT 1 FROM expenses_fts s WHERE s.rowid = e.id AND {like})")
+                else:
+                    conditions.append(f"e.id IN (SELECT s.rowid FROM expenses_fts s WHERE {like})")
+                params.extend([pattern, pattern])
+        return conditions, params
+
+    def where(self, include_match=True):
+        """WHERE 条件とパラメータを返す（条件が無ければ '1'）"""
+        conditions = []
+        params = []
+        if self.year is not None and self.month is not None:
+            where, month_params = DateHelper.month_filter(self.year, self.month, column='e.date')
+            conditions.append(where)
+            params.extend(month_params)
+        if self.category:
+            conditions.append('e.category = ?')
+            params.append(self.category)
+        if self.keyword:
+            keyword_conditions, keyword_params = self._keyword_condition(include_match)
+            conditions.extend(keyword_conditions)
+            params.extend(keyword_params)
+        if self.amount_min is not None:
+            conditions.append('e.amount >= ?')
+            params.append(self.amount_min)
+        if self.amount_max is not None:
+            conditions.append('e.amount <= ?')
+            params.append(self.amount_max)
+        return ' AND '.join(conditions) or '1', params
+
+    @property
+    def uses_rollup(self):
+        """件数・合計を集計テーブル monthly_category_totals から求められるかどうか
+
+        月とカテゴリ以外の条件（キーワード・金額範囲）があるときは expenses を数える必要がある。
+        1か月を表示しているときだけ使う。集計テーブルは strftime で読める日付の支出しか数えないので、
+        全期間だと「2025/04/01」のような日付の支出の分だけ、expenses から読むページとずれてしまう
+        （1か月の範囲の条件にはそのような日付はもともと入らない）。
+        """
+        return (self.year is not None and self.month is not None
+                and not self.keyword and self.amount_min is None and self.amount_max is None)
+
+    def _rollup_where(self):
+        """monthly_category_totals 用の WHERE 条件とパラメータ（uses_rollup のときだけ使う）"""
+        conditions = ['year = ? AND month = ?']
+        params = [self.year, self.month]
+        if self.category:
+            conditions.append('category = ?')
+            params.append(self.category)
+        return ' AND '.join(conditions), params
+
+    def count(self):
+        """条件に合う件数（limit を超える分は数えない）"""
+        where, params = self.where()
+        total = execute_query(f'SELECT COUNT(*) FROM expenses e WHERE {where}', params, fetch_one=True)[0]
+        return total if self.limit is None else min(total, self.limit)
+
+    def summary(self):
+        """条件に合う支出の (件数, 合計金額)（limit に関係なく全件）"""
+        where, params = self.where()
+        count, total = execute_query(
+            f'SELECT COUNT(*), COALESCE(SUM(e.amount), 0) FROM expenses e WHERE {where}',
+            params, fetch_one=True
+        )
+        return count, total
+
+    def group_summaries(self):
+        """カテゴリ別表示の {カテゴリ: (件数, 合計金額)} をカテゴリの並び順（sort_order順）で返す
+
+        categories に無いカテゴリは最後にカテゴリ名順で並べる。
+        """
+        if self._groups is None:
+            if self.uses_rollup:
+                # カテゴリ数の行を読むだけで済む
+                where, params = self._rollup_where()
+                source = f'''
+                    SELECT category, SUM(count) AS count, SUM(total) AS total
+                    FROM monthly_category_totals
+                    WHERE {where}
+                    GROUP BY category
+                    HAVING SUM(count) > 0
+                '''
+            else:
+                where, params = self.where()
+                source = f'''
+                    SELECT e.category AS category, COUNT(*) AS count, SUM(e.amount) AS total
+                    FROM expenses e
+                    WHERE {where}
+                    GROUP BY e.category
+                '''
+            rows = execute_query(f'''
+                SELECT g.category, g.count, g.total
+                FROM ({source}) g
+                LEFT JOIN categories c ON c.name = g.category
+                ORDER BY c.sort_order IS NULL, c.sort_order, g.category
+            ''', params, fetch_all=True)
+            self._groups = {category: (count, total) for category, count, total in rows}
+        return self._groups
+
+    def fetch_page(self, offset, limit):
+        """並び順で offset 件目から最大 limit 件の (id, date, category, amount, description) を返す"""
+        if self.limit is not None:
+            limit = max(0, min(limit, self.limit - offset))
+            if limit == 0:
+                return []
+        if self.sort == '関連度順' and self._match_expression():
+            return self._fetch_ranked_page(offset, limit)
+        where, params = self.where()
+        if self.grouped:
+            return self._fetch_grouped_page(where, params, offset, limit)
+        return self._select(where, params, offset, limit)
+
+    def _fetch_ranked_page(self, offset, limit):
+        """全文検索の関連度（bm25、小さいほど関連が強い）の順に1ページ分を返す"""
+        where, params = self.where(include_match=False)
+        return execute_query(f'''
+            SELECT e.id, e.date, e.category, e.amount, e.description
+            FROM expenses_fts f
+            JOIN expenses e ON e.id = f.rowid
+            WHERE expenses_fts MATCH ? AND {where}
+            ORDER BY f.rank, e.date DESC, e.id DESC
+            LIMIT ? OFFSET ?
+        ''', (self._match_expression(), *params, limit, offset), fetch_all=True)
+
+    def _select(self, where, params, offset, limit):
+        return execute_query(f'''
+            SELECT e.id, e.date, e.category, e.amount, e.description
+            FROM expenses e
+            WHERE {where}
+            ORDER BY {SORT_ORDERS[self.sort]}
+            LIMIT ? OFFSET ?
+        ''', (*params, limit, offset), fetch_all=True)
+
+    def _fetch_grouped_page(self, where, params, offset, limit):
+        """カテゴリ別表示の1ページ分（カテゴリの件数から、どのカテゴリの何件目からかを求める）"""
+        rows = []
+        for category, (count, _) in self.group_summaries().items():
+            if offset >= count:
+                offset -= count
+                continue
+            page = self._select(f'{where} AND e.category = ?', (*params, category), offset, limit)
+            rows.extend(page)
+            limit -= len(page)
+            offset = 0
+            if limit <= 0:
+                break
+        return rows
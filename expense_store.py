@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""支出データのメモリ上ストア
+
+expenses テーブル全体を一度だけ読み込み、全期間の支出を使う画面（総合分析）に渡す。
+以前は開くたびに SELECT * FROM expenses で全件を読み直していたが、
+ここでは expenses のトリガーが expense_changes に記録した「変更された支出ID」だけを
+読み直して差分を反映する（変更ログの仕組みは db_utils.init_expense_change_log）。
+月・カテゴリごとの合計を表示する画面は、集計テーブル monthly_category_totals から読む。
+
+列の持ち方（1行あたりの使用メモリを抑えるため）:
+    id          : int64（インデックス）
+    date        : datetime64
+    category    : Categorical（カテゴリ名は種類が少ないので番号で持つ）
+    amount      : float64
+    description : 文字列
+
+GUIスレッドから使う前提（スレッドをまたいで共有しない）。"""
+import uuid
+
+import pandas as pd
+from db_utils import execute_query, fetch_df, get_change_token, transaction
+
+
+COLUMNS = ['id', 'date', 'category', 'amount', 'description']
+
+# 未反映の変更がこの割合を超えたら差分反映ではなく全件を読み直す
+FULL_RELOAD_RATIO = 0.5
+
+
+class ExpenseStore:
+    """expenses テーブルの内容をメモリ上に保持し、変更分だけ反映するストア"""
+
+    def __init__(self):
+        self._df = None          # 読み込み済みの支出データ（date, id 順）
+        self._last_seq = 0       # 反映済みの expense_changes.seq
+        self._token = None       # 最後に確認したときの get_change_token()
+        # expense_change_readers に登録する名前（別のプロセスのストアと区別する）
+        self._reader = uuid.uuid4().hex
+
+    # --- 読み込み・差分反映 -------------------------------------------------
+
+    @staticmethod
+    def _normalize(df):
+        """DBから読んだ行を保持用の型にそろえる"""
+        df = df.set_index('id')
+        df['date'] = pd.to_datetime(df['date'], errors='coerce')
+        df['amount'] = df['amount'].astype('float64')
+        df['category'] = df['category'].astype('category')
+        return df
+
+    def reload(self):
+        """全件を読み直す"""
+        # 先にログを読む側として登録し、ログの位置を取っておく
+        # （登録した後の変更はトリガーが記録するので、読み込み中の変更も次回の差分で拾われる）
+        with transaction() as conn:
+            last_seq = conn.execute('SELECT COALESCE(MAX(seq), 0) FROM expense_changes').fetchone()[0]
+            conn.execute(
+                'INSERT OR REPLACE INTO expense_change_readers (reader, seq) VALUES (?, ?)',
+                (self._reader, last_seq)
+            )
+        df = self._normalize(fetch_df('SELECT id, date, category, amount, description FROM expenses'))
+        self._df = df.sort_index().sort_values('date', kind='stable')
+        self._last_seq = last_seq
+
+        # 全件読み込んだので、ここまでの変更ログは（他に読む人がいなければ）不要
+        self._prune()
+        self._token = get_change_token()
+
+    def _prune(self):
+        """ログを読む全員が反映し終えた分の変更ログを消す（読む人がいなければ全部消す）"""
+        execute_query('''
+            DELETE FROM expense_changes
+            WHERE seq <= COALESCE((SELECT MIN(seq) FROM expense_change_readers), seq)
+        ''')
+
+    def sync(self):
+        """DBの変更を反映する（変更が無ければ何もしない）"""
+        if self._df is None:
+            self.reload()
+            return
+
+        token = get_change_token()
+        if token == self._token:
+            return
+
+        registered = execute_query(
+            'SELECT 1 FROM expense_change_readers WHERE reader = ?', (self._reader,), fetch_one=True
+        )
+        if registered is None:
+            # 別に起動したアプリが変更ログを空にした（その間の変更はログに無い）ので全件を読み直す
+            self.reload()
+            return
+
+        pending = execute_query(
+            'SELECT COUNT(DISTINCT expense_id), COALESCE(MAX(seq), 0) FROM expense_changes WHERE seq > ?',
+            (self._last_seq,), fetch_one=True
+        )
+        changed_count, last_seq = pending
+        if changed_count == 0:
+            self._token = token
+            return
+        if changed_count > max(1000, len(self._df) * FULL_RELOAD_RATIO):
+            self.reload()
+            return
+
+        changed_ids = [row[0] for row in execute_query(
+            'SELECT DISTINCT expense_id FROM expense_changes WHERE seq > ? AND seq <= ?',
+            (self._last_seq, last_seq), fetch_all=True
+        )]
+        current = fetch_df('''
+            SELECT id, date, category, amount, description FROM expenses
+            WHERE id IN (SELECT expense_id FROM expense_changes WHERE seq > ? AND seq <= ?)
+        ''', params=(self._last_seq, last_seq))
+        self._apply(changed_ids, self._normalize(current))
+        self._last_seq = last_seq
+
+        # どこまで反映したかを登録し、全員が反映し終えた分のログを消す
+        # （別のプロセスのストアがまだ読んでいない分は残る）
+        execute_query(
+            'UPDATE expense_change_readers SET seq = ? WHERE reader = ?', (last_seq, self._reader)
+        )
+        self._prune()
+        # 書いたことで total_changes は進むが、他の接続の変更を見逃さないよう data_version は確認前の値のまま持つ
+        self._token = (get_change_token()[0], token[1])
+
+    def close(self):
+        """ログを読む側の登録を外す（登録が残っていると、トリガーが変更を記録し続ける）"""
+        if self._df is None:
+            return
+        execute_query('DELETE FROM expense_change_readers WHERE reader = ?', (self._reader,))
+        self._prune()
+        self._df = None
+        self._token = None
+
+    def _apply(self, changed_ids, current):
+        """変更された支出IDの分だけ、古い行を捨てて今の行に差し替える
+
+        changed_ids に含まれていて current に無いIDは削除されたもの。
+        """
+        df = self._df.drop(index=changed_ids, errors='ignore')
+        if not current.empty:
+            # 新しいカテゴリ名が増えていれば両方のカテゴリ一覧を合わせてから連結する
+            categories = df['category'].cat.categories.union(current['category'].cat.categories)
+            df['category'] = df['category'].cat.set_categories(categories)
+            current['category'] = current['category'].cat.set_categories(categories)
+            df = pd.concat([df, current])
+        self._df = df.sort_index().sort_values('date', kind='stable')
+
+    # --- 取得 --------------------------------------------------------------
+
+    @staticmethod
+    def _export(df):
+        """呼び出し側に渡す形（SELECT * FROM expenses と同じ列、カテゴリは文字列）にする"""
+        df = df.reset_index()
+        df['category'] = df['category'].astype(object)
+        return df[COLUMNS]
+
+    def all(self):
+        """全支出（日付順）"""
+        self.sync()
+        return self._export(self._df)
+
+
+_store = None
+
+
+def get_expense_store():
+    """アプリ全体で共有する ExpenseStore を取得"""
+    global _store
+    if _store is None:
+        _store = ExpenseStore()
+    return _store
+
+
+def close_expense_store():
+    """共有の ExpenseStore を読み込んでいれば、変更ログを読む側の登録を外す（アプリ終了時に呼ぶ）"""
+    if _store is not None:
+        _store.close()
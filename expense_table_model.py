@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""支出一覧テーブルのモデルとカテゴリ編集用デリゲート
+
+以前は QTableWidget に1セルごとの QTableWidgetItem と1行ごとの QComboBox を作っていたため、
+数千件の月では表示に数秒・数百MBかかっていた。
+ここでは読み込んだ行のリストをそのまま QAbstractTableModel で見せ、
+Qt が画面に見えている行の分だけ data() を問い合わせる。
+カテゴリの選択は列に1つだけ設定した CategoryDelegate が、編集するときだけ
+コンボボックスを作る。
+
+モデルはDBに書き込まない。ユーザーがセルを編集すると edit_requested を送り、
+受け取った画面（IncomeExpenseWidget）が検証・保存してから update_row() で反映する。
+
+set_query() で検索条件（expense_query.ExpenseQuery）を渡すと、最初の PAGE_SIZE 件だけ読み込み、
+続きはビューが一番下までスクロールしたときに fetchMore() で1ページずつ読み込む。
+最初のページをワーカースレッドで読み込むときは load_first_page() の結果を set_result() に渡し、
+続きのページも page_loader を設定すればワーカースレッドで読み込める。"""
+from PyQt5.QtWidgets import QStyledItemDelegate, QComboBox
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, pyqtSignal
+from PyQt5.QtGui import QFont, QColor
+from db_utils import get_categories
+
+
+# 列の並び（行データのタプル (id, date, category, amount, description) と同じ順）
+COLUMN_ID, COLUMN_DATE, COLUMN_CATEGORY, COLUMN_AMOUNT, COLUMN_DESCRIPTION = range(5)
+HEADERS = ['ID', '日付', 'カテゴリ', '金額', '説明']
+
+# カテゴリ別表示の見出し行の背景色
+GROUP_HEADER_COLOR = '#E3F2FD'
+
+# スクロールで1回に読み込む行数
+PAGE_SIZE = 200
+
+
+def load_first_page(query):
+    """検索条件の件数・カテゴリ別の見出し・最初のページを読み込む（ワーカースレッドからも呼べる）
+
+    戻り値は set_result() にそのまま渡せる (total, groups, page)。
+    """
+    groups = query.group_summaries() if query.grouped else {}
+    return query.count(), groups, query.fetch_page(0, PAGE_SIZE)
+
+
+class ExpenseTableModel(QAbstractTableModel):
+    """支出の行リストを表として見せるモデル
+
+    行は (id, date, category, amount, description) のタプル。
+    カテゴリ別表示では、見出し行として文字列を混ぜて持つ（is_header で判定）。
+    """
+
+    # ユーザーがセルを編集した（行番号, 列番号, 入力された値）
+    edit_requested = pyqtSignal(int, int, object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._rows = []
+        self._query = None          # ページ単位で読み込み中の検索条件
+        self._total = 0             # 検索条件に合う件数（見出し行は含まない）
+        self._fetched = 0           # 読み込み済みの件数
+        self._groups = {}           # カテゴリ別表示の {カテゴリ: (件数, 合計金額)}
+        self._last_category = None  # 最後に読み込んだ行のカテゴリ（見出し行を入れる位置の判定用）
+        self._loading = False       # 続きのページを読み込み中かどうか
+        # 続きのページを読み込む関数 page_loader(query, offset, limit, callback)。
+        # 読み込んだ行を callback(page) に渡す。None ならその場で（同期で）読み込む
+        self.page_loader = None
+        self._header_font = QFont('', weight=QFont.Bold)
+        self._header_color = QColor(GROUP_HEADER_COLOR)
+
+    # --- 行の入れ替え --------------------------------------------------------
+
+    def set_rows(self, rows):
+        """表示する行を入れ替える（ページ読み込みはしない）"""
+        self.beginResetModel()
+        self._query = None
+        self._rows = list(rows)
+        self.endResetModel()
+
+    def set_query(self, query):
+        """検索条件に合う支出を表示する（最初の1ページだけその場で読み込む）"""
+        self.set_result(query, *load_first_page(query))
+
+    def set_result(self, query, total, groups, page):
+        """load_first_page() で読み込んだ結果を表示する"""
+        self.beginResetModel()
+        self._query = query
+        self._total = total
+        self._fetched = 0
+        self._groups = groups
+        self._last_category = None
+        self._loading = False
+        self._rows = self._page_rows(page)
+        self.endResetModel()
+
+    def _page_rows(self, page):
+        """読み込んだ1ページ分を表示用の行にする（カテゴリ別表示なら見出し行も入れる）"""
+        self._fetched += len(page)
+        if not page:
+            # 数えた後に削除された行があっても読み込みを終わらせる
+            self._total = self._fetched
+
+        if not self._query.grouped:
+            return list(page)
+        rows = []
+        for row_data in page:
+            category = row_data[COLUMN_CATEGORY]
+            if category != self._last_category:
+                count, total = self._groups.get(category, (0, 0))
+                rows.append(f"【{category}】 ({count}件、合計: {total:,.0f}円)")
+                self._last_category = category
+            rows.append(row_data)
+        return rows
+
+    def update_row(self, row, row_data):
+        """1行だけ差し替える（保存に成功した編集の反映用）"""
+        self._rows[row] = tuple(row_data)
+        self.dataChanged.emit(self.index(row, 0), self.index(row, len(HEADERS) - 1))
+
+    def is_header(self, row):
+        """カテゴリ別表示の見出し行かどうか"""
+        return isinstance(self._rows[row], str)
+
+    def header_rows(self, first=0, last=None):
+        """first〜last 行目（両端含む）にある見出し行の行番号一覧"""
+        last = len(self._rows) - 1 if last is None else last
+        return [row for row in range(first, last + 1) if isinstance(self._rows[row], str)]
+
+    def row_data(self, row):
+        """行のタプル (id, date, category, amount, description) を返す（見出し行は None）"""
+        row_data = self._rows[row]
+        return None if isinstance(row_data, str) else row_data
+
+    # --- QAbstractTableModel ------------------------------------------------
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(HEADERS)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self._query is not None and self._fetched < self._total
+
+    def fetchMore(self, parent=QModelIndex()):
+        if not self.canFetchMore(parent) or self._loading:
+            return
+        if self.page_loader is None:
+            self._append_page(self._query.fetch_page(self._fetched, PAGE_SIZE))
+            return
+        self._loading = True
+        query = self._query
+        self.page_loader(query, self._fetched, PAGE_SIZE, lambda page: self._on_page_loaded(query, page))
+
+    def _on_page_loaded(self, query, page):
+        if query is not self._query:
+            return  # 読み込み中に検索条件が変わった
+        self._loading = False
+        self._append_page(page)
+
+    def _append_page(self, page):
+        rows = self._page_rows(page)
+        if not rows:
+            return
+        first = len(self._rows)
+        self.beginInsertRows(QModelIndex(), first, first + len(rows) - 1)
+        self._rows.extend(rows)
+        self.endInsertRows()
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return HEADERS[section]
+        return super().headerData(section, orientation, role)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row_data = self._rows[index.row()]
+        column = index.column()
+
+        if isinstance(row_data, str):
+            # 見出し行（ビュー側で1列目から最後までを結合して表示する）
+            if role == Qt.DisplayRole:
+                return row_data if column == COLUMN_DATE else ''
+            if role == Qt.BackgroundRole:
+                return self._header_color
+            if role == Qt.FontRole:
+                return self._header_font
+            return None
+
+        value = row_data[column]
+        if role == Qt.DisplayRole:
+            if column == COLUMN_AMOUNT:
+                return f"{float(value or 0):,.0f}円"
+            return '' if value is None else str(value)
+        if role == Qt.EditRole:
+            if column == COLUMN_AMOUNT:
+                return f"{float(value or 0):.0f}"
+            return '' if value is None else str(value)
+        if role == Qt.TextAlignmentRole and column == COLUMN_AMOUNT:
+            return int(Qt.AlignRight | Qt.AlignVCenter)
+        return None
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.NoItemFlags
+        if isinstance(self._rows[index.row()], str):
+            return Qt.ItemIsEnabled
+        flags = Qt.ItemIsEnabled | Qt.ItemIsSelectable
+        if index.column() != COLUMN_ID:
+            flags |= Qt.ItemIsEditable
+        return flags
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if role != Qt.EditRole or not index.isValid():
+            return False
+        row_data = self.row_data(index.row())
+        if row_data is None:
+            return False
+        if str(value) == self.data(index, Qt.EditRole):
+            return False  # 変わっていなければ保存しない
+        self.edit_requested.emit(index.row(), index.column(), value)
+        return True
+
+
+class CategoryDelegate(QStyledItemDelegate):
+    """カテゴリ列の編集用デリゲート（編集中のセルにだけコンボボックスを出す）"""
+
+    def createEditor(self, parent, option, index):
+        editor = QComboBox(parent)
+        editor.addItems(get_categories())
+        # 選んだ時点で確定する（以前の「行ごとのコンボボックス」と同じ操作感にする）
+        editor.activated.connect(lambda _: self._commit_and_close(editor))
+        return editor
+
+    def _commit_and_close(self, editor):
+        self.commitData.emit(editor)
+        self.closeEditor.emit(editor, QStyledItemDelegate.NoHint)
+
+    def setEditorData(self, editor, index):
+        position = editor.findText(index.data(Qt.EditRole))
+        if position >= 0:
+            editor.setCurrentIndex(position)
+
+    def setModelData(self, editor, model, index):
+        model.setData(index, editor.currentText(), Qt.EditRole)
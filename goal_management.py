@@ -3,8 +3,6 @@
 
 月間・カテゴリ別の目標設定と進捗表示。"""
 from PyQt5.QtWidgets import (
-    QApplication,
-    QMainWindow,
     QWidget,
     QMessageBox,
     QPushButton,
@@ -21,12 +19,53 @@ from PyQt5.QtWidgets import (
     QTabWidget,
     QProgressBar
 )
-from PyQt5.QtCore import Qt, QDate
+from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QColor
 from PyQt5.QtChart import QChart, QChartView, QValueAxis, QBarCategoryAxis, QLineSeries
-import sqlite3
-from db_utils import execute_query, get_categories
+from db_utils import execute_query, get_categories, get_change_token, get_monthly_history
 from common import DateHelper, BaseWidget
+from events import CategoryChanged, ExpenseChanged, GoalChanged, IncomeChanged
+
+
+class GoalHistoryProvider:
+    """月ごとの目標・収入・支出を (year, month) 単位でキャッシュして返す
+
+    以前は画面を更新するたびに1ヶ月あたり3回（目標・収入・支出）問い合わせていた。
+    足りない月だけを get_monthly_history でまとめて1回で読み込み、
+    前月・次月へ移動したときは読み込み済みの月をそのまま使い回す。
+    DBに書き込みがあれば（get_change_token の値が変わったら）キャッシュを捨てて読み直す。
+    """
+
+    def __init__(self):
+        self._cache = {}
+        self._token = None
+
+    def invalidate(self):
+        """キャッシュを捨てる（次の取得時に読み直される）"""
+        self._cache.clear()
+
+    def get_window(self, end_year, end_month, months=6):
+        """end_year/end_month までの直近 months ヶ月分を古い月から順に返す"""
+        token = get_change_token()
+        if token != self._token:
+            self.invalidate()
+            self._token = token
+
+        keys = DateHelper.get_last_n_months(months, end_year, end_month)
+        missing = [key for key in keys if key not in self._cache]
+        if missing:
+            # 足りない月を含む範囲を1回のクエリで読み込む
+            first_year, first_month = missing[0]
+            last_year, last_month = missing[-1]
+            span = (last_year - first_year) * 12 + (last_month - first_month) + 1
+            for data in get_monthly_history(last_year, last_month, span):
+                self._cache[(data['year'], data['month'])] = data
+
+        return [self._cache[key] for key in keys]
+
+    def get(self, year, month):
+        """1ヶ月分を返す"""
+        return self.get_window(year, month, 1)[0]
 
 
 class GoalManagementWidget(BaseWidget):
@@ -34,9 +73,19 @@ class GoalManagementWidget(BaseWidget):
         super().__init__(parent)  # BaseWidgetの初期化
         self.current_year, self.current_month = DateHelper.get_current_year_month()
         
+        # 月別の目標・収入・支出（前月/次月への移動で使い回す）
+        self.history_provider = GoalHistoryProvider()
+        
         self.initUI()
         self.load_goals()
         
+        # 目標の進捗は支出・収入・カテゴリの変更で変わる
+        self.watch_changes(ExpenseChanged, IncomeChanged, CategoryChanged)
+    
+    def refresh(self):
+        self.reload_category_combo(self.category_combo)
+        self.update_display()
+        
     def initUI(self):
         layout = QVBoxLayout()
 
@@ -180,23 +229,17 @@ class GoalManagementWidget(BaseWidget):
     
     def update_display(self):
         self.period_label.setText(f'{self.current_year}年{self.current_month}月')
+        # load_goals の中で進捗・カテゴリ表・履歴チャートまで更新される
         self.load_goals()
-        self.update_progress_display()
-        self.update_category_table()
-        self.update_history_chart()
     
     def load_goals(self):
         """データベースから目標設定を読み込む"""
-        conn = sqlite3.connect('budget.db')
-        c = conn.cursor()
-        
         # 月間目標を取得
-        c.execute('''
+        monthly_goal = execute_query('''
             SELECT savings_goal, expense_limit FROM monthly_goals
             WHERE year = ? AND month = ?
-        ''', (self.current_year, self.current_month))
+        ''', (self.current_year, self.current_month), fetch_one=True)
         
-        monthly_goal = c.fetchone()
         if monthly_goal:
             self.savings_goal_input.setText(f"{monthly_goal[0]:,.0f}")
             if monthly_goal[1]:  # expense_limitがNULLでない場合
@@ -207,8 +250,6 @@ class GoalManagementWidget(BaseWidget):
             self.savings_goal_input.clear()
             self.expense_limit_input.clear()
         
-        conn.close()
-        
         # 目標達成状況と実績も更新
         self.update_progress_display()
         self.update_category_table()
@@ -250,18 +291,8 @@ class GoalManagementWidget(BaseWidget):
             if hasattr(self, 'update_history_chart'):
                 self.update_history_chart()
             
-            # 入出金画面の更新（シンプルな方法に修正）
-            try:
-                # メインウィンドウを取得
-                main_app = QApplication.instance()
-                for widget in main_app.topLevelWidgets():
-                    if isinstance(widget, QMainWindow):
-                        if hasattr(widget, 'income_expense_widget'):
-                            if hasattr(widget.income_expense_widget, 'update_goal_progress'):
-                                widget.income_expense_widget.update_goal_progress()
-                                break
-            except Exception as e:
-                print(f"更新処理中にエラー: {e}")
+            # 他の画面に通知（次に表示されたときに再計算される）
+            self.notify_goal_update()
             
         except ValueError:
             QMessageBox.warning(self, '警告', '数値を正しく入力してください')
@@ -298,7 +329,8 @@ class GoalManagementWidget(BaseWidget):
             if hasattr(self, 'update_history_chart'):
                 self.update_history_chart()
             
-            # ...その他の処理...
+            # 他の画面に通知
+            self.notify_goal_update()
             
         except ValueError:
             QMessageBox.warning(self, '警告', '数値を正しく入力してください')
@@ -309,65 +341,41 @@ class GoalManagementWidget(BaseWidget):
     def update_progress_display(self):
         """月間目標の達成状況表示を更新"""
         
-        # 月間目標を取得
-        monthly_goal = execute_query('''
-            SELECT savings_goal, expense_limit FROM monthly_goals
-            WHERE year = ? AND month = ?
-        ''', (self.current_year, self.current_month), fetch_one=True)
-        
-        # 現在の収入を取得
-        income_result = execute_query('''
-            SELECT income FROM monthly_income
-            WHERE year = ? AND month = ?
-        ''', (self.current_year, self.current_month), fetch_one=True)
-        current_income = income_result[0] if income_result else 0
-        
-        # 現在の支出を取得
-        expense_result = execute_query('''
-            SELECT SUM(amount) FROM expenses
-            WHERE strftime('%Y', date) = ? AND strftime('%m', date) = ?
-        ''', (str(self.current_year), f"{self.current_month:02d}"), fetch_one=True)
-        current_expense = expense_result[0] if expense_result and expense_result[0] else 0
+        # 月間目標・収入・支出を取得（目標が無い月は貯蓄目標0・支出上限None）
+        month_data = self.history_provider.get(self.current_year, self.current_month)
+        savings_goal = month_data['savings_goal']
+        expense_limit = month_data['expense_limit']
+        current_expense = month_data['expense']
         
         # 貯蓄額の計算
-        current_savings = current_income - current_expense
+        current_savings = month_data['balance']
+        
+        # 貯蓄目標の達成状況
+        if savings_goal > 0:
+            savings_percentage = min(100, (current_savings / savings_goal) * 100)
+            self.savings_progress.setValue(int(savings_percentage))
+            self.savings_goal_label.setText(
+                f'貯蓄目標: {savings_goal:,.0f} 円中 {current_savings:,.0f} 円 ({savings_percentage:.1f}%)'
+            )
+        else:
+            self.savings_progress.setValue(0)
+            self.savings_goal_label.setText('貯蓄目標: 設定なし')
         
-        # プログレスバーと達成状況の更新
-        if monthly_goal:
-            savings_goal = monthly_goal[0]
-            expense_limit = monthly_goal[1]
-            
-            # 貯蓄目標の達成状況
-            if savings_goal > 0:
-                savings_percentage = min(100, (current_savings / savings_goal) * 100)
-                self.savings_progress.setValue(int(savings_percentage))
-                self.savings_goal_label.setText(
-                    f'貯蓄目標: {savings_goal:,.0f} 円中 {current_savings:,.0f} 円 ({savings_percentage:.1f}%)'
-                )
+        # 支出上限の達成状況
+        if expense_limit:
+            expense_percentage = min(100, (current_expense / expense_limit) * 100)
+            self.expense_progress.setValue(int(expense_percentage))
+            self.expense_limit_label.setText(
+                f'支出上限: {expense_limit:,.0f} 円中 {current_expense:,.0f} 円 ({expense_percentage:.1f}%)'
+            )
+            
+            # 支出が上限を超えている場合は赤色表示
+            if current_expense > expense_limit:
+                self.expense_progress.setStyleSheet("QProgressBar::chunk { background-color: #FF4B4B; }")
             else:
-                self.savings_progress.setValue(0)
-                self.savings_goal_label.setText('貯蓄目標: 設定なし')
-            
-            # 支出上限の達成状況
-            if expense_limit:
-                expense_percentage = min(100, (current_expense / expense_limit) * 100)
-                self.expense_progress.setValue(int(expense_percentage))
-                self.expense_limit_label.setText(
-                    f'支出上限: {expense_limit:,.0f} 円中 {current_expense:,.0f} 円 ({expense_percentage:.1f}%)'
-                )
-                
-                # 支出が上限を超えている場合は赤色表示
-                if current_expense > expense_limit:
-                    self.expense_progress.setStyleSheet("QProgressBar::chunk { background-color: #FF4B4B; }")
-                else:
-                    self.expense_progress.setStyleSheet("")
-            else:
-                self.expense_progress.setValue(0)
-                self.expense_limit_label.setText('支出上限: 設定なし')
+                self.expense_progress.setStyleSheet("")
         else:
-            self.savings_progress.setValue(0)
             self.expense_progress.setValue(0)
-            self.savings_goal_label.setText('貯蓄目標: 設定なし')
             self.expense_limit_label.setText('支出上限: 設定なし')
 
     def update_category_table(self):
@@ -381,11 +389,10 @@ class GoalManagementWidget(BaseWidget):
         
         # カテゴリ別支出を取得
         expenses = execute_query('''
-            SELECT category, SUM(amount) as total_amount 
-            FROM expenses
-            WHERE strftime('%Y', date) = ? AND strftime('%m', date) = ?
-            GROUP BY category
-        ''', (str(self.current_year), f"{self.current_month:02d}"), fetch_all=True)
+            SELECT category, total as total_amount 
+            FROM monthly_category_totals
+            WHERE year = ? AND month = ?
+        ''', (self.current_year, self.current_month), fetch_all=True)
         
         # SQLの結果をディクショナリに変換
         expenses_dict = {category: amount for category, amount in expenses} if expenses else {}
@@ -411,46 +418,20 @@ class GoalManagementWidget(BaseWidget):
     
     def update_history_chart(self):
         """目標達成履歴のチャートを更新"""
-        # 過去6ヶ月分のデータを取得
-        # 開始月と終了月を計算
-        end_date = QDate(self.current_year, self.current_month, 1)
-        start_date = end_date.addMonths(-5)
-        
+        # 過去6ヶ月分のデータを取得（読み込み済みの月はキャッシュから）
         months_data = []
-        current_date = start_date
         
-        while current_date <= end_date:
-            year = current_date.year()
-            month = current_date.month()
-            
-            # その月の目標と実績を取得
-            # 月間目標
-            monthly_goal = execute_query('''
-                SELECT savings_goal, expense_limit FROM monthly_goals
-                WHERE year = ? AND month = ?
-            ''', (year, month), fetch_one=True)
-            
-            savings_goal = monthly_goal[0] if monthly_goal else 0
-            expense_limit = monthly_goal[1] if monthly_goal and monthly_goal[1] else 0
+        for data in self.history_provider.get_window(self.current_year, self.current_month, 6):
+            year = data['year']
+            month = data['month']
             
-            # 収入
-            income_result = execute_query('''
-                SELECT income FROM monthly_income
-                WHERE year = ? AND month = ?
-            ''', (year, month), fetch_one=True)
-            
-            income = income_result[0] if income_result else 0
-            
-            # 支出
-            expense_result = execute_query('''
-                SELECT SUM(amount) FROM expenses
-                WHERE strftime('%Y', date) = ? AND strftime('%m', date) = ?
-            ''', (str(year), f"{month:02d}"), fetch_one=True)
-            
-            expense = expense_result[0] if expense_result and expense_result[0] else 0
+            # その月の目標と実績
+            savings_goal = data['savings_goal']
+            expense_limit = data['expense_limit'] or 0
+            expense = data['expense']
             
             # 実際の貯蓄額
-            actual_savings = income - expense
+            actual_savings = data['balance']
             
             # 貯蓄目標達成率
             savings_achievement = min(100, (actual_savings / savings_goal * 100)) if savings_goal > 0 else 0
@@ -468,8 +449,6 @@ class GoalManagementWidget(BaseWidget):
                 'actual_expense': expense,
                 'expense_achievement': expense_achievement
             })
-            
-            current_date = current_date.addMonths(1)
         
         # チャートの作成
         chart = QChart()
@@ -576,9 +555,4 @@ class GoalManagementWidget(BaseWidget):
 
     def notify_goal_update(self):
         """目標データが更新されたことを他のウィジェットに通知"""
-        try:
-            # 親ウィジェット（BudgetApp）のメソッドを呼び出す
-            if hasattr(self.parent, 'update_goal_data_across_widgets'):
-                self.parent.update_goal_data_across_widgets()
-        except Exception as e:
-            print(f"目標更新通知中にエラー: {e}")    
+        self.publish_change(GoalChanged(self.current_year, self.current_month))    
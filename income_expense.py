@@ -3,7 +3,6 @@
 
 支出の入力・編集・削除、収入登録、各種明細取込の入り口。"""
 from PyQt5.QtWidgets import (
-    QApplication,
     QDialog,
     QMessageBox,
     QPushButton,
@@ -11,8 +10,7 @@ from PyQt5.QtWidgets import (
     QLineEdit,
     QComboBox,
     QDateEdit,
-    QTableWidget,
-    QTableWidgetItem,
+    QTableView,
     QHeaderView,
     QVBoxLayout,
     QHBoxLayout,
@@ -26,17 +24,31 @@ from PyQt5.QtWidgets import (
     QInputDialog
 )
 from PyQt5.QtCore import Qt, QDate
-from PyQt5.QtGui import QFont, QColor
-import sqlite3
+from PyQt5.QtGui import QFont
 import pandas as pd
 import os
 from datetime import datetime
-from db_utils import execute_query, get_categories
+from db_utils import (
+    execute_query, get_categories, get_last_import_date,
+    delete_expenses, recategorize_expenses, shift_expense_dates, insert_expense, update_expense
+)
 from common import DateHelper, BaseWidget, YearMonthDialog, RecurringExpenseDialog
+from events import CategoryChanged, ExpenseChanged, GoalChanged, IncomeChanged
+from expense_query import ExpenseQuery, ALL_CATEGORIES
+from month_summary import MonthSummary
+from query_scheduler import QueryScheduler
+from expense_table_model import (
+    ExpenseTableModel, CategoryDelegate, load_first_page,
+    COLUMN_DATE, COLUMN_CATEGORY, COLUMN_AMOUNT, COLUMN_DESCRIPTION
+)
 from credit_card_import import CreditCardImportDialog
 from pasmo_import import PasmoImportDialog
 
 
+# 検索欄の入力が止まってから一覧を問い合わせるまでの待ち時間（ミリ秒）
+SEARCH_DELAY_MS = 250
+
+
 class IncomeExpenseWidget(BaseWidget):
     '''収入と支出を管理・表示するメインウィジェット'''
     def __init__(self, parent=None):
@@ -45,6 +57,36 @@ class IncomeExpenseWidget(BaseWidget):
         self.initUI()
         self.load_monthly_income()      # ←この行を追加
         self.update_monthly_expense()
+        
+        # 他の画面・取込でのデータ変更を受け取る
+        self.watch_changes(ExpenseChanged, IncomeChanged, GoalChanged, CategoryChanged)
+
+    def is_affected_by(self, event):
+        # 一覧を全期間で表示しているときは、どの月の支出が変わっても表示し直す
+        if isinstance(event, CategoryChanged) or self.is_all_months_scope():
+            return True
+        return event.affects_month(self.current_year, self.current_month)
+
+    def refresh(self):
+        """他の画面での変更を反映して表示を作り直す"""
+        self.reload_category_combo(self.category_input)
+        
+        # フィルターは先頭の「全てのカテゴリ」を残して入れ替える
+        current_filter = self.filter_combo.currentText()
+        self.filter_combo.blockSignals(True)
+        self.filter_combo.clear()
+        self.filter_combo.addItem(ALL_CATEGORIES)
+        self.load_categories_for_filter()
+        index = self.filter_combo.findText(current_filter)
+        if index >= 0:
+            self.filter_combo.setCurrentIndex(index)
+        self.filter_combo.blockSignals(False)
+        
+        self.load_monthly_income()
+        self.update_table()
+        self.update_monthly_expense()
+        if hasattr(self, 'goal_progress_frame'):
+            self.show_goal_progress()
 
     def initUI(self):
         layout = QVBoxLayout()
@@ -108,11 +150,8 @@ class IncomeExpenseWidget(BaseWidget):
         # カテゴリ選択（動的に読み込み）
         self.category_input = QComboBox()
         try:
-            conn = sqlite3.connect('budget.db')
-            c = conn.cursor()
-            c.execute('SELECT name FROM categories ORDER BY sort_order')
-            db_categories = [row[0] for row in c.fetchall()]
-            conn.close()
+            rows = execute_query('SELECT name FROM categories ORDER BY sort_order', fetch_all=True)
+            db_categories = [row[0] for row in rows]
             self.category_input.addItems(db_categories)
             
         except Exception as e:
@@ -143,7 +182,7 @@ class IncomeExpenseWidget(BaseWidget):
         self.search_input = QLineEdit()
         self.search_input.setPlaceholderText('キーワードで検索（説明文・カテゴリ）')
         self.search_input.setClearButtonEnabled(True)
-        self.search_input.textChanged.connect(self.update_expense_table_display)
+        self.search_input.textChanged.connect(self.schedule_expense_table_display)
 
         self.amount_min_input = QLineEdit()
         self.amount_min_input.setPlaceholderText('最小金額')
@@ -168,22 +207,28 @@ class IncomeExpenseWidget(BaseWidget):
 
         # 並び替えオプション
         self.sort_combo = QComboBox()
-        self.sort_combo.addItems(['日付順（新しい順）', '日付順（古い順）', 'カテゴリ別', '金額順（高い順）', '金額順（安い順）'])
+        self.sort_combo.addItems(['日付順（新しい順）', '日付順（古い順）', 'カテゴリ別', '金額順（高い順）', '金額順（安い順）', '関連度順'])
 
         # カテゴリフィルター
         self.filter_combo = QComboBox()
-        self.filter_combo.addItem('全てのカテゴリ')
+        self.filter_combo.addItem(ALL_CATEGORIES)
 
         # 表示件数
         self.limit_combo = QComboBox()
         self.limit_combo.addItems(['50件', '100件', '200件', '全て'])
 
+        # 一覧の対象期間（全期間は検索欄で過去の支出を探す用）
+        self.scope_combo = QComboBox()
+        self.scope_combo.addItems(['表示中の月', '全期間'])
+
         display_layout.addWidget(QLabel('並び替え:'))
         display_layout.addWidget(self.sort_combo)
         display_layout.addWidget(QLabel('カテゴリ:'))
         display_layout.addWidget(self.filter_combo)
         display_layout.addWidget(QLabel('表示件数:'))
         display_layout.addWidget(self.limit_combo)
+        display_layout.addWidget(QLabel('期間:'))
+        display_layout.addWidget(self.scope_combo)
         display_layout.addStretch()
         display_main_layout.addLayout(display_layout)
 
@@ -201,25 +246,43 @@ class IncomeExpenseWidget(BaseWidget):
         self.sort_combo.currentIndexChanged.connect(self.update_expense_table_display)
         self.filter_combo.currentIndexChanged.connect(self.update_expense_table_display)
         self.limit_combo.currentIndexChanged.connect(self.update_expense_table_display)
-
-        # テーブル
-        self.expense_table = QTableWidget(0, 5)
-        self.expense_table.setHorizontalHeaderLabels(['ID', '日付', 'カテゴリ', '金額', '説明'])
+        self.scope_combo.currentIndexChanged.connect(self.update_expense_table_display)
+
+        # テーブル（モデル/ビュー: 画面に見えている行だけが描画される）
+        self.expense_model = ExpenseTableModel(self)
+        self.expense_model.edit_requested.connect(self.on_expense_edited)
+        # 一覧の問い合わせはワーカースレッドで行い、GUIスレッドを止めない
+        self.query_scheduler = QueryScheduler(self)
+        self.expense_model.page_loader = self.load_expense_page
+        self.expense_table = QTableView()
+        self.expense_table.setModel(self.expense_model)
         self.expense_table.horizontalHeader().setSectionResizeMode(QHeaderView.Interactive)
         self.expense_table.horizontalHeader().setStretchLastSection(True)
+        # 行の高さを固定にして、行数が多くても高さの計算で重くならないようにする
+        self.expense_table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
         self.expense_table.setColumnHidden(0, True)
-        self.expense_table.setSelectionMode(QTableWidget.ExtendedSelection)
-        self.expense_table.setEditTriggers(QTableWidget.DoubleClicked | QTableWidget.EditKeyPressed)
-        self.expense_table.setSelectionBehavior(QTableWidget.SelectRows)
+        self.expense_table.setSelectionMode(QTableView.ExtendedSelection)
+        self.expense_table.setEditTriggers(QTableView.DoubleClicked | QTableView.EditKeyPressed)
+        self.expense_table.setSelectionBehavior(QTableView.SelectRows)
+        self.category_delegate = CategoryDelegate(self.expense_table)
+        self.expense_table.setItemDelegateForColumn(COLUMN_CATEGORY, self.category_delegate)
+        # スクロールで読み込まれたページにカテゴリ別の見出し行があれば結合する
+        self.expense_model.rowsInserted.connect(self.apply_group_header_spans)
         
-        # 削除ボタン
+        # 選択した行の削除・一括変更ボタン
+        bulk_layout = QHBoxLayout()
         self.delete_button = QPushButton('選択した行を削除')
         self.delete_button.clicked.connect(self.delete_selected_rows)
-        layout.addWidget(self.delete_button)
+        bulk_layout.addWidget(self.delete_button)
+        self.recategorize_button = QPushButton('カテゴリを一括変更')
+        self.recategorize_button.clicked.connect(self.recategorize_selected_rows)
+        bulk_layout.addWidget(self.recategorize_button)
+        self.shift_date_button = QPushButton('日付を一括変更')
+        self.shift_date_button.clicked.connect(self.shift_selected_dates)
+        bulk_layout.addWidget(self.shift_date_button)
+        layout.addLayout(bulk_layout)
         
         layout.addWidget(self.expense_table)
-        
-        self.expense_table.itemChanged.connect(self.on_table_item_changed)
 
         self.past_recurring_button = QPushButton('過去の定期支払いを登録')
         self.past_recurring_button.clicked.connect(self.register_past_recurring_expenses)
@@ -302,138 +365,84 @@ class IncomeExpenseWidget(BaseWidget):
         self.update_goal_progress()  # 確実に更新するため2回呼び出し
 
     
+    def load_month_summary(self):
+        """表示中の月の収入・支出・目標を読み込み直す"""
+        self.month_summary = MonthSummary.load(self.current_year, self.current_month)
+        return self.month_summary
+
     def update_goal_progress(self):
-        """月間目標の達成状況表示を更新（強化版）"""
+        """月間目標の達成状況表示を更新（DBから読み込み直す）"""
         try:
-            conn = sqlite3.connect('budget.db')
-            c = conn.cursor()
-            
-            # 月間目標を取得
-            c.execute('''
-                SELECT savings_goal, expense_limit FROM monthly_goals
-                WHERE year = ? AND month = ?
-            ''', (self.current_year, self.current_month))
-            
-            monthly_goal = c.fetchone()
+            self.load_month_summary()
+            self.show_goal_progress()
+        except Exception as e:
+            print(f"目標進捗表示の更新中にエラー: {e}")
+
+    def show_goal_progress(self):
+        """読み込み済みの month_summary から月間目標の達成状況を表示する"""
+        summary = self.month_summary
+        current_expense = summary.expense_total
+        current_savings = summary.savings
         
-            # 現在の収入を取得
-            c.execute('''
-                SELECT income FROM monthly_income
-                WHERE year = ? AND month = ?
-            ''', (self.current_year, self.current_month))
-            
-            income_result = c.fetchone()
-            current_income = income_result[0] if income_result else 0
-            
-            # 現在の支出を取得
-            c.execute('''
-                SELECT SUM(amount) FROM expenses
-                WHERE strftime('%Y', date) = ? AND strftime('%m', date) = ?
-            ''', (str(self.current_year), f"{self.current_month:02d}"))
+        # プログレスバーと達成状況の更新
+        if summary.goal:
+            savings_goal, expense_limit = summary.goal
             
-            expense_result = c.fetchone()
-            current_expense = expense_result[0] if expense_result and expense_result[0] else 0
-            
-            conn.close()
-            
-            # 貯蓄額の計算
-            current_savings = current_income - current_expense
+            # 貯蓄目標の達成状況
+            if savings_goal > 0:
+                savings_percentage = min(100, (current_savings / savings_goal) * 100)
+                self.savings_progress.setValue(int(savings_percentage))
+                self.savings_goal_label.setText(
+                    f'貯蓄目標: {savings_goal:,.0f} 円中 {current_savings:,.0f} 円 ({savings_percentage:.1f}%)'
+                )
+            else:
+                self.savings_progress.setValue(0)
+                self.savings_goal_label.setText('貯蓄目標: 設定なし')
             
-            # プログレスバーと達成状況の更新
-            if monthly_goal:
-                savings_goal = monthly_goal[0]
-                expense_limit = monthly_goal[1]
+            # 支出上限の達成状況
+            if expense_limit:
+                expense_percentage = min(100, (current_expense / expense_limit) * 100)
+                self.expense_progress.setValue(int(expense_percentage))
+                self.expense_limit_label.setText(
+                    f'支出上限: {expense_limit:,.0f} 円中 {current_expense:,.0f} 円 ({expense_percentage:.1f}%)'
+                )
                 
-                # 貯蓄目標の達成状況
-                if savings_goal > 0:
-                    savings_percentage = min(100, (current_savings / savings_goal) * 100)
-                    self.savings_progress.setValue(int(savings_percentage))
-                    self.savings_goal_label.setText(
-                        f'貯蓄目標: {savings_goal:,.0f} 円中 {current_savings:,.0f} 円 ({savings_percentage:.1f}%)'
-                    )
+                # 支出が上限を超えている場合は赤色表示
+                if current_expense > expense_limit:
+                    self.expense_progress.setStyleSheet("QProgressBar::chunk { background-color: #FF4B4B; }")
                 else:
-                    self.savings_progress.setValue(0)
-                    self.savings_goal_label.setText('貯蓄目標: 設定なし')
+                    self.expense_progress.setStyleSheet("")
                 
-                # 支出上限の達成状況
-                if expense_limit:
-                    expense_percentage = min(100, (current_expense / expense_limit) * 100)
-                    self.expense_progress.setValue(int(expense_percentage))
-                    self.expense_limit_label.setText(
-                        f'支出上限: {expense_limit:,.0f} 円中 {current_expense:,.0f} 円 ({expense_percentage:.1f}%)'
-                    )
-                    
-                    # 支出が上限を超えている場合は赤色表示
-                    if current_expense > expense_limit:
-                        self.expense_progress.setStyleSheet("QProgressBar::chunk { background-color: #FF4B4B; }")
-                    else:
-                        self.expense_progress.setStyleSheet("")
-                    
-                else:
-                    self.expense_progress.setValue(0)
-                    self.expense_limit_label.setText('支出上限: 設定なし')
             else:
-                self.savings_progress.setValue(0)
                 self.expense_progress.setValue(0)
-                self.savings_goal_label.setText('貯蓄目標: 設定なし')
                 self.expense_limit_label.setText('支出上限: 設定なし')
+        else:
+            self.savings_progress.setValue(0)
+            self.expense_progress.setValue(0)
+            self.savings_goal_label.setText('貯蓄目標: 設定なし')
+            self.expense_limit_label.setText('支出上限: 設定なし')
 
-            # カテゴリ別予算アラートの更新
-            self.update_budget_alerts()
-
-        except Exception as e:
-            print(f"目標進捗表示の更新中にエラー: {e}")
+        # カテゴリ別予算アラートの更新
+        self.update_budget_alerts()
 
     def update_budget_alerts(self):
-        """カテゴリ別予算の超過アラートを表示"""
-        try:
-            # カテゴリ別目標を取得
-            goals = execute_query('''
-                SELECT category, goal_amount FROM category_goals
-                WHERE year = ? AND month = ?
-            ''', (self.current_year, self.current_month), fetch_all=True)
-
-            if not goals:
-                self.budget_alert_label.setVisible(False)
-                return
-
-            # カテゴリ別実績を取得
-            actuals = execute_query('''
-                SELECT category, SUM(amount) FROM expenses
-                WHERE strftime('%Y', date) = ? AND strftime('%m', date) = ?
-                GROUP BY category
-            ''', (str(self.current_year), f"{self.current_month:02d}"), fetch_all=True)
-
-            actual_dict = {row[0]: row[1] for row in actuals} if actuals else {}
-
-            alerts = []
-            for category, goal_amount in goals:
-                if goal_amount <= 0:
-                    continue
-                actual = actual_dict.get(category, 0)
-                ratio = actual / goal_amount * 100
-
-                if ratio >= 100:
-                    alerts.append(f'<span style="color:#D32F2F; font-weight:bold;">[超過] {category}: {actual:,.0f}円 / {goal_amount:,.0f}円 ({ratio:.0f}%)</span>')
-                elif ratio >= 80:
-                    alerts.append(f'<span style="color:#F57F17; font-weight:bold;">[注意] {category}: {actual:,.0f}円 / {goal_amount:,.0f}円 ({ratio:.0f}%)</span>')
-
-            if alerts:
-                self.budget_alert_label.setText('<br>'.join(alerts))
-                self.budget_alert_label.setVisible(True)
+        """カテゴリ別予算の超過アラートを表示（month_summary から計算する）"""
+        alerts = []
+        for category, actual, goal_amount, ratio in self.month_summary.budget_alerts():
+            if ratio >= 100:
+                alerts.append(f'<span style="color:#D32F2F; font-weight:bold;">[超過] {category}: {actual:,.0f}円 / {goal_amount:,.0f}円 ({ratio:.0f}%)</span>')
             else:
-                self.budget_alert_label.setVisible(False)
+                alerts.append(f'<span style="color:#F57F17; font-weight:bold;">[注意] {category}: {actual:,.0f}円 / {goal_amount:,.0f}円 ({ratio:.0f}%)</span>')
 
-        except Exception as e:
-            print(f"予算アラート更新エラー: {e}")
+        if alerts:
+            self.budget_alert_label.setText('<br>'.join(alerts))
+            self.budget_alert_label.setVisible(True)
+        else:
+            self.budget_alert_label.setVisible(False)
 
     def update_expense_in_db(self, expense_id, date, category, amount, description):
         
-        execute_query('''
-            UPDATE expenses
-            SET date = ?, category = ?, amount = ?, description = ?
-            WHERE id = ?
-        ''', (date, category, amount, description, expense_id))
+        update_expense(expense_id, date, category, amount, description)
 
     def delete_expense_from_db(self, expense_id):
         
@@ -468,17 +477,15 @@ class IncomeExpenseWidget(BaseWidget):
             category = self.category_input.currentText()
             description = self.description_input.text()
             
-            # データベース操作を共通関数で置き換え
-            execute_query('''
-                INSERT INTO expenses (date, category, amount, description)
-                VALUES (?, ?, ?, ?)
-            ''', (date, category, amount, description))
+            # データベース操作を共通関数で置き換え（取込の重複判定用の指紋も付ける）
+            insert_expense(date, category, amount, description)
             
             self.amount_input.clear()
             self.description_input.clear()
             
             self.update_table()
             self.update_monthly_expense()
+            self.publish_change(ExpenseChanged(self.date_input.date().year(), self.date_input.date().month()))
             
         except ValueError as e:
             QMessageBox.warning(self, '警告', str(e))
@@ -504,6 +511,9 @@ class IncomeExpenseWidget(BaseWidget):
             
             QMessageBox.information(self, '成功', '収入を保存しました')
             self.calculate_monthly_balance()
+            if hasattr(self, 'goal_progress_frame'):
+                self.update_goal_progress()
+            self.publish_change(IncomeChanged(self.current_year, self.current_month))
             
         except ValueError as e:
             QMessageBox.warning(self, '警告', str(e))
@@ -546,114 +556,83 @@ class IncomeExpenseWidget(BaseWidget):
 
         
 
-    # 新しいメソッドを追加: カテゴリコンボボックスの変更イベントハンドラ
-    def on_category_combo_changed(self, row):
-        if not hasattr(self, 'is_updating') or not self.is_updating:
-            try:
-                combo = self.expense_table.cellWidget(row, 2)
-                expense_id = int(self.expense_table.item(row, 0).text())
-                new_category = combo.currentText()
-                
-                # データベースを更新
-                execute_query('''
-                    UPDATE expenses 
-                    SET category = ?
-                    WHERE id = ?
-                ''', (new_category, expense_id))
-                
-                # 月間支出を更新
-                self.update_monthly_expense()
-                
-            except Exception as e:
-                print(f"カテゴリ更新エラー: {e}")
-                QMessageBox.warning(self, '警告', f'カテゴリの更新に失敗しました: {str(e)}')
-
-    def on_table_item_changed(self, item):
-        if not hasattr(self, 'is_updating') or not self.is_updating:
-            row = item.row()
-            column = item.column()
-            
-            try:
-                # Noneチェックを追加
-                id_item = self.expense_table.item(row, 0)
-                if id_item is None:
-                    return
-                expense_id = int(id_item.text())
-                
-                date_item = self.expense_table.item(row, 1)
-                if date_item is None:
-                    return
-                date = date_item.text()
-                
-                # カテゴリの処理(コンボボックスかテキストか判定)
-                category_widget = self.expense_table.cellWidget(row, 2)
-                if category_widget and isinstance(category_widget, QComboBox):
-                    category = category_widget.currentText()
-                else:
-                    category_item = self.expense_table.item(row, 2)
-                    if category_item is None:
-                        return
-                    category = category_item.text() if category_item else ''
-                
-                # 金額の処理を改善
-                amount_item = self.expense_table.item(row, 3)
-                if amount_item is None:
-                    return
-                amount_text = amount_item.text()
-                
+    def on_expense_edited(self, row, column, value):
+        """テーブルのセルが編集されたときに検証してDBへ保存する"""
+        row_data = self.expense_model.row_data(row)
+        if row_data is None:
+            return
+        expense_id, date, category, amount, description = row_data
+        
+        try:
+            value = str(value)
+            if column == COLUMN_DATE:
+                date = value
+            elif column == COLUMN_CATEGORY:
+                category = value
+            elif column == COLUMN_AMOUNT:
                 # カンマ、空白、円記号、マイナス記号を処理
-                amount_text = amount_text.replace(',', '').replace(' ', '').replace('円', '').replace('−', '-').replace('－', '-')
+                amount_text = value.replace(',', '').replace(' ', '').replace('円', '').replace('−', '-').replace('－', '-')
                 
                 # 空文字列チェック
                 if not amount_text.strip():
                     raise ValueError("金額が入力されていません")
                 
-                amount = float(amount_text)
-                
-                # 金額が負数でない場合は絶対値を使用(支出として記録)
-                if amount < 0:
-                    amount = abs(amount)
-                
-                description_item = self.expense_table.item(row, 4)
-                if description_item is None:
-                    return
-                description = description_item.text()
-                
-                # データベース更新(共通関数を使用)
-                execute_query('''
-                    UPDATE expenses 
-                    SET date = ?, category = ?, amount = ?, description = ?
-                    WHERE id = ?
-                ''', (date, category, amount, description, expense_id))
-                
-                
-                # 表示を更新(金額編集時は少し待つ)
-                if column == 3:  # 金額列の場合
-                    QApplication.processEvents()  # UI更新を待つ
-                
-                self.update_monthly_expense()
-                if hasattr(self, 'update_goal_progress'):
-                    self.update_goal_progress()  # 目標進捗も更新
-                
-            except ValueError as e:
-                print(f"値エラー: {e}")
-                QMessageBox.warning(self, '警告', f'入力値が正しくありません: {str(e)}\n数値を正しく入力してください。')
-                self.update_table()
-            except Exception as e:
-                print(f"予期しないエラー: {e}")
-                import traceback
-                traceback.print_exc()
-                QMessageBox.warning(self, '警告', '変更の保存中にエラーが発生しました。')
-                self.update_table()
+                # 金額が負数の場合は絶対値を使用(支出として記録)
+                amount = abs(float(amount_text))
+            elif column == COLUMN_DESCRIPTION:
+                description = value
+            
+            # データベース更新(共通関数を使用)
+            self.update_expense_in_db(expense_id, date, category, amount, description)
+            new_row = (expense_id, date, category, amount, description)
+            self.expense_model.update_row(row, new_row)
+            
+            # 月間支出・収支・目標進捗は変更前後の差分を足し引きして表示し直す（DBは読み直さない）
+            self.month_summary.apply_edit(row_data, new_row)
+            self.show_monthly_expense()
+            if hasattr(self, 'goal_progress_frame'):
+                self.show_goal_progress()
+            
+            # 日付の編集で別の月へ移ることもあるので月を特定せずに通知する
+            if column == COLUMN_DATE:
+                self.publish_change(ExpenseChanged())
+            else:
+                self.publish_change(ExpenseChanged(self.current_year, self.current_month))
+            
+        except ValueError as e:
+            print(f"値エラー: {e}")
+            QMessageBox.warning(self, '警告', f'入力値が正しくありません: {str(e)}\n数値を正しく入力してください。')
+        except Exception as e:
+            print(f"予期しないエラー: {e}")
+            import traceback
+            traceback.print_exc()
+            QMessageBox.warning(self, '警告', '変更の保存中にエラーが発生しました。')
+            self.update_table()
+
+    def selected_expense_ids(self):
+        """選択された行の支出IDの一覧（見出し行は除く）"""
+        return [self.expense_model.row_data(index.row())[0]
+                for index in self.expense_table.selectionModel().selectedRows()
+                if not self.expense_model.is_header(index.row())]
+
+    def after_bulk_change(self):
+        """一括変更の後の再表示（関係する画面への通知は1回だけ）
+
+        日付の一括変更は別の月へ移し、全期間の表示ではどの月の行も選べるので、
+        月を限らずに通知する。
+        """
+        self.update_table()
+        self.update_monthly_expense()
+        self.publish_change(ExpenseChanged())
 
     def delete_selected_rows(self):
         """選択された支出項目を削除"""
-        selected_rows = set(item.row() for item in self.expense_table.selectedItems())
-        if not selected_rows:
+        expense_ids = self.selected_expense_ids()
+        if not expense_ids:
             return
 
         # 選択された行数に応じてメッセージを変更
-        count = len(selected_rows)
+        count = len(expense_ids)
         if count == 1:
             message = '選択した項目を削除してもよろしいですか？'
         else:
@@ -667,18 +646,58 @@ class IncomeExpenseWidget(BaseWidget):
         )
 
         if reply == QMessageBox.Yes:
-            expense_ids = []
-            # 選択された行のIDを取得
-            for row in sorted(selected_rows, reverse=True):
-                expense_id = int(self.expense_table.item(row, 0).text())
-                expense_ids.append(expense_id)
-            
-            # 一括でデータベースから削除
-            for expense_id in expense_ids:
-                execute_query('DELETE FROM expenses WHERE id = ?', (expense_id,))
-            
-            self.update_table()
-            self.update_monthly_expense()
+            # 1回のトランザクションでまとめて削除する
+            try:
+                delete_expenses(expense_ids)
+            except Exception as e:
+                QMessageBox.critical(self, 'エラー', f'削除中にエラーが発生しました:\n{e}')
+                return
+            self.after_bulk_change()
+
+    def recategorize_selected_rows(self):
+        """選択された支出項目のカテゴリをまとめて変更"""
+        expense_ids = self.selected_expense_ids()
+        if not expense_ids:
+            return
+
+        category, ok = QInputDialog.getItem(
+            self, 'カテゴリを一括変更',
+            f'選択した{len(expense_ids)}件のカテゴリを次に変更します:',
+            get_categories(), 0, False
+        )
+        if not ok or not category:
+            return
+
+        try:
+            changed = recategorize_expenses(category, expense_ids)
+        except Exception as e:
+            QMessageBox.critical(self, 'エラー', f'カテゴリの変更中にエラーが発生しました:\n{e}')
+            return
+        self.after_bulk_change()
+        QMessageBox.information(self, '完了', f'{changed}件のカテゴリを「{category}」に変更しました')
+
+    def shift_selected_dates(self):
+        """選択された支出項目の日付をまとめて前後にずらす"""
+        expense_ids = self.selected_expense_ids()
+        if not expense_ids:
+            return
+
+        days, ok = QInputDialog.getInt(
+            self, '日付を一括変更',
+            f'選択した{len(expense_ids)}件の日付をずらす日数（前にずらすときはマイナス）:',
+            0, -3650, 3650
+        )
+        if not ok or days == 0:
+            return
+
+        try:
+            changed = shift_expense_dates(days, expense_ids)
+        except Exception as e:
+            # 日付が壊れている行があると date() が NULL になり、全部取り消される
+            QMessageBox.critical(self, 'エラー', f'日付の変更中にエラーが発生しました（変更は取り消しました）:\n{e}')
+            return
+        self.after_bulk_change()
+        QMessageBox.information(self, '完了', f'{changed}件の日付を{days:+d}日ずらしました')
 
     def show_recurring_expense_dialog(self):
         """定期支払い管理ダイアログを表示"""
@@ -800,10 +819,7 @@ class IncomeExpenseWidget(BaseWidget):
                     
                 # 支出を記録
                 try:
-                    execute_query('''
-                        INSERT INTO expenses (date, category, amount, description)
-                        VALUES (?, ?, ?, ?)
-                    ''', (date_str, category, amount, f"定期支払い(過去): {description}"))
+                    insert_expense(date_str, category, amount, f"定期支払い(過去): {description}")
                     total_processed += 1
                 except Exception as e:
                     print(f"登録エラー: {e}")
@@ -817,22 +833,19 @@ class IncomeExpenseWidget(BaseWidget):
         # テーブルを更新
         self.update_table()
         self.update_monthly_expense()
+        self.publish_change(ExpenseChanged())
         
         QMessageBox.information(self, "登録完了", f"{total_processed}件の過去の定期支払いを登録しました")
 
     def update_monthly_expense(self):
         """月間支出を計算して表示を更新する"""
-        df = self.get_expenses_as_dataframe()
-        if not df.empty:
-            df['date'] = pd.to_datetime(df['date'])
-            monthly_df = df[
-                (df['date'].dt.year == self.current_year) & 
-                (df['date'].dt.month == self.current_month)
-            ]
-            total_expense = monthly_df['amount'].sum()
-            self.monthly_expense_label.setText(f"{total_expense:,.0f} 円")
-        else:
-            self.monthly_expense_label.setText("0 円")
+        # 集計テーブルから読む（起動直後に支出ストアへ全件を読み込まなくて済むように）
+        self.load_month_summary()
+        self.show_monthly_expense()
+
+    def show_monthly_expense(self):
+        """読み込み済みの month_summary から月間支出と収支を表示する"""
+        self.monthly_expense_label.setText(f"{self.month_summary.expense_total:,.0f} 円")
         
         self.calculate_monthly_balance()
 
@@ -846,13 +859,6 @@ class IncomeExpenseWidget(BaseWidget):
         except ValueError:
             self.monthly_balance_label.setText("0 円")
 
-    def get_expenses_as_dataframe(self):
-        """支出データをDataFrameとして取得する"""
-        conn = sqlite3.connect('budget.db')
-        df = pd.read_sql_query('SELECT * FROM expenses', conn)
-        conn.close()
-        return df     
-
     def _run_import_dialog(self, dialog):
         """取込ダイアログの共通実行処理
 
@@ -862,6 +868,7 @@ class IncomeExpenseWidget(BaseWidget):
         if dialog.exec_() == QDialog.Accepted:
             self.update_table()
             self.update_monthly_expense()
+            self.publish_change(ExpenseChanged())
 
     def show_credit_card_import_dialog(self):
         """クレジットカード明細取込ダイアログを表示"""
@@ -915,15 +922,10 @@ class IncomeExpenseWidget(BaseWidget):
         dialog = CreditCardImportDialog(self)
         dialog.format_combo.setCurrentText('楽天PAY')
 
-        # URLからCSVデータを取得してStep2から開始
-        try:
-            dialog.load_from_url(url)
-            dialog.proceed_to_step2_from_url()
-        except Exception as e:
-            QMessageBox.warning(
-                self, '取得失敗',
-                f'URLからのデータ取得に失敗しました:\n{str(e)}\n\nファイル選択に切り替えます。'
-            )
+        # URLからCSVデータを取得してStep2から開始（取得は裏で行い、失敗したらファイル選択に切り替わる）
+        # 前回取り込んだ日以降の行だけを読む（その日の取り込み済みの明細は重複判定で除かれる）
+        since = get_last_import_date(dialog.current_format['description_prefix'])
+        dialog.start_url_load(url, since)
 
         self._run_import_dialog(dialog)
 
@@ -940,11 +942,8 @@ class IncomeExpenseWidget(BaseWidget):
     def load_categories_for_filter(self):
         """フィルター用のカテゴリを読み込む"""
         try:
-            conn = sqlite3.connect('budget.db')
-            c = conn.cursor()
-            c.execute('SELECT name FROM categories ORDER BY sort_order')
-            categories = [row[0] for row in c.fetchall()]
-            conn.close()
+            rows = execute_query('SELECT name FROM categories ORDER BY sort_order', fetch_all=True)
+            categories = [row[0] for row in rows]
             
             for category in categories:
                 self.filter_combo.addItem(category)
@@ -952,287 +951,123 @@ class IncomeExpenseWidget(BaseWidget):
             print(f"カテゴリ読み込みエラー: {e}")
 
     def load_current_month_expenses(self):
-        """現在の月の支出データを読み込む（デバッグ強化版）"""
+        """現在の月の支出データを読み込む"""
+        # 絞り込み・並び替え・件数の制限は update_expense_table_display でSQLに任せる
+        self.update_expense_table_display()
+
+    def is_all_months_scope(self):
+        """支出一覧を全期間で表示しているかどうか"""
+        return self.scope_combo.currentText() == '全期間'
+
+    @staticmethod
+    def _parse_amount_filter(line_edit):
+        """金額範囲の入力欄を数値にする（空欄や数値でなければ None）"""
+        text = line_edit.text().replace(',', '').strip()
         try:
-            
-            conn = sqlite3.connect('budget.db')
-            c = conn.cursor()
-            
-            # まず全データを確認
-            c.execute('SELECT COUNT(*) FROM expenses')
-            total_count = c.fetchone()[0]
-            
-            # 今月のデータを確認
-            c.execute('''
-                SELECT COUNT(*) FROM expenses
-                WHERE strftime('%Y', date) = ? AND strftime('%m', date) = ?
-            ''', (str(self.current_year), f"{self.current_month:02d}"))
-            
-            month_count = c.fetchone()[0]
-            
-            # 実際のデータを取得
-            c.execute('''
-                SELECT id, date, category, amount, description
-                FROM expenses
-                WHERE strftime('%Y', date) = ? AND strftime('%m', date) = ?
-                ORDER BY date DESC, id DESC
-            ''', (str(self.current_year), f"{self.current_month:02d}"))
-            
-            self.current_expense_data = c.fetchall()
-            conn.close()
-            
-            
-            # データ内容を詳細表示
-            if self.current_expense_data:
-                for i, row in enumerate(self.current_expense_data):
-                    pass
-            else:
-                # 他の月のデータがあるか確認
-                conn = sqlite3.connect('budget.db')
-                c = conn.cursor()
-                c.execute('SELECT DISTINCT strftime("%Y-%m", date) FROM expenses ORDER BY date DESC LIMIT 5')
-                other_months = c.fetchall()
-                conn.close()
-                for month in other_months:
-                    pass
-            
-            # 表示更新
-            self.update_expense_table_display()
-            
-        except Exception as e:
-            print(f"load_current_month_expenses エラー: {e}")
-            import traceback
-            traceback.print_exc()
+            return float(text) if text else None
+        except ValueError:
+            return None
+
+    def current_expense_query(self):
+        """表示設定（検索・カテゴリ・金額範囲・並び替え・件数・期間）から検索条件を作る"""
+        limit_text = self.limit_combo.currentText()
+        all_months = self.is_all_months_scope()
+        return ExpenseQuery(
+            year=None if all_months else self.current_year,
+            month=None if all_months else self.current_month,
+            category=self.filter_combo.currentText(),
+            keyword=self.search_input.text(),
+            amount_min=self._parse_amount_filter(self.amount_min_input),
+            amount_max=self._parse_amount_filter(self.amount_max_input),
+            sort=self.sort_combo.currentText(),
+            limit=None if limit_text == '全て' else int(limit_text.replace('件', '')),
+        )
 
     def update_expense_table_display(self):
-        """支出テーブルの表示を更新(安全版)"""
-        try:
-            
-            # is_updatingフラグを設定
-            self.is_updating = True
-            
-            # 全ての必要なウィジェットが存在します
-            
-            # データ読み込み開始
-            
-            # データベースから支出データを取得
-            query = '''
-                SELECT id, date, category, amount, description
-                FROM expenses
-                WHERE strftime('%Y', date) = ? AND strftime('%m', date) = ?
-            '''
-            
-            month_str = f'{self.current_month:02d}'
-            all_data = execute_query(query, (str(self.current_year), month_str), fetch_all=True)
-            
-            
-            if all_data:
-                for i, row in enumerate(all_data[:5]):  # 最初の5件だけ表示
-                    pass
-            
-            # フィルタリング処理
-            selected_category = self.filter_combo.currentText()
-
-            filtered_data = all_data
-            if selected_category != '全てのカテゴリ':
-                filtered_data = [row for row in filtered_data if row[2] == selected_category]
-
-            # キーワード検索フィルター
-            search_text = self.search_input.text().strip().lower()
-            if search_text:
-                filtered_data = [row for row in filtered_data
-                                 if search_text in (row[2] or '').lower() or search_text in (row[4] or '').lower()]
-
-            # 金額範囲フィルター
-            amount_min_text = self.amount_min_input.text().replace(',', '').strip()
-            amount_max_text = self.amount_max_input.text().replace(',', '').strip()
-            if amount_min_text:
-                try:
-                    amount_min = float(amount_min_text)
-                    filtered_data = [row for row in filtered_data if row[3] >= amount_min]
-                except ValueError:
-                    pass
-            if amount_max_text:
-                try:
-                    amount_max = float(amount_max_text)
-                    filtered_data = [row for row in filtered_data if row[3] <= amount_max]
-                except ValueError:
-                    pass
-            
-            # 並び替えオプション
-            sort_option = self.sort_combo.currentText()
-
-            if sort_option == '日付順（新しい順）':  # 全角括弧に変更
-                filtered_data = sorted(filtered_data, key=lambda x: x[1], reverse=True)
-            elif sort_option == '日付順（古い順）':  # 全角括弧に変更
-                filtered_data = sorted(filtered_data, key=lambda x: x[1])
-            elif sort_option == 'カテゴリ別':
-                self.is_updating = False
-                self.display_expenses_grouped_by_category(filtered_data)
-                return
-            elif sort_option == '金額順（高い順）':  # 全角括弧に変更
-                filtered_data = sorted(filtered_data, key=lambda x: x[3], reverse=True)
-            elif sort_option == '金額順（安い順）':  # 全角括弧に変更
-                filtered_data = sorted(filtered_data, key=lambda x: x[3])
-            else:
-                pass
-            
-            # 表示件数制限
-            limit_text = self.limit_combo.currentText()
-            
-            if limit_text != '全て':
-                limit = int(limit_text.replace('件', ''))
-                filtered_data = filtered_data[:limit]
-            
-            
-            # ここからが重要な修正部分
-            # テーブルに安全にデータを設定
-            if filtered_data:
-                self.expense_table.setRowCount(len(filtered_data))
-                
-                # **データベースからカテゴリリストを取得**
-                try:
-                    conn = sqlite3.connect('budget.db')
-                    c = conn.cursor()
-                    c.execute('SELECT name FROM categories ORDER BY sort_order')
-                    categories = [row[0] for row in c.fetchall()]
-                    conn.close()
-                except Exception as e:
-                    print(f"カテゴリ取得エラー: {e}")
-                    categories = get_categories()
-                
-                for row, row_data in enumerate(filtered_data):
-                    if not row_data or len(row_data) < 5:
-                        continue
-                        
-                    try:
-                        expense_id, date, category, amount, description = row_data
-                        
-                        # 安全に文字列に変換
-                        safe_id = str(expense_id or '')
-                        safe_date = str(date or '')
-                        safe_category = str(category or '')
-                        safe_amount = float(amount or 0)
-                        safe_description = str(description or '')
-                        
-                        # IDカラム
-                        self.expense_table.setItem(row, 0, QTableWidgetItem(safe_id))
-                        
-                        # 日付カラム
-                        self.expense_table.setItem(row, 1, QTableWidgetItem(safe_date))
-                        
-                        # **カテゴリ列にコンボボックスを設定**
-                        category_combo = QComboBox()
-                        category_combo.addItems(categories)
-                        current_index = category_combo.findText(safe_category)
-                        if current_index >= 0:
-                            category_combo.setCurrentIndex(current_index)
-                        
-                        # コンボボックスの変更イベントを接続
-                        category_combo.currentIndexChanged.connect(
-                            lambda idx, r=row: self.on_category_combo_changed(r)
-                        )
-                        
-                        self.expense_table.setCellWidget(row, 2, category_combo)
-                        
-                        # 金額カラム
-                        amount_item = QTableWidgetItem(f"{safe_amount:,.0f}円")
-                        amount_item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
-                        self.expense_table.setItem(row, 3, amount_item)
-                        
-                        # 説明カラム
-                        self.expense_table.setItem(row, 4, QTableWidgetItem(safe_description))
-                        
-                        if row < 5:  # 最初の5行だけログ出力
-                            pass
-                            
-                    except Exception as e:
-                        print(f"行{row}のデータ設定エラー: {e}")
-                        continue
-                
-            else:
-                self.expense_table.setRowCount(0)
+        """支出テーブルの表示を更新
 
-            # カテゴリ合計を更新
-            self.update_category_total_label(filtered_data, selected_category)
+        問い合わせはワーカースレッドで行い、結果が届いたら（最新の表示設定の分だけ）表示する。
+        最初の1ページだけ読み込み、続きはスクロールに合わせてモデルが読み込む。
+        """
+        self._request_expense_table(delay_ms=0)
 
-            self.is_updating = False
-            
+    def schedule_expense_table_display(self):
+        """検索欄の入力中用: 入力が SEARCH_DELAY_MS 止まってから表示を更新する"""
+        self._request_expense_table(delay_ms=SEARCH_DELAY_MS)
+
+    def _request_expense_table(self, delay_ms):
+        try:
+            query = self.current_expense_query()
         except Exception as e:
-            self.is_updating = False
             print(f"update_expense_table_display 全体エラー: {e}")
-            import traceback
-            traceback.print_exc()
+            return
+        # 前の表示設定の続きのページはもう要らない
+        self.query_scheduler.cancel('expense_page')
+        self.query_scheduler.schedule(
+            'expense_table',
+            lambda: self._load_expense_table(query),
+            lambda result: self._show_expense_table(query, result),
+            delay_ms=delay_ms,
+        )
 
-    def display_expenses_grouped_by_category(self, data):
-        """カテゴリ別にグループ化して表示"""
-        grouped_data = {}
-        for row in data:
-            category = row[2]
-            if category not in grouped_data:
-                grouped_data[category] = []
-            grouped_data[category].append(row)
-        
-        total_rows = sum(len(items) + 1 for items in grouped_data.values())
-        self.expense_table.setRowCount(total_rows)
-        
-        current_row = 0
-        for category, items in grouped_data.items():
-            category_total = sum(item[3] for item in items)
-            header_item = QTableWidgetItem(f"【{category}】 ({len(items)}件、合計: {category_total:,.0f}円)")
-            header_item.setBackground(QColor("#E3F2FD"))
-            header_item.setFont(QFont("", weight=QFont.Bold))
-            
-            self.expense_table.setItem(current_row, 0, QTableWidgetItem(""))
-            self.expense_table.setItem(current_row, 1, QTableWidgetItem(""))
-            self.expense_table.setItem(current_row, 2, header_item)
-            self.expense_table.setItem(current_row, 3, QTableWidgetItem(""))
-            self.expense_table.setItem(current_row, 4, QTableWidgetItem(""))
-            self.expense_table.setSpan(current_row, 1, 1, 4)
-            current_row += 1
-            
-            for row_data in items:
-                exp_id, date, category, amount, description = row_data
-                self.expense_table.setItem(current_row, 0, QTableWidgetItem(str(exp_id)))
-                self.expense_table.setItem(current_row, 1, QTableWidgetItem(date))
-                self.expense_table.setItem(current_row, 2, QTableWidgetItem(category))
-                self.expense_table.setItem(current_row, 3, QTableWidgetItem(f"{amount:,.0f}円"))
-                self.expense_table.setItem(current_row, 4, QTableWidgetItem(description))
-                current_row += 1
-
-        # カテゴリ合計を更新（カテゴリ別表示の場合は全体の合計を表示）
-        selected_category = self.filter_combo.currentText()
-        self.update_category_total_label(data, selected_category)
-
-    def update_category_total_label(self, data, selected_category):
-        """カテゴリ別合計ラベルを更新"""
-        try:
-            if not data or selected_category == '全てのカテゴリ':
-                self.category_total_label.setText('')
-                return
+    @staticmethod
+    def _load_expense_table(query):
+        """一覧の最初のページとカテゴリ合計を読み込む（ワーカースレッドで実行）"""
+        summary = query.summary() if query.category else None
+        return load_first_page(query), summary
+
+    def _show_expense_table(self, query, result):
+        first_page, summary = result
+        self.expense_table.clearSpans()
+        self.expense_model.set_result(query, *first_page)
+        self.apply_group_header_spans()
+
+        # カテゴリ合計を更新
+        self.update_category_total_label(query.category, summary)
+
+    def load_expense_page(self, query, offset, limit, callback):
+        """スクロールで必要になった続きのページをワーカースレッドで読み込む（モデルの page_loader）"""
+        def on_error(message):
+            print(f"支出一覧の読み込みエラー: {message}")
+            callback([])  # 読み込みを打ち切る
+
+        self.query_scheduler.schedule(
+            'expense_page', lambda: query.fetch_page(offset, limit), callback, error_callback=on_error
+        )
 
-            total_amount = sum(row[3] for row in data if row[3])
-            item_count = len(data)
+    def apply_group_header_spans(self, parent=None, first=0, last=None):
+        """カテゴリ別表示の見出し行を、日付〜説明の列を結合した1行にする"""
+        column_count = self.expense_model.columnCount() - COLUMN_DATE
+        for row in self.expense_model.header_rows(first, last):
+            self.expense_table.setSpan(row, COLUMN_DATE, 1, column_count)
 
-            self.category_total_label.setText(
-                f'【{selected_category}】 合計: {total_amount:,.0f}円 ({item_count}件)'
-            )
-        except Exception as e:
-            print(f"カテゴリ合計表示エラー: {e}")
+    def update_category_total_label(self, category, summary):
+        """カテゴリ別合計ラベルを更新
+
+        summary は表示件数の制限に関係なく条件に合う全件の (件数, 合計金額)。
+        カテゴリで絞り込んでいないときは None。
+        """
+        if category is None or not summary or summary[0] == 0:
             self.category_total_label.setText('')
+            return
+
+        item_count, total_amount = summary
+        self.category_total_label.setText(
+            f'【{category}】 合計: {total_amount:,.0f}円 ({item_count}件)'
+        )
 
     def export_to_excel(self):
         """現在の月のデータをCSVファイルにエクスポート"""
         try:
             # データベースから現在月のデータを取得
-            query = '''
+            where, params = DateHelper.month_filter(self.current_year, self.current_month)
+            query = f'''
                 SELECT date, category, amount, description
                 FROM expenses
-                WHERE strftime('%Y', date) = ? AND strftime('%m', date) = ?
+                WHERE {where}
                 ORDER BY date
             '''
-            month_str = f'{self.current_month:02d}'
-            data = execute_query(query, (str(self.current_year), month_str), fetch_all=True)
+            data = execute_query(query, params, fetch_all=True)
 
             if not data:
                 QMessageBox.information(self, 'エクスポート', 'エクスポートするデータがありません。')
@@ -1359,43 +1194,6 @@ class IncomeExpenseWidget(BaseWidget):
         except Exception as e:
             QMessageBox.critical(self, 'エラー', f'PDFエクスポート中にエラーが発生しました:\n{e}')
 
-    def display_expenses_normal_table(self, data):
-        """通常のテーブル表示（デバッグ強化版）"""
-        try:
-            
-            if self.expense_table is None:
-                return
-                
-            
-            # スパンをクリア
-            self.expense_table.clearSpans()
-            
-            if not data:
-                return
-            
-            for row, row_data in enumerate(data):
-                if not row_data or len(row_data) < 5:
-                    continue
-                    
-                try:
-                    exp_id, date, category, amount, description = row_data
-                    
-                    
-                    # 安全にアイテムを設定
-                    self.expense_table.setItem(row, 0, QTableWidgetItem(str(exp_id or '')))
-                    self.expense_table.setItem(row, 1, QTableWidgetItem(str(date or '')))
-                    self.expense_table.setItem(row, 2, QTableWidgetItem(str(category or '')))
-                    self.expense_table.setItem(row, 3, QTableWidgetItem(f"{amount or 0:,.0f}円"))
-                    self.expense_table.setItem(row, 4, QTableWidgetItem(str(description or '')))
-                    
-                    
-                except Exception as e:
-                    print(f"❌ 行 {row} の設定エラー: {e}")
-                    
-                    
-        except Exception as e:
-            print(f"❌ display_expenses_normal_table エラー: {e}")
-         
     def show_prev_month(self):
         self.current_year, self.current_month = DateHelper.get_prev_month(self.current_year, self.current_month)
         self.period_label.setText(f'{self.current_year}年{self.current_month}月')
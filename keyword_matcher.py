@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""複数キーワードの一括照合（Aho–Corasick法）
+
+明細取込のカテゴリ振り分け・除外キーワードは、以前は説明文1件ごとに全てのキーワードを
+順に `keyword in text` で調べていたため、マッピングが数百件あると
+「明細の行数 × キーワード数」回の文字列検索になっていた。
+KeywordMatcher はキーワードを最初に1回だけ木（トライ）にまとめておき、
+説明文を先頭から1回なぞるだけで、含まれているキーワードを全て見つける。
+
+キーワードが複数含まれているときは、登録した順で先のもの（「最初に当てはまったキーワード」）を優先する。
+これは以前の「キーワードを先頭から順に調べて最初に見つかったもの」と同じ結果になる。
+全角/半角・大文字/小文字をそろえる処理はしないので、呼び出し側でそろえてから渡す。
+
+使い方:
+    matcher = KeywordMatcher({'ﾏﾙｴﾂ': '食費', 'ｽｲﾄﾞｳ': '水道光熱費'})
+    matcher.match('ﾏﾙｴﾂ 新宿店', default='その他')   # → '食費'
+"""
+from collections import deque
+
+
+class KeywordMatcher:
+    """(キーワード, 値) の一覧から作る照合器
+
+    items は {キーワード: 値} の辞書か、(キーワード, 値) の並び。先に書いたものほど優先される。
+    空文字のキーワードはどの文字列にも含まれるものとして扱う（`'' in text` と同じ）。
+    """
+
+    def __init__(self, items):
+        if isinstance(items, dict):
+            items = items.items()
+        self.values = []
+        # ノードごとの 次の文字→ノード番号 / 失敗時の戻り先 / そのノードで見つかるキーワードの最優先の番号
+        self._goto = [{}]
+        self._fail = [0]
+        self._best = [None]
+
+        for index, (keyword, value) in enumerate(items):
+            self.values.append(value)
+            node = 0
+            for char in keyword:
+                next_node = self._goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self._goto)
+                    self._goto[node][char] = next_node
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._best.append(None)
+                node = next_node
+            if self._best[node] is None:  # 同じキーワードが2回あれば先のものを使う
+                self._best[node] = index
+
+        # 浅いノードから順に失敗時の戻り先を決め、戻り先で見つかるキーワードも引き継ぐ
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            self._best[node] = self._min(self._best[node], self._best[self._fail[node]])
+            for char, child in self._goto[node].items():
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                queue.append(child)
+
+    @staticmethod
+    def _min(a, b):
+        if a is None:
+            return b
+        if b is None:
+            return a
+        return min(a, b)
+
+    def __len__(self):
+        return len(self.values)
+
+    def first_index(self, text):
+        """text に含まれるキーワードのうち、一番先に登録したものの番号（無ければ None）"""
+        goto, fail, best_of = self._goto, self._fail, self._best
+        best = best_of[0]
+        if best == 0:
+            return best
+        node = 0
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            found = best_of[node]
+            if found is not None and (best is None or found < best):
+                best = found
+                if best == 0:
+                    break  # これより優先されるキーワードは無い
+        return best
+
+    def match(self, text, default=None):
+        """text に含まれるキーワードのうち、一番先に登録したものの値（無ければ default）"""
+        index = self.first_index(text)
+        return default if index is None else self.values[index]
@@ -2,8 +2,14 @@
 """メインウィンドウ
 
 全画面の生成・ナビゲーション・DB初期化・自動バックアップを担当する。"""
-from PyQt5.QtWidgets import QMainWindow, QMessageBox, QStackedWidget, QAction
-from db_utils import execute_query, execute_many, get_categories
+import time
+from PyQt5.QtWidgets import QMainWindow, QMessageBox, QStackedWidget, QAction, QWidget
+from PyQt5.QtCore import QTimer
+from db_utils import (
+    close_db_connection, execute_query, execute_many,
+    rebuild_monthly_category_totals, rebuild_search_index, search_index_available, sync_search_index,
+    ensure_expense_fingerprints, init_expense_change_log, init_monthly_category_totals
+)
 from backup import BackupManager, BackupSettingsDialog, BackupManagerDialog
 from category_management import CategoryManagementDialog
 from income_expense import IncomeExpenseWidget
@@ -13,12 +19,35 @@ from goal_management import GoalManagementWidget
 from diagnostic_report import DiagnosticReportWidget
 from comprehensive_analysis import ComprehensiveAnalysisWidget
 from asset_management import AssetManagementWidget
+from events import get_event_bus, ExpenseChanged
+from expense_store import close_expense_store
+
+
+# 画面の一覧（名前, クラス, 表示名）。並び順が QStackedWidget 内の順番になる。
+# self.<名前>_widget で各画面を参照でき、ナビゲーションボタンは <名前>_button。
+SCREENS = [
+    ('income_expense', IncomeExpenseWidget, '入出金'),
+    ('breakdown', BreakdownWidget, '収支内訳'),
+    ('monthly_report', MonthlyReportWidget, '月次収支'),
+    ('goal_management', GoalManagementWidget, '目標管理'),
+    ('diagnostic_report', DiagnosticReportWidget, '診断レポート'),
+    ('comprehensive_analysis', ComprehensiveAnalysisWidget, '全データ分析'),
+    ('asset_management', AssetManagementWidget, '資産管理'),
+]
+
+# 起動時に作る画面（最初に表示される画面）。それ以外は初めて開いたときに作る
+INITIAL_SCREEN = 'income_expense'
 
 
 class BudgetApp(QMainWindow):
     def __init__(self):
         super().__init__()
+        # 起動にかかった時間の記録 [(項目, ミリ秒), ...]（起動時間レポート用）
+        self.startup_timings = []
+        started = time.perf_counter()
+        
         self.init_database()
+        self._record_timing('DB初期化', started)
         # self.initUI()  # 古いメソッドをコメントアウト
         
         # バックアップマネージャーの初期化
@@ -26,12 +55,32 @@ class BudgetApp(QMainWindow):
         
         self.enhanced_init_ui()  # 新しいメソッドを呼び出す
         
-        # 目標データを読み込む（追加）
-        if hasattr(self, 'goal_management_widget'):
-            self.goal_management_widget.load_goals()    
+        self._record_timing('起動合計', started)
         
         # アプリ起動時の自動バックアップ
+        # DBが大きいとコピーに時間がかかるので、ウィンドウを表示してから実行する
+        QTimer.singleShot(0, self.run_startup_backup)
+
+    def run_startup_backup(self):
+        """起動直後の自動バックアップ（かかった時間も起動時間レポートに記録する）"""
+        started = time.perf_counter()
         self.check_auto_backup()
+        self._record_timing('自動バックアップ（表示後）', started)
+
+    def _record_timing(self, label, started):
+        """started（time.perf_counter() の値）からの経過時間を記録する"""
+        self.startup_timings.append((label, (time.perf_counter() - started) * 1000))
+
+    def startup_report(self):
+        """起動時間・画面ごとの初回作成時間の一覧を文字列で返す"""
+        lines = ['起動時間レポート']
+        for label, ms in self.startup_timings:
+            lines.append(f'  {label}: {ms:.1f} ms')
+        return '\n'.join(lines)
+
+    def show_startup_report(self):
+        """起動時間レポートを表示"""
+        QMessageBox.information(self, '起動時間レポート', self.startup_report())
 
     def closeEvent(self, event):
             """アプリケーション終了時の処理"""
@@ -41,13 +90,19 @@ class BudgetApp(QMainWindow):
                 # self.goal_management_widget.save_goals()
                 pass
             
+            # バックグラウンドの問い合わせを止めてから、使い回していたDB接続を閉じる
+            if hasattr(self, 'income_expense_widget'):
+                self.income_expense_widget.query_scheduler.shutdown()
+            close_expense_store()
+            close_db_connection()
+            
             # 親クラスのcloseEventを呼び出す
             super().closeEvent(event)
 
 
     def switch_to_breakdown(self):
-        self.breakdown_widget.update_display()
-        self.stacked_widget.setCurrentWidget(self.breakdown_widget)
+        # 表示し直す必要があれば showEvent で再計算される
+        self.show_screen('breakdown')
 
     def init_database(self):
         
@@ -165,7 +220,77 @@ class BudgetApp(QMainWindow):
 
         # 支出テーブルのインデックス（検索・フィルター高速化）
         execute_query('CREATE INDEX IF NOT EXISTS idx_expenses_date ON expenses(date)')
-        execute_query('CREATE INDEX IF NOT EXISTS idx_expenses_category ON expenses(category)')
+        # カテゴリで絞り込んで日付順に並べる一覧用（category 単独のインデックスはこれで代用できる）
+        execute_query('DROP INDEX IF EXISTS idx_expenses_category')
+        execute_query('CREATE INDEX IF NOT EXISTS idx_expenses_category_date ON expenses(category, date)')
+        # 全期間の一覧を金額順に並べるとき用
+        execute_query('CREATE INDEX IF NOT EXISTS idx_expenses_amount ON expenses(amount)')
+
+        # 月別・カテゴリ別の支出集計テーブルと、それを差分で更新するトリガー
+        init_monthly_category_totals()
+
+        # 支出の変更ログ（メモリ上の支出ストアが差分だけ読み直すために使う）
+        # 起動時に空にする（ストアは最初に全件を読み込むので、前回までのログは使わない）
+        init_expense_change_log()
+
+        # 取込の重複判定用の指紋列（日付・金額・説明文のハッシュ、UNIQUE インデックス付き）
+        ensure_expense_fingerprints()
+
+        # 支出の全文検索インデックス（説明文・カテゴリのキーワード検索用）
+        # trigram は3文字ずつに区切って索引を作るので、日本語の部分一致にも使える。
+        # 全角/半角の違いで見つからないことがないよう normalize_text（db_utils）でそろえた文字列を入れる。
+        # normalize_text はアプリの接続にしか無いので、トリガーでは変わった支出のIDを
+        # expenses_fts_pending に記録するだけにし、索引への反映は db_utils.sync_search_index で行う
+        # （sqlite3 コマンドなどアプリ外からの書き込みも失敗せず、次の起動時に索引に入る）
+        search_index_exists = execute_query(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name='expenses_fts'",
+            fetch_one=True
+        )
+        try:
+            execute_query('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS expenses_fts
+                USING fts5(description, category, tokenize='trigram')
+            ''')
+        except Exception as e:
+            # FTS5 が使えない SQLite ではキーワード検索を LIKE の部分一致で行う（expense_query.py）
+            QMessageBox.warning(
+                self, '全文検索インデックス作成エラー',
+                f'全文検索インデックスを作成できませんでした。\n\n{e}\n\n'
+                'キーワード検索は使えますが、支出が多いと遅くなります。'
+            )
+        else:
+            execute_query('''
+                CREATE TABLE IF NOT EXISTS expenses_fts_pending (
+                    expense_id INTEGER PRIMARY KEY
+                )
+            ''')
+            # 以前のトリガーは normalize_text を呼んでいたので作り直す
+            execute_query('DROP TRIGGER IF EXISTS trg_expenses_fts_insert')
+            execute_query('DROP TRIGGER IF EXISTS trg_expenses_fts_update')
+            execute_query('''
+                CREATE TRIGGER IF NOT EXISTS trg_expenses_fts_queue_insert
+                AFTER INSERT ON expenses
+                BEGIN
+                    INSERT OR IGNORE INTO expenses_fts_pending (expense_id) VALUES (NEW.id);
+                END
+            ''')
+            execute_query('''
+                CREATE TRIGGER IF NOT EXISTS trg_expenses_fts_queue_update
+                AFTER UPDATE OF id, description, category ON expenses
+                BEGIN
+                    DELETE FROM expenses_fts WHERE rowid = OLD.id;
+                    INSERT OR IGNORE INTO expenses_fts_pending (expense_id) VALUES (NEW.id);
+                END
+            ''')
+            execute_query('''
+                CREATE TRIGGER IF NOT EXISTS trg_expenses_fts_delete
+                AFTER DELETE ON expenses
+                BEGIN DELETE FROM expenses_fts WHERE rowid = OLD.id; END
+            ''')
+            if not search_index_exists:
+                rebuild_search_index()
+            else:
+                sync_search_index()  # 前回の終了後にアプリ外から書き込まれた支出
 
         # デフォルトカテゴリの追加（まだデータがない場合）
         category_count = execute_query('SELECT COUNT(*) FROM categories', fetch_one=True)
@@ -195,50 +320,16 @@ class BudgetApp(QMainWindow):
         # メインウィジェットとしてQStackedWidgetを使用
         self.stacked_widget = QStackedWidget()
         
-        # ウィジェット情報の定義
-        widget_classes = {
-            'income_expense': IncomeExpenseWidget,
-            'breakdown': BreakdownWidget,
-            'monthly_report': MonthlyReportWidget,
-            'goal_management': GoalManagementWidget,
-            'diagnostic_report': DiagnosticReportWidget,
-            'comprehensive_analysis': ComprehensiveAnalysisWidget,
-            'asset_management': AssetManagementWidget  # ←この行があるか確認
-        }
-
-        # ウィジェットの作成と追加を同時に行う
-        for name, widget_class in widget_classes.items():
-            widget = widget_class(self)
-            setattr(self, f"{name}_widget", widget)  # self.name_widget = widget の動的版
-            self.stacked_widget.addWidget(widget)
-
-        self.widgets = {
-            'income_expense': self.income_expense_widget,
-            'breakdown': self.breakdown_widget,
-            'monthly_report': self.monthly_report_widget,
-            'goal_management': self.goal_management_widget,
-            'diagnostic_report': self.diagnostic_report_widget,
-            'comprehensive_analysis': self.comprehensive_analysis_widget  # ←追加
-        }
-
-        # ナビゲーションボタンを接続
-        self.connect_navigation_buttons()
-        
-        # 目標達成状況表示を入出金画面に追加
-        self.income_expense_widget.add_goal_progress_to_income_expense()
-        
+        # 画面は初めて開いたときに作る（起動時間がDBの大きさに左右されないように）。
+        # まだ作っていない画面の位置には空のウィジェットを置いておき、作ったら差し替える
+        self.screen_classes = {name: (widget_class, title) for name, widget_class, title in SCREENS}
+        self.placeholders = {}
+        for name, _, _ in SCREENS:
+            placeholder = QWidget()
+            self.placeholders[name] = placeholder
+            self.stacked_widget.addWidget(placeholder)
         
-        # 目標データを読み込む
-        if hasattr(self, 'goal_management_widget'):
-            self.goal_management_widget.load_goals()
-        
-        # 入出金画面の目標進捗を更新
-        if hasattr(self, 'income_expense_widget') and hasattr(self.income_expense_widget, 'update_goal_progress'):
-            self.income_expense_widget.update_goal_progress()
-        
-        # 収支内訳画面を更新
-        if hasattr(self, 'breakdown_widget') and hasattr(self.breakdown_widget, 'update_display'):
-            self.breakdown_widget.update_display()
+        self.show_screen(INITIAL_SCREEN)
         
         # メニューバーを追加
         menubar = self.menuBar()
@@ -247,6 +338,14 @@ class BudgetApp(QMainWindow):
         # バックアップメニュー
         backup_menu = file_menu.addMenu('バックアップ')
 
+        startup_report_action = QAction('起動時間レポート', self)
+        startup_report_action.triggered.connect(self.show_startup_report)
+        file_menu.addAction(startup_report_action)
+
+        rebuild_action = QAction('集計データを再構築', self)
+        rebuild_action.triggered.connect(self.rebuild_rollup)
+        file_menu.addAction(rebuild_action)
+        
         category_action = QAction('カテゴリ管理', self)
         category_action.triggered.connect(self.show_category_management)
         file_menu.addAction(category_action)
@@ -269,47 +368,47 @@ class BudgetApp(QMainWindow):
 
         self.setCentralWidget(self.stacked_widget)
 
-    def connect_navigation_buttons(self):
-        """各ウィジェットのナビゲーションボタンを接続する"""
-        # ウィジェットリストの作成
-        widget_dict = {
-            'income_expense': self.income_expense_widget,
-            'breakdown': self.breakdown_widget,
-            'monthly_report': self.monthly_report_widget,
-            'goal_management': self.goal_management_widget,
-            'diagnostic_report': self.diagnostic_report_widget,
-            'comprehensive_analysis': self.comprehensive_analysis_widget,
-            'asset_management': self.asset_management_widget
-        }
-
-        # ボタン名とターゲットウィジェットのマッピング
-        button_targets = {
-            'income_expense_button': self.income_expense_widget,
-            'breakdown_button': self.breakdown_widget,
-            'monthly_report_button': self.monthly_report_widget,
-            'goal_management_button': self.goal_management_widget,
-            'diagnostic_report_button': self.diagnostic_report_widget,
-            'comprehensive_analysis_button': self.comprehensive_analysis_widget,
-            'asset_management_button': self.asset_management_widget
-        }
+    def get_screen(self, name):
+        """画面を取得する（まだ作っていなければ作って placeholder と差し替える）"""
+        widget = getattr(self, f"{name}_widget", None)
+        if widget is not None:
+            return widget
         
-        # 各ウィジェットについて処理
-        for widget in widget_dict.values():
-            # 各ボタンについて処理
-            for button_name, target_widget in button_targets.items():
-                # ウィジェットが対応するボタン属性を持っていれば接続
-                if hasattr(widget, button_name):
-                    button = getattr(widget, button_name)
-                    # 遷移ロジック（lambdaで遅延評価）
-                    button.clicked.connect(
-                        lambda checked=False, w=target_widget: self.stacked_widget.setCurrentWidget(w)
-                    )
-
-        # breakdownウィジェットへの特別な遷移処理（updateが必要な場合）
-        if hasattr(self, 'income_expense_widget') and hasattr(self, 'breakdown_widget'):
-            self.income_expense_widget.breakdown_button.clicked.connect(
-                lambda: self.switch_to_breakdown()
-            )
+        widget_class, title = self.screen_classes[name]
+        started = time.perf_counter()
+        widget = widget_class(self)
+        setattr(self, f"{name}_widget", widget)  # self.name_widget = widget の動的版
+        
+        if name == 'income_expense':
+            # 目標達成状況表示を入出金画面に追加
+            widget.add_goal_progress_to_income_expense()
+        
+        placeholder = self.placeholders.pop(name)
+        index = self.stacked_widget.indexOf(placeholder)
+        self.stacked_widget.insertWidget(index, widget)
+        self.stacked_widget.removeWidget(placeholder)
+        placeholder.deleteLater()
+        
+        self.connect_navigation_buttons(widget)
+        self._record_timing(f'画面の作成 {title}', started)
+        return widget
+
+    def show_screen(self, name):
+        """画面を表示する（初回はここで作られる）"""
+        self.stacked_widget.setCurrentWidget(self.get_screen(name))
+
+    def connect_navigation_buttons(self, widget):
+        """画面のナビゲーションボタンを接続する"""
+        for name, _, _ in SCREENS:
+            button_name = f"{name}_button"
+            # ウィジェットが対応するボタン属性を持っていれば接続
+            if hasattr(widget, button_name):
+                button = getattr(widget, button_name)
+                # 遷移先は押されたときに作る（lambdaで遅延評価）
+                if name == 'breakdown':
+                    button.clicked.connect(lambda checked=False: self.switch_to_breakdown())
+                else:
+                    button.clicked.connect(lambda checked=False, n=name: self.show_screen(n))
 
     def add_button_to_layout(self, widget, button):
         """ウィジェットのレイアウトにボタンを安全に追加する"""
@@ -368,59 +467,18 @@ class BudgetApp(QMainWindow):
                     'バックアップ管理画面から手動バックアップをお試しください。'
                 )
 
+    def rebuild_rollup(self):
+        """月別・カテゴリ別の集計データと全文検索インデックスを支出データから作り直す"""
+        try:
+            rebuild_monthly_category_totals()
+            if search_index_available():
+                rebuild_search_index()
+            get_event_bus().publish(ExpenseChanged())
+            QMessageBox.information(self, "完了", "集計データを再構築しました。")
+        except Exception as e:
+            QMessageBox.critical(self, "エラー", f"集計データの再構築に失敗しました: {str(e)}")
+
     def show_category_management(self):
         """カテゴリ管理ダイアログを表示"""
         dialog = CategoryManagementDialog(self)
         dialog.exec_()
-
-    def update_goal_data_across_widgets(self):
-        """目標データが更新された際に各ウィジェットの表示を更新する"""
-        
-        # 1. 入出金画面の目標達成状況を更新
-        if hasattr(self, 'income_expense_widget') and hasattr(self.income_expense_widget, 'update_goal_progress'):
-            try:
-                self.income_expense_widget.update_goal_progress()
-            except Exception as e:
-                print(f"入出金画面の更新中にエラー: {e}")
-        
-        # 2. 収支内訳画面の目標関連表示を更新
-        # （update_displayに一本化済みなのでenhanced系の分岐は不要になった）
-        if hasattr(self, 'breakdown_widget'):
-            try:
-                self.breakdown_widget.update_display()
-            except Exception as e:
-                print(f"収支内訳画面の更新中にエラー: {e}")
-
-        # 3. 月次レポート画面の目標関連表示を更新
-        if hasattr(self, 'monthly_report_widget'):
-            try:
-                self.monthly_report_widget.update_display()
-            except Exception as e:
-                print(f"月次レポート画面の更新中にエラー: {e}")
-        
-        # 4. 診断レポート画面の表示を更新
-        if hasattr(self, 'diagnostic_report_widget') and hasattr(self.diagnostic_report_widget, 'generate_report'):
-            try:
-                self.diagnostic_report_widget.generate_report()
-            except Exception as e:
-                print(f"診断レポート画面の更新中にエラー: {e}")
-        
-        # 5. 目標管理画面自体も更新
-        if hasattr(self, 'goal_management_widget'):
-            try:
-                self.goal_management_widget.update_display()
-            except Exception as e:
-                print(f"目標管理画面の更新中にエラー: {e}")
-
-        # 各ウィジェットのカテゴリコンボボックスを更新
-        if hasattr(self, 'income_expense_widget') and hasattr(self.income_expense_widget, 'category_input'):
-            current_category = self.income_expense_widget.category_input.currentText()
-            self.income_expense_widget.category_input.clear()
-
-            # カテゴリ一覧を共通関数で取得してコンボボックスに反映
-            self.income_expense_widget.category_input.addItems(get_categories())
-            
-            # 以前選択されていたカテゴリを再選択（存在する場合）
-            index = self.income_expense_widget.category_input.findText(current_category)
-            if index >= 0:
-                self.income_expense_widget.category_input.setCurrentIndex(index)
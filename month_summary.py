@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""表示中の月の収入・支出・目標の集計
+
+入出金画面の「月間支出」「収支」「目標達成状況」「カテゴリ別予算アラート」は、
+どれも月の収入・カテゴリ別支出・月間目標・カテゴリ別目標から計算できる。
+MonthSummary はこれらを1回読み込んで持っておき、一覧のセルを1件編集したときは
+変更前と変更後の行の差分（金額・カテゴリ・日付）を足し引きするだけで集計を更新する。
+編集のたびにDBへ問い合わせ直さないので、過去の支出が何件あっても編集後の再表示の時間は変わらない。
+
+使い方:
+    summary = MonthSummary.load(2025, 4)
+    summary.apply_edit(old_row, new_row)   # 行は (id, date, category, amount, description)
+    summary.expense_total                  # 月間支出
+"""
+from db_utils import execute_query
+from common import DateHelper
+
+
+# 予算に対する実績の割合（%）がこれ以上なら注意、100以上なら超過として表示する
+ALERT_WARNING_RATIO = 80
+
+
+class MonthSummary:
+    """1か月分の収入・カテゴリ別支出・目標"""
+
+    def __init__(self, year, month, income=0, goal=None, category_totals=None, category_goals=None):
+        self.year = year
+        self.month = month
+        self.income = income
+        self.goal = goal                                  # (savings_goal, expense_limit) か None
+        self.category_totals = category_totals or {}      # {カテゴリ: 支出合計}
+        self.category_goals = category_goals or {}        # {カテゴリ: 予算}
+        self._start, _ = DateHelper.get_month_range_str(year, month)
+        self._next_start, _ = DateHelper.get_month_range_str(*DateHelper.get_next_month(year, month))
+
+    @classmethod
+    def load(cls, year, month):
+        """DBから読み込む（支出は集計テーブル monthly_category_totals から）"""
+        income = execute_query(
+            'SELECT income FROM monthly_income WHERE year = ? AND month = ?',
+            (year, month), fetch_one=True
+        )
+        goal = execute_query(
+            'SELECT savings_goal, expense_limit FROM monthly_goals WHERE year = ? AND month = ?',
+            (year, month), fetch_one=True
+        )
+        totals = execute_query(
+            'SELECT category, total FROM monthly_category_totals WHERE year = ? AND month = ?',
+            (year, month), fetch_all=True
+        )
+        goals = execute_query(
+            'SELECT category, goal_amount FROM category_goals WHERE year = ? AND month = ?',
+            (year, month), fetch_all=True
+        )
+        return cls(
+            year, month,
+            income=income[0] if income and income[0] else 0,
+            goal=tuple(goal) if goal else None,
+            category_totals={category: total or 0 for category, total in totals or []},
+            category_goals={category: amount for category, amount in goals or []},
+        )
+
+    @property
+    def expense_total(self):
+        return sum(self.category_totals.values())
+
+    @property
+    def savings(self):
+        return self.income - self.expense_total
+
+    def contains(self, date):
+        """日付（'YYYY-MM-DD'）がこの月に入るかどうか"""
+        return self._start <= str(date) < self._next_start
+
+    def apply_edit(self, old_row, new_row):
+        """支出1件の変更前・変更後の行 (id, date, category, amount, description) の差分を反映する"""
+        for sign, row in ((-1, old_row), (1, new_row)):
+            _, date, category, amount, _ = row
+            if self.contains(date):
+                self.category_totals[category] = self.category_totals.get(category, 0) + sign * float(amount or 0)
+
+    def budget_alerts(self):
+        """予算の ALERT_WARNING_RATIO% 以上を使ったカテゴリの [(カテゴリ, 実績, 予算, 割合%), ...]"""
+        alerts = []
+        for category, goal_amount in self.category_goals.items():
+            if not goal_amount or goal_amount <= 0:
+                continue
+            actual = self.category_totals.get(category, 0)
+            ratio = actual / goal_amount * 100
+            if ratio >= ALERT_WARNING_RATIO:
+                alerts.append((category, actual, goal_amount, ratio))
+        return alerts
@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 """月次レポート画面
 
-直近6ヶ月の収支推移・カテゴリ別グラフを表示する。"""
+直近6ヶ月（12/24/36ヶ月に切替可）の収支推移・カテゴリ別グラフを表示する。"""
 from PyQt5.QtWidgets import (
     QWidget,
     QPushButton,
@@ -23,10 +23,10 @@ from PyQt5.QtChart import (
     QBarCategoryAxis,
     QLineSeries
 )
-import sqlite3
 import pandas as pd
-from db_utils import get_categories
+from db_utils import get_categories, get_db_connection
 from common import DateHelper, BaseWidget
+from events import CategoryChanged, ExpenseChanged, GoalChanged, IncomeChanged
 
 
 class MonthlyReportWidget(BaseWidget):
@@ -40,11 +40,24 @@ class MonthlyReportWidget(BaseWidget):
         self.display_year = self.current_year
         self.display_month = self.current_month
         
+        # 表示する期間（月数）
+        self.window_months = 6
+        
         # 選択されたカテゴリグラフを保持するリスト
         self.category_views = []
         
         self.initUI()
         self.update_display()
+        self.watch_changes(ExpenseChanged, IncomeChanged, GoalChanged, CategoryChanged)
+
+    def is_affected_by(self, event):
+        # 表示中の期間（display_year/month までの window_months ヶ月）に関係する変更だけ
+        start = QDate(self.display_year, self.display_month, 1).addMonths(-(self.window_months - 1))
+        return event.affects_range((start.year(), start.month()), (self.display_year, self.display_month))
+
+    def refresh(self):
+        self.reload_category_combo(self.category_combo)
+        self.update_display()
 
     def initUI(self):
         layout = QVBoxLayout()
@@ -64,6 +77,14 @@ class MonthlyReportWidget(BaseWidget):
         nav_layout.addWidget(self.prev_month_button)
         nav_layout.addWidget(self.period_label)
         nav_layout.addWidget(self.next_month_button)
+        
+        # 表示期間の選択
+        self.window_combo = QComboBox()
+        for n_months in (6, 12, 24, 36):
+            self.window_combo.addItem(f'{n_months}ヶ月', n_months)
+        self.window_combo.currentIndexChanged.connect(self.change_window)
+        nav_layout.addWidget(QLabel('表示期間:'))
+        nav_layout.addWidget(self.window_combo)
         layout.addLayout(nav_layout)
 
         # カテゴリ選択エリア
@@ -95,6 +116,10 @@ class MonthlyReportWidget(BaseWidget):
 
         self.setLayout(layout)
 
+    def change_window(self):
+        self.window_months = self.window_combo.currentData()
+        self.update_display()
+
     def show_prev_month(self):
         self.current_year, self.current_month = DateHelper.get_prev_month(self.current_year, self.current_month)
         self.display_year = self.current_year
@@ -119,7 +144,7 @@ class MonthlyReportWidget(BaseWidget):
 
         # データの取得
         try:
-            months_data = self.get_6month_data()
+            months_data = self.get_months_data()
 
             # グラフの更新
             self.update_chart(months_data)
@@ -129,78 +154,102 @@ class MonthlyReportWidget(BaseWidget):
         except Exception as e:
             print(f"Error in update_display: {e}")
 
-    def get_6month_data(self):
-        """目標情報を含む6ヶ月分のデータを取得"""
-        conn = sqlite3.connect('budget.db')
-        months_data = []
-        
+    def get_months_data(self, n_months=None):
+        """目標情報を含む直近n_months分（省略時は表示期間の設定）のデータを取得
+
+        以前は1ヶ月ごとに収入・カテゴリ別支出・目標を別々に問い合わせていたため、
+        6ヶ月で18回のクエリと6個のDataFrame作成が必要だった。
+        期間全体を3回のクエリでまとめて取り、pandasで一度に月×カテゴリへ展開する。
+        """
+        n_months = n_months or self.window_months
+        conn = get_db_connection()
+
         # 開始月と終了月を計算
-        start_date = QDate(self.display_year, self.display_month, 1).addMonths(-5)
-        end_date = QDate(self.display_year, self.display_month, 1)
-        
-        current_date = start_date
-        while current_date <= end_date:
-            year = current_date.year()
-            month = current_date.month()
-            
-            # 収入データの取得
-            c = conn.cursor()
-            c.execute('''
-                SELECT income FROM monthly_income 
-                WHERE year = ? AND month = ?
-            ''', (year, month))
-            income_result = c.fetchone()
-            income = income_result[0] if income_result else 0
-            
-            # 支出データの取得（カテゴリ別）
-            df = pd.read_sql_query('''
-                SELECT category, SUM(amount) as total_amount 
-                FROM expenses 
-                WHERE strftime('%Y', date) = ? 
-                AND strftime('%m', date) = ?
-                GROUP BY category
-            ''', conn, params=(str(year), f"{month:02d}"))
-            
-            # カテゴリ別支出を辞書に変換
-            expenses_by_category = {}
-            total_expense = 0
-            for _, row in df.iterrows():
-                expenses_by_category[row['category']] = row['total_amount']
-                total_expense += row['total_amount']
-            
-            # 月間目標を取得
-            c.execute('''
-                SELECT savings_goal, expense_limit FROM monthly_goals
-                WHERE year = ? AND month = ?
-            ''', (year, month))
-            
-            monthly_goal = c.fetchone()
-            savings_goal = monthly_goal[0] if monthly_goal else 0
-            expense_limit = monthly_goal[1] if monthly_goal and monthly_goal[1] else None
-            
-            # 貯蓄額と目標達成率の計算
-            balance = income - total_expense
-            savings_achievement = (balance / savings_goal * 100) if savings_goal > 0 else 0
-            expense_achievement = (expense_limit / total_expense * 100) if expense_limit and total_expense > 0 else 0
-            
+        start_date = QDate(self.display_year, self.display_month, 1).addMonths(-(n_months - 1))
+        start = (start_date.year(), start_date.month())
+        end = (self.display_year, self.display_month)
+        window_params = (*start, *end)
+
+        # 期間内の全月（データが無い月も0で表示するため）
+        months = pd.MultiIndex.from_tuples(
+            DateHelper.get_months_between(*start, *end), names=['year', 'month']
+        )
+
+        # (year, month) の行値比較なら主キーのインデックスで範囲検索できる
+        window_where = '(year, month) BETWEEN (?, ?) AND (?, ?)'
+
+        # 収入データの取得
+        income_df = pd.read_sql_query(f"""
+            SELECT year, month, income FROM monthly_income
+            WHERE {window_where}
+        """, conn, params=window_params).set_index(['year', 'month'])
+
+        # 支出データの取得（カテゴリ別）→ 月×カテゴリの表に展開
+        expense_df = pd.read_sql_query(f"""
+            SELECT year, month, category, total
+            FROM monthly_category_totals
+            WHERE {window_where}
+        """, conn, params=window_params)
+        expense_table = expense_df.pivot_table(
+            index=['year', 'month'], columns='category', values='total', aggfunc='sum'
+        ).reindex(months)
+
+        # 月間目標を取得
+        goals_df = pd.read_sql_query(f"""
+            SELECT year, month, savings_goal, expense_limit FROM monthly_goals
+            WHERE {window_where}
+        """, conn, params=window_params).set_index(['year', 'month'])
+
+        # 月ごとの集計を列単位でまとめて計算
+        summary = pd.DataFrame(index=months)
+        summary['income'] = income_df['income'].reindex(months).fillna(0)
+        summary['total_expense'] = expense_table.sum(axis=1).fillna(0)
+        summary['savings_goal'] = goals_df['savings_goal'].reindex(months).fillna(0)
+        # expense_limit は未設定(NULL/0)なら None として扱う
+        limits = goals_df['expense_limit'].reindex(months)
+        summary['expense_limit'] = limits.where(limits.fillna(0) != 0)
+
+        # 貯蓄額と目標達成率の計算
+        summary['balance'] = summary['income'] - summary['total_expense']
+        savings_goal = summary['savings_goal']
+        summary['savings_achievement'] = (
+            (summary['balance'] / savings_goal.where(savings_goal > 0) * 100).fillna(0).clip(upper=100)
+        )
+        has_limit = summary['expense_limit'].notna() & (summary['total_expense'] > 0)
+        summary['expense_achievement'] = (
+            (summary['expense_limit'] / summary['total_expense'].where(has_limit) * 100).fillna(0).clip(upper=100)
+        )
+
+        # 画面側で使う辞書のリストに変換
+        category_rows = expense_table.to_dict('index')
+        months_data = []
+        for (year, month), row in summary.iterrows():
+            expense_limit = row['expense_limit']
             months_data.append({
                 'year': year,
                 'month': month,
-                'income': income,
-                'total_expense': total_expense,
-                'expenses_by_category': expenses_by_category,
-                'balance': balance,
-                'savings_goal': savings_goal,
-                'expense_limit': expense_limit,
-                'savings_achievement': min(100, savings_achievement),
-                'expense_achievement': min(100, expense_achievement) if expense_limit else 0
+                'income': row['income'],
+                'total_expense': row['total_expense'],
+                'expenses_by_category': {
+                    category: amount
+                    for category, amount in category_rows[(year, month)].items()
+                    if pd.notna(amount)
+                },
+                'balance': row['balance'],
+                'savings_goal': row['savings_goal'],
+                'expense_limit': None if pd.isna(expense_limit) else expense_limit,
+                'savings_achievement': row['savings_achievement'],
+                'expense_achievement': row['expense_achievement']
             })
-            
-            current_date = current_date.addMonths(1)
-        
-        conn.close()
+
         return months_data
 
+    def month_label(self, data):
+        """グラフのX軸ラベル（1年を超える期間では同じ月名が重なるので年も付ける）"""
+        if self.window_months > 12:
+            return f"{data['year'] % 100:02d}/{data['month']}"
+        return f"{data['month']}月"
+
     def update_table(self, months_data):
         """収支リストのテーブルを更新（目標行つき）"""
         # 全期間のカテゴリを取得
@@ -285,7 +334,7 @@ class MonthlyReportWidget(BaseWidget):
         for i, data in enumerate(months_data):
             amount = data['expenses_by_category'].get(category, 0)
             values.append(amount)
-            categories.append(f"{data['month']}月")
+            categories.append(self.month_label(data))
         
         # 1. 棒グラフの作成
         bar_set = QBarSet(category)
@@ -350,7 +399,7 @@ class MonthlyReportWidget(BaseWidget):
         for i, data in enumerate(months_data):
             amount = data['expenses_by_category'].get(category, 0)
             values.append(amount)
-            categories.append(f"{data['month']}月")
+            categories.append(self.month_label(data))
             points.append(QPointF(i, amount))
 
         # ラインシリーズの作成と設定
@@ -392,7 +441,7 @@ class MonthlyReportWidget(BaseWidget):
     def add_category_graph(self):
         """選択されたカテゴリのグラフを追加"""
         selected_category = self.category_combo.currentText()
-        months_data = self.get_6month_data()
+        months_data = self.get_months_data()
         
         # 新しいカテゴリビューを作成して保存
         category_view = self.create_category_graph(selected_category, months_data)
@@ -433,7 +482,7 @@ class MonthlyReportWidget(BaseWidget):
         for data in months_data:
             income_values.append(data['income'])
             expense_values.append(data['total_expense'])
-            categories.append(f"{data['month']}月")
+            categories.append(self.month_label(data))
         
         income_series.append(income_values)
         expense_series.append(expense_values)
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""明細ファイルの解析結果キャッシュ（Qtに依存しない）
+
+同じPASMOのPDFを何度も開き直すと、そのたびに最初から解析し直していた
+（数十ページのPDFだと十数秒かかる）。
+ここでは解析結果をファイルの中身のハッシュ・解析処理のバージョン・読み込み設定を
+キーにしてディスクに保存し、2回目以降はそれを読み込むだけで済ませる。
+
+- キーはファイルの中身から作るので、ファイル名や更新日時が変わっても同じ中身なら当たり、
+  中身が1バイトでも変われば外れる。解析処理を変えたときは version を上げれば古い結果は使われない。
+- 値は pickle を zlib で圧縮して1キー1ファイルで保存する（DataFrame も型ごとそのまま戻せる）。
+- 合計サイズが max_bytes を超えたら、最後に使ってから時間がたったものから消す（LRU）。
+  使った時刻はファイルの更新日時で持つ。
+- キャッシュは速くするためだけのものなので、読み書きに失敗しても解析し直すだけでエラーにはしない。
+
+カードのCSVはキャッシュしない。列マッピングの選択肢を出すために読み込みは毎回必要で、
+明細への変換（card_formats.transform_rows）は列ごとにまとめて行うので短い。
+キャッシュしても減るのはその変換の時間だけで、ファイルのハッシュの計算で相殺されてしまう。
+"""
+import hashlib
+import json
+import os
+import pickle
+import zlib
+
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'parse_cache')
+# キャッシュ全体の上限（超えたら古いものから消す）
+MAX_CACHE_BYTES = 64 * 1024 * 1024
+CACHE_SUFFIX = '.pkl.z'
+
+# ハッシュを計算するときに一度に読むバイト数
+_READ_BLOCK_SIZE = 1024 * 1024
+
+
+def file_digest(file_path):
+    """ファイルの中身のハッシュ（16進文字列）"""
+    digest = hashlib.blake2b(digest_size=20)
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(_READ_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_key(file_path, kind, version, options=None):
+    """ファイルの中身・解析の種類・解析処理のバージョン・読み込み設定からキャッシュのキーを作る"""
+    meta = json.dumps([kind, version, options or {}], ensure_ascii=False, sort_keys=True, default=str)
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(file_digest(file_path).encode('ascii'))
+    digest.update(meta.encode('utf-8'))
+    return f'{kind}-{digest.hexdigest()}'
+
+
+def _entry_path(key, cache_dir):
+    return os.path.join(cache_dir, key + CACHE_SUFFIX)
+
+
+def load(key, cache_dir=CACHE_DIR):
+    """キーの解析結果を返す（無い・読めないときは None）"""
+    path = _entry_path(key, cache_dir)
+    try:
+        with open(path, 'rb') as f:
+            value = pickle.loads(zlib.decompress(f.read()))
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        # 壊れたキャッシュは消して、解析し直してもらう
+        print(f"解析キャッシュを読めません（削除します）: {e}")
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return None
+
+    try:
+        os.utime(path)  # 使った時刻を更新（LRUの順番になる）
+    except OSError:
+        pass
+    return value
+
+
+def store(key, value, cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+    """解析結果を保存し、合計サイズが max_bytes を超えたら古いものから消す"""
+    path = _entry_path(key, cache_dir)
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        data = zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        if len(data) > max_bytes:
+            return  # 1件で上限を超えるものは保存しない
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        # 書き終えてから置き換えるので、途中で落ちても中途半端なキャッシュは残らない
+        os.replace(temp_path, path)
+    except Exception as e:
+        print(f"解析キャッシュを保存できません: {e}")
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        return
+    evict(cache_dir, max_bytes)
+
+
+def evict(cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+    """合計サイズが max_bytes 以下になるまで、最後に使った時刻が古いものから消す"""
+    entries = []
+    try:
+        with os.scandir(cache_dir) as it:
+            for entry in it:
+                if entry.name.endswith(CACHE_SUFFIX):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+    except OSError:
+        return
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+
+
+def cached_parse(file_path, kind, version, parse, options=None, cache_dir=CACHE_DIR):
+    """キャッシュにあればそれを返し、無ければ parse() の結果を保存して返す
+
+    kind は解析の種類（'pasmo' など）、version は解析処理のバージョン、
+    options は結果が変わる読み込み設定（文字コードなど。JSONにできる値）。
+    parse() が例外を投げたときは何も保存せずにそのまま投げ直す。
+    """
+    try:
+        key = cache_key(file_path, kind, version, options)
+    except OSError:
+        return parse()  # ファイルを読めないときのエラーは解析側に任せる
+
+    value = load(key, cache_dir)
+    if value is None:
+        value = parse()
+        store(key, value, cache_dir)
+    return value
@@ -1,7 +1,8 @@
 # -*- coding: utf-8 -*-
 """PASMO利用明細取込ダイアログ
 
-PASMOのPDF明細を解析して交通費として取込む（pdfplumberは使用時に読み込む）。"""
+PASMOのPDF明細を解析して交通費として取込む（pdfplumberは使用時に読み込む）。
+PDFの解析（pasmo_parser.py）はGUIスレッドの外で行い、進み具合をダイアログに表示する。"""
 from PyQt5.QtWidgets import (
     QWidget,
     QDialog,
@@ -19,11 +20,47 @@ from PyQt5.QtWidgets import (
     QHBoxLayout,
     QGroupBox,
     QStackedWidget,
-    QFileDialog
+    QFileDialog,
+    QProgressDialog
 )
-from PyQt5.QtCore import Qt, QDate
-import sqlite3
+from PyQt5.QtCore import Qt, QDate, QThread, pyqtSignal
 import os
+from db_utils import transaction, import_expenses, insert_expense
+from pasmo_parser import PARSER_VERSION, ParseCancelled, infer_start_year, parse_pasmo_pdf
+from parse_cache import cached_parse
+
+
+class PasmoParseThread(QThread):
+    """PASMO PDFの解析をGUIスレッドの外で行う（ページの読み取りはプロセスプールで並列に行う）
+
+    同じ中身のPDFを前に解析していれば、解析キャッシュ（parse_cache.py）の結果をそのまま使う。
+    """
+
+    progress = pyqtSignal(int, int)  # (読み取ったページ数, 全ページ数)
+    parsed = pyqtSignal(object)      # 解析した明細のリスト
+    failed = pyqtSignal(str)
+
+    def __init__(self, file_path, start_year, parent=None):
+        super().__init__(parent)
+        self.file_path = file_path
+        self.start_year = start_year
+
+    def run(self):
+        try:
+            results = cached_parse(
+                self.file_path, 'pasmo', PARSER_VERSION,
+                lambda: parse_pasmo_pdf(
+                    self.file_path, self.start_year,
+                    progress=self.progress.emit, should_stop=self.isInterruptionRequested
+                ),
+                options={'start_year': self.start_year}
+            )
+        except ParseCancelled:
+            return
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
+        self.parsed.emit(results)
 
 
 class PasmoImportDialog(QDialog):
@@ -38,6 +75,7 @@ class PasmoImportDialog(QDialog):
         self.setMinimumWidth(700)
         self.setMinimumHeight(500)
         self.preview_data = []
+        self.parse_thread = None  # PDFを解析中のスレッド
         self.initUI()
 
     def initUI(self):
@@ -182,13 +220,7 @@ class PasmoImportDialog(QDialog):
 
     def _infer_start_year(self, file_path):
         """ファイル名から開始年を推定する"""
-        import re
-        basename = os.path.basename(file_path)
-        # PB80F224032817377_20250104_20260211120230.pdf のようなパターン
-        m = re.search(r'_(\d{4})\d{4}_', basename)
-        if m:
-            return int(m.group(1))
-        return QDate.currentDate().year()
+        return infer_start_year(file_path, QDate.currentDate().year())
 
     def parse_and_proceed(self):
         """PDFを解析してステップ2に進む"""
@@ -207,8 +239,50 @@ class PasmoImportDialog(QDialog):
             )
             return
 
+        # 解析は別スレッドで行い、終わったら show_preview で表示する
+        file_path = self.file_path_input.text()
+        self.parse_progress = QProgressDialog('PDFを解析しています...', 'キャンセル', 0, 0, self)
+        self.parse_progress.setWindowTitle('PDF解析中')
+        self.parse_progress.setWindowModality(Qt.WindowModal)
+        self.parse_progress.setMinimumDuration(0)
+
+        self.parse_thread = PasmoParseThread(file_path, self._infer_start_year(file_path), self)
+        self.parse_thread.progress.connect(self._on_parse_progress)
+        self.parse_thread.parsed.connect(self._on_parsed)
+        self.parse_thread.failed.connect(self._on_parse_failed)
+        self.parse_progress.canceled.connect(self.parse_thread.requestInterruption)
+        self.parse_thread.start()
+
+    def _on_parse_progress(self, done, total):
+        self.parse_progress.setMaximum(total)
+        self.parse_progress.setValue(done)
+        self.parse_progress.setLabelText(f'PDFを解析しています... ({done}/{total}ページ)')
+
+    def _on_parsed(self, results):
+        self.parse_progress.close()
+        if self.parse_thread.isInterruptionRequested():
+            return  # 読み取りが終わる直前にキャンセルされた
+        self.show_preview(results)
+
+    def _on_parse_failed(self, message):
+        self.parse_progress.close()
+        QMessageBox.critical(self, 'エラー', f'PDF解析に失敗しました:\n{message}')
+
+    def done(self, result):
+        """閉じる前に解析を止めて、スレッドが終わるのを待つ
+
+        走っているスレッドごとダイアログが破棄されるとアプリが落ちる。
+        止めるように伝えれば、読み取り中のページが終わったところで止まる。
+        """
+        if self.parse_thread is not None:
+            self.parse_thread.requestInterruption()
+            self.parse_thread.wait()
+        super().done(result)
+
+    def show_preview(self, results):
+        """解析結果をプレビューに表示してステップ2に進む"""
         try:
-            self.preview_data = self.parse_pasmo_pdf(self.file_path_input.text())
+            self.preview_data = results
 
             if not self.preview_data:
                 QMessageBox.warning(self, '警告', '取り込み可能なデータが見つかりませんでした。')
@@ -252,7 +326,7 @@ class PasmoImportDialog(QDialog):
             self.stack.setCurrentIndex(1)
 
         except Exception as e:
-            QMessageBox.critical(self, 'エラー', f'PDF解析に失敗しました:\n{str(e)}')
+            QMessageBox.critical(self, 'エラー', f'解析結果の表示に失敗しました:\n{str(e)}')
 
     def _toggle_import_mode(self, bulk_checked):
         """一括/個別モードの切り替え"""
@@ -263,97 +337,6 @@ class PasmoImportDialog(QDialog):
         if row_idx < len(self.preview_data):
             self.preview_data[row_idx]['category'] = text
 
-    def parse_pasmo_pdf(self, file_path):
-        """PASMO PDFを解析してデータリストを返す"""
-        import pdfplumber
-        import re
-
-        start_year = self._infer_start_year(file_path)
-        results = []
-
-        with pdfplumber.open(file_path) as pdf:
-            for page in pdf.pages:
-                text = page.extract_text()
-                if not text:
-                    continue
-
-                lines = text.split('\n')
-                prev_month = None
-
-                for line in lines:
-                    line = line.strip()
-                    if not line:
-                        continue
-
-                    # データ行: "MM DD 種別 ..." のパターン
-                    m = re.match(r'^(\d{2})\s+(\d{2})\s+(.+)$', line)
-                    if not m:
-                        continue
-
-                    month = int(m.group(1))
-                    day = int(m.group(2))
-                    rest = m.group(3)
-
-                    # 年の推定: 月が前の行より小さくなったら年を+1
-                    if prev_month is not None and month < prev_month:
-                        start_year += 1
-                    prev_month = month
-
-                    # 種別を判定
-                    # 繰越行: "繰 ..."
-                    if rest.startswith('繰'):
-                        continue
-
-                    # チャージ行: "ｶｰﾄﾞ ..." (差額が正)
-                    if rest.startswith('ｶｰﾄﾞ'):
-                        continue
-
-                    # 鉄道利用行: "入 {駅名} 出 {駅名} \金額 差額"
-                    # または: "定 {駅名} 出 {駅名} \金額 差額"
-                    ride_match = re.match(
-                        r'^(入|定)\s+(.+?)\s+出\s+(.+?)\s+\\[\\\d,.]+\s+([+-][\d,]+)$',
-                        rest
-                    )
-                    if ride_match:
-                        ride_type = ride_match.group(1)
-                        station_from = ride_match.group(2).strip()
-                        station_to = ride_match.group(3).strip()
-                        diff_str = ride_match.group(4).replace(',', '')
-                        diff = int(diff_str)
-
-                        if diff >= 0:
-                            continue  # 正の差額はチャージ等なのでスキップ
-
-                        amount = abs(diff)
-                        date_str = f'{start_year}-{month:02d}-{day:02d}'
-
-                        # 「地　渋谷」→「渋谷(地下鉄)」のように整形
-                        station_from = self._clean_station_name(station_from)
-                        station_to = self._clean_station_name(station_to)
-
-                        description = f'PASMO: {station_from} → {station_to}'
-                        category = '交通費'
-
-                        results.append({
-                            'date': date_str,
-                            'amount': amount,
-                            'description': description,
-                            'category': category
-                        })
-
-        return results
-
-    def _clean_station_name(self, name):
-        """駅名を整形する（地　渋谷 → 渋谷 など）"""
-        import re
-        # 「地　渋谷」「地 渋谷」→「渋谷」（地下鉄プレフィックス除去）
-        m = re.match(r'^地[\s　]+(.+)$', name)
-        if m:
-            return m.group(1)
-        # 「東武　柏」→「東武 柏」（全角スペースをスペースに）
-        name = name.replace('\u3000', ' ')
-        return name
-
     def execute_import(self):
         """取り込みを実行"""
         self._execute_individual_import()
@@ -382,27 +365,21 @@ class PasmoImportDialog(QDialog):
         if reply != QMessageBox.Yes:
             return
 
-        # 接続はtryの外で開き、finallyで必ず閉じる（閉じ忘れ防止）
-        conn = sqlite3.connect('budget.db')
         try:
-            c = conn.cursor()
+            # 支出と履歴の両方が成功したときだけ確定する（失敗時は全部取り消す）
+            with transaction() as conn:
+                c = conn.cursor()
 
-            c.execute('''
-                INSERT INTO expenses (date, category, amount, description)
-                VALUES (?, ?, ?, ?)
-            ''', (chosen_date, '交通費', total_amount, description))
+                insert_expense(chosen_date, '交通費', total_amount, description)
 
-            # インポート履歴を記録
-            import_date = QDate.currentDate().toString('yyyy-MM-dd')
-            file_name = os.path.basename(self.file_path_input.text())
-            c.execute('''
-                INSERT INTO credit_card_imports
-                (import_date, file_name, format_name, record_count)
-                VALUES (?, ?, ?, ?)
-            ''', (import_date, file_name, 'モバイルPASMO(一括)', 1))
-
-            # 支出と履歴の両方が成功したときだけ確定する
-            conn.commit()
+                # インポート履歴を記録
+                import_date = QDate.currentDate().toString('yyyy-MM-dd')
+                file_name = os.path.basename(self.file_path_input.text())
+                c.execute('''
+                    INSERT INTO credit_card_imports
+                    (import_date, file_name, format_name, record_count)
+                    VALUES (?, ?, ?, ?)
+                ''', (import_date, file_name, 'モバイルPASMO(一括)', 1))
 
             QMessageBox.information(
                 self, '取り込み完了',
@@ -411,10 +388,7 @@ class PasmoImportDialog(QDialog):
             self.accept()
 
         except Exception as e:
-            conn.rollback()  # 途中まで書き込んだ分を取り消す
             QMessageBox.critical(self, 'エラー', f'取り込み処理に失敗しました:\n{str(e)}')
-        finally:
-            conn.close()     # 成功・失敗にかかわらず必ず接続を閉じる
 
     def _execute_individual_import(self):
         """個別取り込み: 各明細を個別に登録"""
@@ -440,46 +414,26 @@ class PasmoImportDialog(QDialog):
         if reply != QMessageBox.Yes:
             return
 
-        # 接続はtryの外で開き、finallyで必ず閉じる（閉じ忘れ防止）
-        conn = sqlite3.connect('budget.db')
         try:
-            c = conn.cursor()
-            imported_count = 0
-            duplicate_count = 0
-
-            for item in filtered_data:
-                date = item['date']
-                category = item['category']
-                amount = item['amount']
-                description = item['description']
-
-                # 重複チェック
-                if self.duplicate_check.isChecked():
-                    c.execute('''
-                        SELECT id FROM expenses
-                        WHERE date = ? AND category = ? AND amount = ? AND description = ?
-                    ''', (date, category, amount, description))
-                    if c.fetchone():
-                        duplicate_count += 1
-                        continue
+            # 明細と取込履歴を1つのトランザクションで書き込む（失敗時は全部取り消す）
+            with transaction() as conn:
+                c = conn.cursor()
+
+                # 重複は指紋の UNIQUE インデックスで除き、全行を1回でまとめて書き込む
+                imported_count, duplicate_count = import_expenses(
+                    [(item['date'], item['category'], item['amount'], item['description'])
+                     for item in filtered_data],
+                    skip_duplicates=self.duplicate_check.isChecked()
+                )
 
+                # インポート履歴を記録
+                import_date = QDate.currentDate().toString('yyyy-MM-dd')
+                file_name = os.path.basename(self.file_path_input.text())
                 c.execute('''
-                    INSERT INTO expenses (date, category, amount, description)
+                    INSERT INTO credit_card_imports
+                    (import_date, file_name, format_name, record_count)
                     VALUES (?, ?, ?, ?)
-                ''', (date, category, amount, description))
-                imported_count += 1
-
-            conn.commit()
-
-            # インポート履歴を記録
-            import_date = QDate.currentDate().toString('yyyy-MM-dd')
-            file_name = os.path.basename(self.file_path_input.text())
-            c.execute('''
-                INSERT INTO credit_card_imports
-                (import_date, file_name, format_name, record_count)
-                VALUES (?, ?, ?, ?)
-            ''', (import_date, file_name, 'モバイルPASMO', imported_count))
-            conn.commit()
+                ''', (import_date, file_name, 'モバイルPASMO', imported_count))
 
             if duplicate_count > 0:
                 QMessageBox.information(
@@ -494,7 +448,4 @@ class PasmoImportDialog(QDialog):
             self.accept()
 
         except Exception as e:
-            conn.rollback()  # 途中まで書き込んだ分を取り消す
             QMessageBox.critical(self, 'エラー', f'取り込み処理に失敗しました:\n{str(e)}')
-        finally:
-            conn.close()     # 成功・失敗にかかわらず必ず接続を閉じる
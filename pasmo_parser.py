@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""モバイルPASMO残額ご利用明細PDFの解析（Qtに依存しない部分）
+
+PASMOのPDFは数か月分だと数十ページになり、pdfplumber の extract_text() を1ページずつ順に
+呼ぶと数秒〜十数秒かかっていた。ここではページの文字の読み取りをプロセスプールで並列に行い、
+読み取った文字をページ順に並べてから1回で解析する。
+年の推定（明細には月日しか無いので、月が前の行より小さくなったら翌年とみなす）は
+全ページの行を並べた後にまとめて行うので、ページの境目で年をまたいでも正しく数えられる。
+
+ワーカープロセスはこのモジュールだけを読み込めばよいよう、Qt（PyQt5）は使わない。
+pdfplumber は使うときに読み込む。
+"""
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+
+# データ行: "MM DD 種別 ..."
+LINE_PATTERN = re.compile(r'^(\d{2})\s+(\d{2})\s+(.+)$')
+# 鉄道利用行: "入 {駅名} 出 {駅名} \金額 差額" または "定 {駅名} 出 {駅名} \金額 差額"
+RIDE_PATTERN = re.compile(r'^(入|定)\s+(.+?)\s+出\s+(.+?)\s+\\[\\\d,.]+\s+([+-][\d,]+)$')
+# 地下鉄の駅名の前に付く「地」（「地　渋谷」「地 渋谷」）
+SUBWAY_PREFIX_PATTERN = re.compile(r'^地[\s　]+(.+)$')
+# PB80F224032817377_20250104_20260211120230.pdf のようなファイル名の開始日
+FILE_YEAR_PATTERN = re.compile(r'_(\d{4})\d{4}_')
+
+# これより少ないページ数なら、プロセスを起動するより1ページずつ読むほうが速い
+PARALLEL_MIN_PAGES = 8
+# 解析結果を変える修正をしたら上げる（parse_cache の古い解析結果を使わないようにする）
+PARSER_VERSION = 1
+
+
+class ParseCancelled(Exception):
+    """解析が途中で取り消された"""
+
+
+def infer_start_year(file_path, default_year):
+    """ファイル名から開始年を推定する（分からなければ default_year）"""
+    m = FILE_YEAR_PATTERN.search(os.path.basename(file_path))
+    if m:
+        return int(m.group(1))
+    return default_year
+
+
+def clean_station_name(name):
+    """駅名を整形する（地　渋谷 → 渋谷 など）"""
+    # 「地　渋谷」「地 渋谷」→「渋谷」（地下鉄プレフィックス除去）
+    m = SUBWAY_PREFIX_PATTERN.match(name)
+    if m:
+        return m.group(1)
+    # 「東武　柏」→「東武 柏」（全角スペースをスペースに）
+    return name.replace('　', ' ')
+
+
+# --- ページの文字の読み取り ---------------------------------------------------
+
+# ワーカープロセスごとに開いておくPDF（ページごとに開き直さない）
+_worker_pdf = None
+
+
+def _open_worker_pdf(file_path):
+    global _worker_pdf
+    import pdfplumber
+    _worker_pdf = pdfplumber.open(file_path)
+
+
+def _extract_worker_page(page_index):
+    return page_index, _worker_pdf.pages[page_index].extract_text() or ''
+
+
+def extract_page_texts(file_path, progress=None, should_stop=None, max_workers=None):
+    """PDFの全ページの文字をページ順のリストで返す
+
+    progress(読み取ったページ数, 全ページ数) はページを読み取るたびに呼ばれる。
+    should_stop() が True を返したら ParseCancelled を投げて中断する。
+    ページ数が PARALLEL_MIN_PAGES 以上ならプロセスプールで並列に読み取る。
+    """
+    import pdfplumber
+
+    with pdfplumber.open(file_path) as pdf:
+        page_count = len(pdf.pages)
+        workers = min(max_workers or os.cpu_count() or 1, page_count)
+        if page_count < PARALLEL_MIN_PAGES or workers < 2:
+            texts = []
+            for page in pdf.pages:
+                if should_stop and should_stop():
+                    raise ParseCancelled()
+                texts.append(page.extract_text() or '')
+                if progress:
+                    progress(len(texts), page_count)
+            return texts
+
+    texts = [''] * page_count
+    # Linux の既定（fork）だと、Qt のスレッドが動いているアプリをそのまま複製してしまい固まることがあるので、
+    # ワーカーは新しく起動したプロセスにする（起動用の budget_app.py も読み込まれるが、
+    # __main__ のときだけアプリを起動するので、ワーカーでは画面は開かない）
+    executor = ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+        initializer=_open_worker_pdf, initargs=(file_path,)
+    )
+    try:
+        futures = [executor.submit(_extract_worker_page, index) for index in range(page_count)]
+        for done, future in enumerate(as_completed(futures), start=1):
+            if should_stop and should_stop():
+                raise ParseCancelled()
+            page_index, text = future.result()
+            texts[page_index] = text  # 終わった順に届くので、ページ番号の位置に入れる
+            if progress:
+                progress(done, page_count)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+    return texts
+
+
+# --- 解析 ---------------------------------------------------------------------
+
+def parse_entries(page_texts):
+    """ページの文字から日付付きの行 (月, 日, 残り) をページ順・行順に取り出す"""
+    entries = []
+    for text in page_texts:
+        for line in text.split('\n'):
+            m = LINE_PATTERN.match(line.strip())
+            if m:
+                entries.append((int(m.group(1)), int(m.group(2)), m.group(3)))
+    return entries
+
+
+def build_records(entries, start_year):
+    """日付付きの行から交通費の明細 [{'date', 'amount', 'description', 'category'}, ...] を作る
+
+    年は start_year から始め、月が前の行より小さくなるたびに1年進める（ページの境目も含めて数える）。
+    """
+    results = []
+    year = start_year
+    prev_month = None
+
+    for month, day, rest in entries:
+        # 年の推定: 月が前の行より小さくなったら年を+1
+        if prev_month is not None and month < prev_month:
+            year += 1
+        prev_month = month
+
+        # 種別を判定
+        # 繰越行: "繰 ..."、チャージ行: "ｶｰﾄﾞ ..." (差額が正)
+        if rest.startswith('繰') or rest.startswith('ｶｰﾄﾞ'):
+            continue
+
+        ride_match = RIDE_PATTERN.match(rest)
+        if not ride_match:
+            continue
+
+        diff = int(ride_match.group(4).replace(',', ''))
+        if diff >= 0:
+            continue  # 正の差額はチャージ等なのでスキップ
+
+        # 「地　渋谷」→「渋谷」のように整形
+        station_from = clean_station_name(ride_match.group(2).strip())
+        station_to = clean_station_name(ride_match.group(3).strip())
+
+        results.append({
+            'date': f'{year}-{month:02d}-{day:02d}',
+            'amount': abs(diff),
+            'description': f'PASMO: {station_from} → {station_to}',
+            'category': '交通費'
+        })
+
+    return results
+
+
+def parse_pasmo_pdf(file_path, start_year, progress=None, should_stop=None, max_workers=None):
+    """PASMO PDFを解析して交通費の明細のリストを返す（引数は extract_page_texts と同じ）"""
+    page_texts = extract_page_texts(file_path, progress, should_stop, max_workers)
+    return build_records(parse_entries(page_texts), start_year)
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""DB問い合わせのバックグラウンド実行
+
+検索欄に1文字入力するたびにGUIスレッドでSQLを実行すると、結果が返るまで入力が止まる。
+QueryScheduler は問い合わせを専用のワーカースレッド（QThreadPool）で実行し、
+  - 短い間隔で続いた依頼はまとめて最後の1回だけ実行する（デバウンス）
+  - 新しい依頼が来たら古い依頼は取り消す（実行中なら SQLite の interrupt で中断する）
+  - 結果はGUIスレッドで、最新の依頼の分だけ callback に渡す
+という動きをする。
+
+使い方:
+    scheduler = QueryScheduler(self)
+    scheduler.schedule('table', lambda: query.fetch_page(0, 200), self.show_rows, delay_ms=250)
+
+job はワーカースレッドで実行されるので、Qtのウィジェットには触らないこと。
+DBには db_utils の関数（execute_query など）で問い合わせれば、ワーカースレッド用の接続が使われる
+（WALモードなので、GUIスレッドの書き込みと並行して読める）。"""
+import threading
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, QTimer, pyqtSignal
+from db_utils import get_db_connection
+
+
+# 入力が止まってから問い合わせるまでの待ち時間（ミリ秒）
+DEFAULT_DELAY_MS = 250
+
+
+class _TaskSignals(QObject):
+    """ワーカースレッドからGUIスレッドへ結果を渡すためのシグナル"""
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+
+class _QueryTask(QRunnable):
+    """1回分の問い合わせ"""
+
+    def __init__(self, job):
+        super().__init__()
+        self.setAutoDelete(False)  # 取り消せるよう QueryScheduler が参照を持つ
+        self.job = job
+        self.signals = _TaskSignals()
+        self.cancelled = False
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def run(self):
+        if self.cancelled:
+            return
+        with self._lock:
+            self._conn = get_db_connection()
+        try:
+            result = self.job()
+        except Exception as e:
+            if not self.cancelled:
+                self.signals.failed.emit(str(e))
+            return
+        finally:
+            # 実行が終わった後の cancel() で、同じ接続の次の問い合わせを中断しないようにする
+            with self._lock:
+                self._conn = None
+        if not self.cancelled:
+            self.signals.finished.emit(result)
+
+    def cancel(self):
+        """取り消す（実行中ならSQLの実行を中断する）"""
+        self.cancelled = True
+        with self._lock:
+            if self._conn is not None:
+                self._conn.interrupt()
+
+
+class QueryScheduler(QObject):
+    """問い合わせを key ごとに「最新の1件だけ」バックグラウンドで実行する"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        # ワーカーは1本だけにして、そのスレッドのDB接続を使い回す
+        self._pool = QThreadPool(self)
+        self._pool.setMaxThreadCount(1)
+        self._pool.setExpiryTimeout(-1)
+        self._timers = {}   # {key: 待ち時間のタイマー}
+        self._pending = {}  # {key: (job, callback, error_callback)} 待ち時間が過ぎたら実行する依頼
+        self._tasks = {}    # {key: 実行待ち・実行中のタスク}
+
+    def schedule(self, key, job, callback, delay_ms=0, error_callback=None):
+        """job をワーカースレッドで実行し、結果を callback(result) に渡す
+
+        同じ key の古い依頼は取り消され、その結果は callback に渡らない。
+        delay_ms の間に同じ key の依頼が続いたら、最後の1件だけ実行する。
+        """
+        self.cancel(key)
+        self._pending[key] = (job, callback, error_callback)
+        timer = self._timers.get(key)
+        if timer is None:
+            timer = QTimer(self)
+            timer.setSingleShot(True)
+            timer.timeout.connect(lambda key=key: self._start(key))
+            self._timers[key] = timer
+        timer.start(delay_ms)
+
+    def cancel(self, key):
+        """key の依頼を取り消す（待ち中・実行待ち・実行中のどれでも）"""
+        timer = self._timers.get(key)
+        if timer is not None:
+            timer.stop()
+        self._pending.pop(key, None)
+        task = self._tasks.pop(key, None)
+        if task is not None:
+            task.cancel()
+            self._pool.tryTake(task)  # まだ始まっていなければキューから外す
+
+    def is_busy(self, key):
+        """key の依頼が待ち中・実行中かどうか"""
+        return key in self._pending or key in self._tasks
+
+    def shutdown(self, timeout_ms=1000):
+        """全ての依頼を取り消し、実行中の問い合わせが終わるのを待つ（アプリ終了時用）"""
+        for key in list(self._timers):
+            self.cancel(key)
+        self._pool.waitForDone(timeout_ms)
+
+    def _start(self, key):
+        pending = self._pending.pop(key, None)
+        if pending is None:
+            return
+        job, callback, error_callback = pending
+        task = _QueryTask(job)
+        task.signals.finished.connect(lambda result: self._finish(key, task, callback, result))
+        task.signals.failed.connect(lambda message: self._fail(key, task, error_callback, message))
+        self._tasks[key] = task
+        self._pool.start(task)
+
+    def _finish(self, key, task, callback, result):
+        # 取り消された後に届いた結果は捨てる（最新の依頼の結果だけを反映する）
+        if self._tasks.get(key) is not task:
+            return
+        del self._tasks[key]
+        callback(result)
+
+    def _fail(self, key, task, error_callback, message):
+        if self._tasks.get(key) is not task:
+            return
+        del self._tasks[key]
+        if error_callback is not None:
+            error_callback(message)
+        else:
+            print(f"バックグラウンドの問い合わせでエラー ({key}): {message}")
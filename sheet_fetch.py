@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""Google Sheets公開CSVの取得（Qtに依存しない）
+
+楽天PAYの明細はGoogle Sheetsの公開CSVから取り込むが、以前は取込のたびにシート全体を
+ダウンロードし、全行を解析していた。ここでは
+
+- 前回の本文と ETag / Last-Modified をディスクに残し、次からは条件付きリクエスト
+  （If-None-Match / If-Modified-Since）で取得する。シートが変わっていなければ
+  サーバーは本文を返さない（304）ので、残しておいた本文を使う。
+- rows_since で、前回取り込んだ日以降の行だけを残してから pandas に渡す。
+
+取得は取込ダイアログのワーカースレッド（credit_card_import.SheetFetchThread）から呼ぶ。
+"""
+import csv
+import hashlib
+import io
+import json
+import os
+from datetime import datetime
+
+import requests
+
+
+SHEET_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sheet_cache')
+FETCH_TIMEOUT = 15
+
+
+def _cache_paths(url, cache_dir):
+    """URLごとの (本文のパス, ETag などを入れるJSONのパス)"""
+    key = hashlib.blake2b(url.encode('utf-8'), digest_size=16).hexdigest()
+    return os.path.join(cache_dir, f'{key}.csv'), os.path.join(cache_dir, f'{key}.json')
+
+
+def _write_atomic(path, text):
+    """書き終えてから置き換える（途中で落ちても中途半端なファイルは残らない）"""
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'w', encoding='utf-8', newline='') as f:
+        f.write(text)
+    os.replace(temp_path, path)
+
+
+def fetch_sheet_csv(url, timeout=FETCH_TIMEOUT, cache_dir=SHEET_CACHE_DIR):
+    """公開CSVの本文を取得し、(本文, 前回から変わっていなかったか) を返す
+
+    前回の本文が残っていれば条件付きリクエストにし、304 なら残しておいた本文を返す。
+    通信に失敗したときは requests の例外をそのまま投げる（古い本文では取り込まない）。
+    """
+    body_path, meta_path = _cache_paths(url, cache_dir)
+    meta = {}
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        pass
+
+    headers = {}
+    if meta.get('url') == url and os.path.exists(body_path):
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+
+    response = requests.get(url, headers=headers, timeout=timeout)
+    if response.status_code == 304 and headers:
+        try:
+            with open(body_path, 'r', encoding='utf-8', newline='') as f:
+                return f.read(), True
+        except OSError:
+            # 残しておいた本文が消えていたら、条件を付けずに取り直す
+            response = requests.get(url, timeout=timeout)
+    response.raise_for_status()
+    response.encoding = 'utf-8'
+    text = response.text
+
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # 本文を先に書く（ETag だけ新しくなって本文が古いままになることがないように）
+        _write_atomic(body_path, text)
+        _write_atomic(meta_path, json.dumps({
+            'url': url,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+        }, ensure_ascii=False))
+    except OSError as e:
+        # 残せなくても次回は全体を取り直すだけなので、取込は続ける
+        print(f"取得したCSVを保存できません: {e}")
+    return text, False
+
+
+def rows_since(csv_text, date_column, date_format, since):
+    """CSVの本文から、日付が since（'YYYY-MM-DD'）以降の行だけを残した本文を返す
+
+    since が None なら本文をそのまま返す。見出しに date_column が無いときもそのまま返す
+    （列マッピングで別の列を選ぶかもしれないため）。日付が読めない行は残す
+    （取込の変換で除かれるか、列マッピングで選び直した列で読まれる）。
+    since と同じ日の行も残すので、その日の取り込み済みの明細は重複判定で除かれる。
+    """
+    if not since:
+        return csv_text
+    reader = csv.reader(io.StringIO(csv_text))
+    header = next(reader, None)
+    if header is None or date_column not in header:
+        return csv_text
+    index = header.index(date_column)
+
+    output = io.StringIO()
+    writer = csv.writer(output, lineterminator='\n')
+    writer.writerow(header)
+    days = {}  # 同じ日付の文字列は1回だけ変換する
+    for row in reader:
+        value = row[index] if index < len(row) else ''
+        if value not in days:
+            try:
+                days[value] = datetime.strptime(value.strip(), date_format).strftime('%Y-%m-%d')
+            except ValueError:
+                days[value] = None
+        day = days[value]
+        if day is None or day >= since:
+            writer.writerow(row)
+    return output.getvalue()
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""テストの共通設定（リポジトリ直下のモジュールの読み込み・一時DB・計測用のマーク）
+
+@pytest.mark.benchmark を付けたテストは時間を計って表示するだけのもので、
+pytest --benchmark -s tests のように --benchmark を付けたときだけ実行する。
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db_utils  # noqa: E402
+
+
+def pytest_addoption(parser):
+    parser.addoption('--benchmark', action='store_true', help='計測（benchmark マーク付きのテスト）も実行する')
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'benchmark: 時間を計るテスト（--benchmark を付けたときだけ実行する）')
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption('--benchmark'):
+        return
+    skip = pytest.mark.skip(reason='計測は --benchmark を付けたときだけ実行する')
+    for item in items:
+        if 'benchmark' in item.keywords:
+            item.add_marker(skip)
+
+
+# main_window.BudgetApp.init_database と同じ expenses テーブルと日付のインデックス
+EXPENSES_SCHEMA = '''
+    CREATE TABLE expenses (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        date TEXT NOT NULL,
+        category TEXT NOT NULL,
+        amount REAL NOT NULL,
+        description TEXT
+    );
+    CREATE INDEX idx_expenses_date ON expenses(date);
+    CREATE INDEX idx_expenses_category_date ON expenses(category, date);
+    CREATE INDEX idx_expenses_amount ON expenses(amount);
+'''
+
+# main_window.BudgetApp.init_database と同じ categories テーブル（カテゴリ別表示の並び順）
+CATEGORIES_SCHEMA = '''
+    CREATE TABLE categories (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL UNIQUE,
+        sort_order INTEGER DEFAULT 0,
+        is_default BOOLEAN DEFAULT 0
+    );
+'''
+
+
+@pytest.fixture
+def expense_db(tmp_path, monkeypatch):
+    """一時ディレクトリのDBを既定のDB（db_utils.DB_PATH）にして expenses テーブルを作る"""
+    db_path = str(tmp_path / 'budget.db')
+    monkeypatch.setattr(db_utils, 'DB_PATH', db_path)
+    db_utils.get_db_connection(db_path).executescript(EXPENSES_SCHEMA)
+    yield db_path
+    db_utils.close_db_connection(db_path)
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""card_formats.transform_rows が以前の1行ずつの変換と同じ明細を作ることを確かめる"""
+import copy
+import random
+
+import pandas as pd
+import pytest
+
+from card_formats import FORMAT_PRESETS, header_mapping, transform_rows
+from db_utils import normalize_text
+
+
+def baseline_rows(csv_data, fmt, columns):
+    """以前の CreditCardImportDialog.generate_preview_data と同じ処理（iterrows で1行ずつ変換）"""
+    rows = []
+    credit_prefix = normalize_text(fmt.get('description_prefix', 'クレジットカード: '))
+    for _, row in csv_data.iterrows():
+        try:
+            date_obj = pd.to_datetime(str(row[columns['date']]), format=fmt['date_format'])
+            formatted_date = date_obj.strftime('%Y-%m-%d')
+
+            amount_str = str(row[columns['amount']]).replace(',', '').replace('円', '').strip()
+            if amount_str == '' or amount_str == 'nan' or amount_str == '-':
+                continue
+            amount = float(amount_str)
+            if fmt['negation_needed']:
+                amount = -amount
+            amount = abs(amount)
+            if amount == 0:
+                continue
+
+            description = str(row[columns['description']])
+            normalized_description = normalize_text(description)
+            excluded = False
+            for exclude_keyword in fmt['exclude_keywords']:
+                normalized_exclude = normalize_text(exclude_keyword)
+                if normalized_exclude.startswith(credit_prefix):
+                    normalized_exclude = normalized_exclude[len(credit_prefix):]
+                if normalized_exclude and normalized_exclude in normalized_description:
+                    excluded = True
+                    break
+            if excluded:
+                continue
+
+            category = 'その他'
+            for keyword, mapped_category in fmt['category_mapping'].items():
+                if normalize_text(keyword) in normalized_description:
+                    category = mapped_category
+                    break
+
+            rows.append({'date': formatted_date, 'amount': amount,
+                         'description': description, 'category': category})
+        except Exception:
+            continue
+    return rows
+
+
+FULLWIDTH_DIGITS = str.maketrans('0123456789', '０１２３４５６７８９')
+
+
+def fuzzed_statement(rng, count):
+    """全角数字・カンマ・円・空欄などが混ざった明細CSV（DataFrame）を作る"""
+    fmt = FORMAT_PRESETS['一般的なクレジットカード']
+    descriptions = (list(fmt['category_mapping']) + fmt['exclude_keywords']
+                    + ['ｾﾌﾞﾝｲﾚﾌﾞﾝ', 'Amazon.co.jp', 'ＡＭＡＺＯＮ', 'スーパー マルエツ', ''])
+    records = []
+    for _ in range(count):
+        value = rng.randint(0, 250000)
+        text = f'{value:,}' if rng.random() < 0.5 else str(value)
+        if rng.random() < 0.4:
+            text = text.translate(FULLWIDTH_DIGITS)
+        if rng.random() < 0.3:
+            text = '-' + text
+        if rng.random() < 0.2:
+            text += '円'
+        if rng.random() < 0.2:
+            text = f' {text}　'
+        text = rng.choice([text] * 8 + ['', '-', 'abc', '1.5.2'])
+        date = rng.choice(['2025/01/31', '2025/2/3', '2024/12/31', '2025-01-31', '', '2025/13/01'])
+        records.append({'利用日': date, '利用金額': text,
+                        '利用店名・商品名': rng.choice(descriptions)})
+    return pd.DataFrame(records, dtype=str)
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_transform_rows_matches_per_row_baseline(seed):
+    fmt = copy.deepcopy(FORMAT_PRESETS['一般的なクレジットカード'])
+    csv_data = fuzzed_statement(random.Random(seed), 600)
+    columns = header_mapping(fmt)
+
+    expected = baseline_rows(csv_data, fmt, columns)
+    # 以前の変換で取り込まれていた全角数字の行が、比べる対象に入っていること
+    fullwidth = csv_data[csv_data['利用金額'].str.contains('[０-９]')]
+    assert baseline_rows(fullwidth, fmt, columns)
+    assert transform_rows(csv_data, fmt, columns) == expected
+
+
+def test_transform_rows_reads_fullwidth_amounts():
+    fmt = copy.deepcopy(FORMAT_PRESETS['楽天PAY'])
+    csv_data = pd.DataFrame({
+        '日付': ['2025/03/01'] * 5,
+        '金額': ['１２３４', '１，２３４円', '－５００', '＋８０', '－'],
+        '店舗名': ['A', 'B', 'C', 'D', 'E'],
+    }, dtype=str)
+
+    rows = transform_rows(csv_data, fmt, header_mapping(fmt))
+    assert [(row['description'], row['amount']) for row in rows] == [
+        ('A', 1234.0), ('B', 1234.0), ('C', 500.0), ('D', 80.0)
+    ]
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""カテゴリ別表示（ExpenseQuery の sort='カテゴリ別'）のページ分け"""
+import pytest
+
+pytest.importorskip('PyQt5')
+
+from db_utils import get_db_connection, import_expenses, init_monthly_category_totals  # noqa: E402
+from expense_query import ExpenseQuery  # noqa: E402
+from conftest import CATEGORIES_SCHEMA  # noqa: E402
+
+GROUPED = 'カテゴリ別'
+
+
+@pytest.fixture
+def expenses(expense_db):
+    conn = get_db_connection()
+    conn.executescript(CATEGORIES_SCHEMA)
+    conn.executemany('INSERT INTO categories (name, sort_order) VALUES (?, ?)',
+                     [('交通費', 0), ('食費', 1), ('娯楽', 2)])
+    init_monthly_category_totals()
+    rows = [('2025-04-%02d' % (day + 1), '食費', 100 + day, f'食{day}') for day in range(5)]
+    rows += [('2025-04-%02d' % (day + 1), '交通費', 200 + day, f'交{day}') for day in range(3)]
+    rows += [('2025-04-10', '娯楽', 300, '娯0')]
+    rows += [('2025-04-%02d' % (day + 1), '雑費', 400 + day, f'雑{day}') for day in range(2)]  # categories に無い
+    rows += [('2025-05-01', '食費', 500, '翌月')]
+    import_expenses(rows)
+    return expense_db
+
+
+def expected(month=4):
+    """カテゴリの並び順（categories に無いものは最後にカテゴリ名順）→ 日付の新しい順"""
+    order = {'交通費': 0, '食費': 1, '娯楽': 2}
+    pattern = f'2025-{month:02d}-%' if month else '%'
+    rows = get_db_connection().execute(
+        'SELECT id, date, category, amount, description FROM expenses WHERE date LIKE ?', (pattern,)
+    ).fetchall()
+    rows.sort(key=lambda row: (row[1], row[0]), reverse=True)
+    return sorted(rows, key=lambda row: (row[2] not in order, order.get(row[2], 0), row[2]))
+
+
+def read_pages(query, page_size):
+    rows = []
+    while True:
+        page = query.fetch_page(len(rows), page_size)
+        if not page:
+            return rows
+        assert len(page) <= page_size
+        rows.extend(page)
+
+
+@pytest.mark.parametrize('page_size', [1, 2, 3, 4, 100])
+def test_pages_cross_category_boundaries(expenses, page_size):
+    query = ExpenseQuery(year=2025, month=4, sort=GROUPED)
+    assert query.uses_rollup
+    rows = read_pages(query, page_size)
+    assert rows == expected()
+    assert query.count() == len(rows) == 11
+
+
+def test_group_summaries_follow_category_order(expenses):
+    query = ExpenseQuery(year=2025, month=4, sort=GROUPED)
+    assert list(query.group_summaries().items()) == [
+        ('交通費', (3, 603.0)), ('食費', (5, 510.0)), ('娯楽', (1, 300.0)), ('雑費', (2, 801.0)),
+    ]
+
+
+def test_whole_period_reads_groups_from_expenses(expenses):
+    query = ExpenseQuery(sort=GROUPED)
+    assert not query.uses_rollup
+    assert read_pages(query, 3) == expected(month=None)
+    assert query.group_summaries()['食費'] == (6, 1010.0)
+
+
+@pytest.mark.parametrize('limit', [2, 3, 7, 8, 50])
+def test_limit_stops_inside_a_category(expenses, limit):
+    query = ExpenseQuery(year=2025, month=4, sort=GROUPED, limit=limit)
+    rows = read_pages(query, 3)
+    assert rows == expected()[:limit]
+    assert query.count() == len(rows)
+    assert query.fetch_page(limit, 3) == []
+
+
+def test_filtered_pages(expenses):
+    query = ExpenseQuery(year=2025, month=4, sort=GROUPED, amount_min=102, amount_max=400)
+    rows = read_pages(query, 2)
+    assert rows == [row for row in expected() if 102 <= row[3] <= 400]
+    assert sum(count for count, _ in query.group_summaries().values()) == len(rows)
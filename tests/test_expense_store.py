@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""ExpenseStore の差分反映と変更ログ（expense_changes）の後始末"""
+import pytest
+
+from db_utils import execute_query, fetch_df, import_expenses, init_expense_change_log
+from expense_store import ExpenseStore
+
+
+ROWS = [
+    ('2025-04-01', '食費', 1200.0, 'A'),
+    ('2025-04-02', '交通費', 220.0, 'B'),
+    ('2025-05-03', '食費', 580.0, 'C'),
+]
+
+
+@pytest.fixture
+def change_log(expense_db):
+    import_expenses(ROWS)
+    init_expense_change_log()
+    return expense_db
+
+
+def log_size():
+    return execute_query('SELECT COUNT(*) FROM expense_changes', fetch_one=True)[0]
+
+
+def assert_matches_table(store):
+    expected = fetch_df('SELECT id, date, category, amount, description FROM expenses ORDER BY date, id')
+    actual = store.all()
+    assert actual['id'].tolist() == expected['id'].tolist()
+    assert actual['category'].tolist() == expected['category'].tolist()
+    assert actual['amount'].tolist() == expected['amount'].tolist()
+    assert actual['date'].dt.strftime('%Y-%m-%d').tolist() == expected['date'].tolist()
+
+
+def test_nothing_is_logged_without_a_store(change_log):
+    import_expenses([('2025-04-05', '食費', 100, 'D')])
+    execute_query("UPDATE expenses SET amount = 1 WHERE description = 'A'")
+    execute_query("DELETE FROM expenses WHERE description = 'B'")
+    assert log_size() == 0
+
+
+def test_store_applies_changes_and_prunes_log(change_log):
+    store = ExpenseStore()
+    assert len(store.all()) == 3
+
+    import_expenses([('2025-04-05', '日用品', 100, 'D')])
+    execute_query("UPDATE expenses SET amount = 1500, date = '2025-06-01' WHERE description = 'A'")
+    execute_query("DELETE FROM expenses WHERE description = 'B'")
+    assert log_size() > 0
+
+    assert_matches_table(store)
+    assert log_size() == 0
+
+
+def test_log_is_kept_until_every_store_has_read_it(change_log):
+    # 別のプロセスで動いているストアの代わりに、ストアを2つ使う
+    first, second = ExpenseStore(), ExpenseStore()
+    first.all()
+    second.all()
+
+    execute_query("DELETE FROM expenses WHERE description = 'A'")
+    assert_matches_table(first)
+    assert log_size() == 1   # second がまだ読んでいない
+
+    assert_matches_table(second)
+    assert log_size() == 0
+
+
+def test_store_reloads_after_log_is_reset(change_log):
+    store = ExpenseStore()
+    store.all()
+
+    # 別に起動したアプリが変更ログを空にしたあとの変更は、ログに残らない
+    init_expense_change_log()
+    execute_query("DELETE FROM expenses WHERE description = 'A'")
+    assert log_size() == 0
+
+    assert_matches_table(store)
+    # 読み直したときに登録し直すので、その後の変更は差分で反映される
+    import_expenses([('2025-04-05', '食費', 100, 'D')])
+    assert log_size() == 1
+    assert_matches_table(store)
+
+
+def test_closed_store_stops_logging(change_log):
+    store = ExpenseStore()
+    store.all()
+    import_expenses([('2025-04-04', '食費', 100, 'E')])
+    store.close()
+    assert log_size() == 0   # 読む人がいなくなったので残りのログも消える
+
+    import_expenses([('2025-04-05', '食費', 100, 'D')])
+    assert log_size() == 0
+    assert_matches_table(store)  # 閉じたあとに使えば読み直す
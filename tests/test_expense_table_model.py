@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""支出一覧のモデル（ExpenseTableModel）とカテゴリ編集用デリゲート（CategoryDelegate）"""
+import os
+
+import pytest
+
+pytest.importorskip('PyQt5')
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PyQt5.QtCore import Qt  # noqa: E402
+from PyQt5.QtWidgets import QApplication, QStyleOptionViewItem, QWidget  # noqa: E402
+
+import expense_table_model  # noqa: E402
+from db_utils import get_db_connection, import_expenses, init_monthly_category_totals  # noqa: E402
+from expense_query import ExpenseQuery  # noqa: E402
+from expense_table_model import (  # noqa: E402
+    COLUMN_AMOUNT, COLUMN_CATEGORY, COLUMN_DATE, COLUMN_ID, CategoryDelegate, ExpenseTableModel,
+)
+from conftest import CATEGORIES_SCHEMA  # noqa: E402
+
+ROWS = [
+    (1, '2025-04-01', '食費', 1200.0, 'スーパー'),
+    (2, '2025-04-02', '交通費', 300.0, None),
+]
+
+
+@pytest.fixture
+def app():
+    return QApplication.instance() or QApplication([])
+
+
+@pytest.fixture
+def model(app):
+    model = ExpenseTableModel()
+    model.set_rows(ROWS)
+    return model
+
+
+@pytest.fixture
+def expenses(expense_db, monkeypatch):
+    monkeypatch.setattr(expense_table_model, 'PAGE_SIZE', 3)
+    conn = get_db_connection()
+    conn.executescript(CATEGORIES_SCHEMA)
+    conn.executemany('INSERT INTO categories (name, sort_order) VALUES (?, ?)', [('交通費', 0), ('食費', 1)])
+    init_monthly_category_totals()
+    import_expenses([('2025-04-%02d' % (day + 1), '交通費', 100, f'交{day}') for day in range(4)]
+                    + [('2025-04-%02d' % (day + 1), '食費', 200, f'食{day}') for day in range(3)])
+    return expense_db
+
+
+def edits(model):
+    received = []
+    model.edit_requested.connect(lambda row, column, value: received.append((row, column, value)))
+    return received
+
+
+def test_display_and_edit_text(model):
+    assert (model.rowCount(), model.columnCount()) == (2, 5)
+    assert model.data(model.index(0, COLUMN_AMOUNT)) == '1,200円'
+    assert model.data(model.index(0, COLUMN_AMOUNT), Qt.EditRole) == '1200'
+    assert model.data(model.index(1, 4)) == ''
+    assert model.headerData(COLUMN_CATEGORY, Qt.Horizontal) == 'カテゴリ'
+
+
+def test_id_column_is_not_editable(model):
+    assert not model.flags(model.index(0, COLUMN_ID)) & Qt.ItemIsEditable
+    assert model.flags(model.index(0, COLUMN_DATE)) & Qt.ItemIsEditable
+
+
+def test_set_data_only_requests_real_changes(model):
+    received = edits(model)
+    assert not model.setData(model.index(0, COLUMN_AMOUNT), '1200')
+    assert model.setData(model.index(0, COLUMN_AMOUNT), '1500')
+    assert received == [(0, COLUMN_AMOUNT, '1500')]
+    # モデル自体は書き換えない（保存に成功した画面が update_row で反映する）
+    assert model.row_data(0) == ROWS[0]
+    model.update_row(0, (1, '2025-04-01', '食費', 1500.0, 'スーパー'))
+    assert model.data(model.index(0, COLUMN_AMOUNT)) == '1,500円'
+
+
+def test_grouped_pages_add_one_header_per_category(expenses, app):
+    model = ExpenseTableModel()
+    model.set_query(ExpenseQuery(year=2025, month=4, sort='カテゴリ別'))
+    assert model.rowCount() == 4  # 見出し + 3件
+    while model.canFetchMore():
+        model.fetchMore()
+    assert model.header_rows() == [0, 5]
+    assert model.data(model.index(0, COLUMN_DATE)) == '【交通費】 (4件、合計: 400円)'
+    assert model.data(model.index(5, COLUMN_DATE)) == '【食費】 (3件、合計: 600円)'
+    assert not model.flags(model.index(5, COLUMN_DATE)) & Qt.ItemIsSelectable
+    assert model.row_data(5) is None
+    assert [model.row_data(row)[COLUMN_CATEGORY] for row in range(model.rowCount()) if not model.is_header(row)] \
+        == ['交通費'] * 4 + ['食費'] * 3
+    received = edits(model)
+    assert not model.setData(model.index(5, COLUMN_DATE), '2025-04-01')
+    assert received == []
+
+
+def test_page_loader_ignores_pages_of_an_old_query(expenses, app):
+    model = ExpenseTableModel()
+    requests = []
+    model.page_loader = lambda query, offset, limit, callback: requests.append((offset, limit, callback))
+    old_query = ExpenseQuery(year=2025, month=4)
+    model.set_query(old_query)
+    model.fetchMore()
+    model.fetchMore()  # 読み込み中は重ねて依頼しない
+    assert [request[:2] for request in requests] == [(3, 3)]
+
+    model.set_query(ExpenseQuery(year=2025, month=4, category='食費'))
+    requests[0][2](old_query.fetch_page(3, 3))
+    assert model.rowCount() == 3
+    assert {model.row_data(row)[COLUMN_CATEGORY] for row in range(3)} == {'食費'}
+
+
+def test_category_delegate(expenses, model):
+    delegate = CategoryDelegate()
+    parent = QWidget()
+    index = model.index(0, COLUMN_CATEGORY)
+    editor = delegate.createEditor(parent, QStyleOptionViewItem(), index)
+    assert [editor.itemText(i) for i in range(editor.count())] == ['交通費', '食費']
+    delegate.setEditorData(editor, index)
+    assert editor.currentText() == '食費'
+
+    received = edits(model)
+    editor.setCurrentIndex(0)
+    delegate.setModelData(editor, model, index)
+    assert received == [(0, COLUMN_CATEGORY, '交通費')]
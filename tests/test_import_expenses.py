@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""取込の重複判定（fingerprint 列の UNIQUE インデックスと INSERT OR IGNORE）"""
+import time
+
+import pytest
+
+from db_utils import (
+    ensure_expense_fingerprints, execute_query, get_db_connection, import_expenses,
+    insert_expense, shift_expense_dates, update_expense
+)
+from cli_import import import_rakuten_csv
+
+
+ROWS = [
+    ('2025-04-01', '食費', 1200.0, 'クレジットカード: ﾏﾙｴﾂ'),
+    ('2025-04-02', '交通費', 220.0, 'PASMO: 渋谷→新宿'),
+    ('2025-04-02', '食費', 580.0, 'クレジットカード: セブンイレブン'),
+]
+
+
+def expense_count():
+    return execute_query('SELECT COUNT(*) FROM expenses', fetch_one=True)[0]
+
+
+def test_second_import_is_ignored(expense_db):
+    assert import_expenses(ROWS) == (3, 0)
+    assert import_expenses(ROWS) == (0, 3)
+    assert expense_count() == 3
+
+
+def test_only_new_rows_are_added(expense_db):
+    import_expenses(ROWS[:2])
+    assert import_expenses(ROWS) == (1, 2)
+    assert expense_count() == 3
+
+
+def test_duplicates_within_one_statement(expense_db):
+    assert import_expenses(ROWS + ROWS[:1]) == (3, 1)
+
+
+def test_same_expense_written_differently_is_duplicate(expense_db):
+    import_expenses(ROWS)
+    # 全角・半角、金額の書き方、余分な空白、時刻つきの日付が違っても同じ支出
+    variants = [
+        ('2025-04-01 10:30:00', '食費', '1200', 'クレジットカード:  マルエツ'),
+        ('2025-04-02', '食費', 580, 'クレジットカード: セブンイレブン '),
+    ]
+    assert import_expenses(variants) == (0, 2)
+
+
+def test_different_amount_or_day_is_not_duplicate(expense_db):
+    import_expenses(ROWS)
+    assert import_expenses([
+        ('2025-04-01', '食費', 1201.0, 'クレジットカード: ﾏﾙｴﾂ'),
+        ('2025-04-03', '食費', 1200.0, 'クレジットカード: ﾏﾙｴﾂ'),
+    ]) == (2, 0)
+
+
+def test_skip_duplicates_false_adds_every_row(expense_db):
+    import_expenses(ROWS)
+    assert import_expenses(ROWS, skip_duplicates=False) == (3, 0)
+    assert import_expenses(ROWS, skip_duplicates=False) == (3, 0)
+    assert expense_count() == 9
+
+
+def test_existing_expenses_get_fingerprints(expense_db):
+    # fingerprint 列を作る前から同じ支出が2件ある古いDB
+    get_db_connection().executemany(
+        'INSERT INTO expenses (date, category, amount, description) VALUES (?, ?, ?, ?)',
+        [ROWS[0], ROWS[0], ROWS[1]]
+    )
+    ensure_expense_fingerprints()
+    assert execute_query('SELECT COUNT(fingerprint) FROM expenses', fetch_one=True)[0] == 2
+
+    assert import_expenses(ROWS) == (1, 2)
+    assert expense_count() == 4
+
+
+def test_hand_entered_expense_is_not_imported_again(expense_db):
+    insert_expense('2025-04-01', '食費', 1200, 'クレジットカード: ﾏﾙｴﾂ')
+    assert import_expenses(ROWS) == (2, 1)
+    assert expense_count() == 3
+
+
+def test_same_expense_entered_twice_by_hand(expense_db):
+    # 手入力では同じ内容の支出も追加できる（重複判定に使うのは最初の1件だけ）
+    first = insert_expense('2025-04-01', '食費', 1200, 'X')
+    second = insert_expense('2025-04-01', '食費', 1200, 'X')
+    assert first != second
+    assert import_expenses([('2025-04-01', '食費', 1200, 'X')]) == (0, 1)
+    assert expense_count() == 2
+
+
+def test_shifted_expense_does_not_hide_original_line(expense_db):
+    import_expenses([('2025-04-01', '食費', 1200, 'X')])
+    assert shift_expense_dates(1, where='1') == 1
+
+    # ずらした支出と同じ内容（2025-04-02）は重複、元の明細（2025-04-01）は新しい支出
+    assert import_expenses([('2025-04-02', '食費', 1200, 'X')]) == (0, 1)
+    assert import_expenses([('2025-04-01', '食費', 1200, 'X')]) == (1, 0)
+
+
+def test_shift_onto_each_other_keeps_fingerprints(expense_db):
+    import_expenses([('2025-04-01', '食費', 1200, 'X'), ('2025-04-02', '食費', 1200, 'X')])
+    assert shift_expense_dates(1, where='1') == 2
+    assert execute_query('SELECT COUNT(fingerprint) FROM expenses', fetch_one=True)[0] == 2
+    assert import_expenses([('2025-04-02', '食費', 1200, 'X'), ('2025-04-03', '食費', 1200, 'X')]) == (0, 2)
+
+
+def test_edited_expense_is_compared_by_new_values(expense_db):
+    import_expenses(ROWS)
+    expense_id = execute_query('SELECT id FROM expenses WHERE amount = 1200', fetch_one=True)[0]
+    update_expense(expense_id, '2025-04-01', '食費', 1500, 'クレジットカード: ﾏﾙｴﾂ')
+
+    assert import_expenses([ROWS[0]]) == (1, 0)
+    assert import_expenses([('2025-04-01', '食費', 1500, 'クレジットカード: ﾏﾙｴﾂ')]) == (0, 1)
+
+
+def test_edit_onto_existing_expense_is_allowed(expense_db):
+    import_expenses(ROWS)
+    expense_id = execute_query('SELECT id FROM expenses WHERE amount = 580', fetch_one=True)[0]
+    # 別の支出と同じ内容に書き換えても失敗しない（書き換えた支出の指紋は付かない）
+    update_expense(expense_id, *ROWS[0])
+    assert execute_query('SELECT amount FROM expenses WHERE id = ?', (expense_id,), fetch_one=True)[0] == 1200
+    assert execute_query('SELECT COUNT(fingerprint) FROM expenses', fetch_one=True)[0] == 2
+
+
+def test_cli_import_twice(expense_db, tmp_path):
+    csv_path = tmp_path / 'enavi202504.csv'
+    csv_path.write_text(
+        '利用日,利用店名・商品名,利用金額\n'
+        '2025/04/01,ﾏﾙｴﾂ,"1,200"\n'
+        '2025/04/02,セブンイレブン,580\n'
+        '2025/04/03,AMAZON.CO.JP,3980\n'
+        '2025/04/01,ﾏﾙｴﾂ,"1,200"\n',
+        encoding='utf-8-sig'
+    )
+    # かたまりをまたいだ重複も除かれる
+    assert import_rakuten_csv(str(csv_path), expense_db, chunksize=2)
+    assert expense_count() == 3
+    assert import_rakuten_csv(str(csv_path), expense_db, chunksize=2)
+    assert expense_count() == 3
+
+
+def test_large_statement_import(expense_db):
+    rows = [(f'2025-{i % 12 + 1:02d}-{i % 28 + 1:02d}', '食費', float(i % 5000 + 1), f'クレジットカード: 店{i}')
+            for i in range(5000)]
+    import_expenses(rows[:2500])
+    assert import_expenses(rows) == (2500, 2500)
+    assert expense_count() == 5000
+
+
+@pytest.mark.benchmark
+def test_large_statement_import_benchmark(expense_db):
+    """半分が取り込み済みの5万行の明細を取り込む時間（以前は1行ごとの SELECT で数十秒かかっていた）"""
+    rows = [(f'2025-{i % 12 + 1:02d}-{i % 28 + 1:02d}', '食費', float(i % 5000 + 1), f'クレジットカード: 店{i}')
+            for i in range(50000)]
+    import_expenses(rows[:25000])
+
+    start = time.perf_counter()
+    assert import_expenses(rows) == (25000, 25000)
+    print(f'\n5万行（うち2.5万行は重複）: {time.perf_counter() - start:.3f}s')
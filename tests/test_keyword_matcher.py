@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""KeywordMatcher が「キーワードを先頭から順に調べて最初に含まれていたもの」と同じ結果になることを確かめる"""
+import random
+
+import pytest
+
+from keyword_matcher import KeywordMatcher
+from cli_import import CATEGORY_RULES, classify_category
+
+
+def naive_first_index(keywords, text):
+    """以前の照合（キーワードごとに `keyword in text` を順に調べる）"""
+    for index, keyword in enumerate(keywords):
+        if keyword in text:
+            return index
+    return None
+
+
+def random_word(rng, alphabet, max_length):
+    return ''.join(rng.choice(alphabet) for _ in range(rng.randint(1, max_length)))
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_matches_naive_scan(seed):
+    rng = random.Random(seed)
+    # 文字の種類を少なくして、重なり・包含・同じキーワードの重複が多く起きるようにする
+    alphabet = rng.choice(['ab', 'abc', 'aｱア', 'ﾏﾙｴﾂ'])
+    keywords = [random_word(rng, alphabet, 5) for _ in range(rng.randint(1, 40))]
+    matcher = KeywordMatcher((keyword, f'値{index}') for index, keyword in enumerate(keywords))
+    assert len(matcher) == len(keywords)
+
+    for _ in range(200):
+        text = random_word(rng, alphabet, 30) if rng.random() < 0.95 else ''
+        expected = naive_first_index(keywords, text)
+        assert matcher.first_index(text) == expected
+        assert matcher.match(text, 'その他') == ('その他' if expected is None else f'値{expected}')
+
+
+def test_registration_order_wins():
+    matcher = KeywordMatcher([('ｾﾌﾞﾝｲﾚﾌﾞﾝ', 'コンビニ'), ('ｲﾚﾌﾞﾝ', '食費'), ('ｾﾌﾞﾝ', '日用品')])
+    assert matcher.match('ｾﾌﾞﾝｲﾚﾌﾞﾝ新宿') == 'コンビニ'
+    # 後に書いたキーワードが先に現れても、先に書いたキーワードが含まれていればそちらになる
+    matcher = KeywordMatcher({'新宿': '交通費', 'ｾﾌﾞﾝ': 'コンビニ'})
+    assert matcher.match('ｾﾌﾞﾝ新宿') == '交通費'
+
+
+def test_empty_keyword_matches_everything():
+    matcher = KeywordMatcher([('ｺｰﾋｰ', 'カフェ'), ('', 'その他'), ('ﾏﾙｴﾂ', '食費')])
+    assert matcher.match('ﾏﾙｴﾂ') == 'その他'
+    assert matcher.match('') == 'その他'
+    assert matcher.match('ｺｰﾋｰ') == 'カフェ'
+    assert KeywordMatcher([]).match('ﾏﾙｴﾂ', 'なし') == 'なし'
+
+
+def test_classify_category_matches_rules_in_order():
+    """cli_import の以前の classify_category（CATEGORY_RULES を順に大文字でそろえて調べる）と同じ結果"""
+    def naive(store_name):
+        store_upper = str(store_name).upper()
+        for keyword, category in CATEGORY_RULES.items():
+            if keyword.upper() in store_upper:
+                return category
+        return 'その他'
+
+    rng = random.Random(0)
+    keywords = list(CATEGORY_RULES)
+    names = ['', 'nan', '不明な店', 'amazon.co.jp']
+    for _ in range(500):
+        # ルールのキーワードを1〜3個つなげた店名（小文字で書かれたものも混ぜる）
+        parts = [keyword.lower() if rng.random() < 0.3 else keyword
+                 for keyword in rng.sample(keywords, rng.randint(1, 3))]
+        names.append(rng.choice([' ', '株式会社']).join(parts))
+    for name in names:
+        assert classify_category(name) == naive(name)
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""月で絞り込む条件（DateHelper.month_filter）が idx_expenses_date を使うことを確かめる"""
+import pytest
+
+pytest.importorskip('PyQt5')
+
+from common import DateHelper  # noqa: E402
+from db_utils import delete_expenses, execute_query, get_db_connection  # noqa: E402
+from expense_query import ExpenseQuery  # noqa: E402
+
+
+def query_plan(sql, params):
+    return ' / '.join(row[3] for row in get_db_connection().execute(f'EXPLAIN QUERY PLAN {sql}', params))
+
+
+@pytest.fixture
+def expenses(expense_db):
+    rows = [
+        ('2025-03-31', '食費', 100, 'A'),
+        ('2025-04-01', '食費', 200, 'B'),
+        ('2025-04-30 23:59:59', '交通費', 300, 'C'),
+        ('2025-05-01', '食費', 400, 'D'),
+        ('2024-12-31', '食費', 500, 'E'),
+        ('2025-01-01', '食費', 600, 'F'),
+    ]
+    get_db_connection().executemany(
+        'INSERT INTO expenses (date, category, amount, description) VALUES (?, ?, ?, ?)', rows
+    )
+    return expense_db
+
+
+def test_month_filter_covers_whole_month(expenses):
+    where, params = DateHelper.month_filter(2025, 4)
+    assert params == ('2025-04-01', '2025-05-01')
+    # 時刻つきの月末の支出も入り、翌月初の支出は入らない
+    total = execute_query(f'SELECT SUM(amount) FROM expenses WHERE {where}', params, fetch_one=True)[0]
+    assert total == 500
+
+
+def test_month_filter_crosses_year_end(expenses):
+    where, params = DateHelper.month_filter(2024, 12)
+    assert params == ('2024-12-01', '2025-01-01')
+    assert execute_query(f'SELECT SUM(amount) FROM expenses WHERE {where}', params, fetch_one=True)[0] == 500
+
+
+@pytest.mark.parametrize('sql', [
+    'SELECT SUM(amount) FROM expenses WHERE {where}',
+    'SELECT category, SUM(amount) FROM expenses WHERE {where} GROUP BY category',
+    'SELECT date, category, amount, description FROM expenses WHERE {where} ORDER BY date DESC',
+])
+def test_month_queries_search_date_index(expenses, sql):
+    where, params = DateHelper.month_filter(2025, 4)
+    plan = query_plan(sql.format(where=where), params)
+    assert 'USING INDEX idx_expenses_date' in plan or 'USING COVERING INDEX idx_expenses_date' in plan
+
+
+def test_strftime_filter_scans_table(expenses):
+    """以前の条件は列を関数で包むのでインデックスを使えない（上のテストが意味のある比較であること）"""
+    plan = query_plan(
+        "SELECT SUM(amount) FROM expenses WHERE strftime('%Y', date) = ? AND strftime('%m', date) = ?",
+        ('2025', '04')
+    )
+    assert 'SCAN expenses' in plan and 'INDEX' not in plan
+
+
+def test_category_month_query_searches_category_date_index(expenses):
+    where, params = DateHelper.month_filter(2025, 4)
+    plan = query_plan(
+        f'SELECT SUM(amount) FROM expenses WHERE category = ? AND {where}', ('食費', *params)
+    )
+    assert 'INDEX idx_expenses_category_date (category=? AND date>? AND date<?)' in plan
+
+
+def test_expense_query_month_uses_index(expenses):
+    where, params = ExpenseQuery(year=2025, month=4).where()
+    plan = query_plan(f'SELECT e.id FROM expenses e WHERE {where}', params)
+    assert 'USING INDEX idx_expenses_date' in plan or 'USING COVERING INDEX idx_expenses_date' in plan
+
+
+def test_delete_expenses_by_month(expenses):
+    where, params = DateHelper.month_filter(2025, 4, column='e.date')
+    plan = query_plan(f'SELECT e.id FROM expenses AS e WHERE {where}', params)
+    assert 'INDEX idx_expenses_date' in plan
+
+    assert delete_expenses(where=where, params=params) == 2
+    assert execute_query('SELECT COUNT(*) FROM expenses', fetch_one=True)[0] == 4
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""MonthSummary.apply_edit（一覧で1件編集したときの差分での集計の更新）"""
+import pytest
+
+pytest.importorskip('PyQt5')
+
+from db_utils import (  # noqa: E402
+    get_db_connection, import_expenses, init_monthly_category_totals, update_expense,
+)
+from month_summary import MonthSummary  # noqa: E402
+
+# main_window.BudgetApp.init_database と同じ収入・目標のテーブル
+GOALS_SCHEMA = '''
+    CREATE TABLE monthly_income (
+        year INTEGER, month INTEGER, income REAL NOT NULL, PRIMARY KEY (year, month)
+    );
+    CREATE TABLE category_goals (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, year INTEGER, month INTEGER,
+        category TEXT NOT NULL, goal_amount REAL NOT NULL, UNIQUE(year, month, category)
+    );
+    CREATE TABLE monthly_goals (
+        year INTEGER, month INTEGER, savings_goal REAL NOT NULL DEFAULT 0, expense_limit REAL,
+        PRIMARY KEY (year, month)
+    );
+'''
+
+
+@pytest.fixture
+def summary():
+    return MonthSummary(2025, 4, income=300000, category_totals={'食費': 40000.0, '交通費': 8000.0},
+                        category_goals={'食費': 50000, '交通費': 10000})
+
+
+def test_amount_change(summary):
+    summary.apply_edit((1, '2025-04-10', '食費', 1000, 'A'), (1, '2025-04-10', '食費', 3500, 'A'))
+    assert summary.category_totals == {'食費': 42500.0, '交通費': 8000.0}
+    assert summary.expense_total == 50500.0
+    assert summary.savings == 249500.0
+
+
+def test_category_change(summary):
+    summary.apply_edit((1, '2025-04-10', '食費', 1000, 'A'), (1, '2025-04-10', '日用品', 1000, 'A'))
+    assert summary.category_totals == {'食費': 39000.0, '交通費': 8000.0, '日用品': 1000.0}
+    assert summary.expense_total == 48000.0
+
+
+def test_date_moved_out_of_and_into_the_month(summary):
+    summary.apply_edit((1, '2025-04-30', '食費', 1000, 'A'), (1, '2025-05-01', '食費', 1000, 'A'))
+    assert summary.category_totals['食費'] == 39000.0
+    summary.apply_edit((2, '2025-03-31', '交通費', 500, 'B'), (2, '2025-04-01', '交通費', 500, 'B'))
+    assert summary.category_totals['交通費'] == 8500.0
+
+
+def test_edit_outside_the_month_is_ignored(summary):
+    summary.apply_edit((1, '2025-05-10', '食費', 1000, 'A'), (1, '2025-05-10', '食費', 9000, 'A'))
+    assert summary.expense_total == 48000.0
+
+
+def test_time_of_day_and_empty_amount(summary):
+    summary.apply_edit((1, '2025-04-30 23:59:59', '食費', None, 'A'), (1, '2025-04-30 23:59:59', '食費', '200', 'A'))
+    assert summary.category_totals['食費'] == 40200.0
+
+
+def test_budget_alerts_follow_the_edit(summary):
+    assert summary.budget_alerts() == [('食費', 40000.0, 50000, 80.0), ('交通費', 8000.0, 10000, 80.0)]
+    summary.apply_edit((1, '2025-04-10', '交通費', 1000, 'A'), (1, '2025-04-10', '食費', 11000, 'A'))
+    alerts = {category: ratio for category, _, _, ratio in summary.budget_alerts()}
+    assert alerts == {'食費': 102.0}
+
+
+def test_matches_a_reload_after_saving(expense_db):
+    get_db_connection().executescript(GOALS_SCHEMA)
+    init_monthly_category_totals()
+    import_expenses([
+        ('2025-04-01', '食費', 1000, 'A'),
+        ('2025-04-15', '交通費', 300, 'B'),
+        ('2025-04-30', '食費', 2000, 'C'),
+    ])
+    summary = MonthSummary.load(2025, 4)
+    old_row = tuple(get_db_connection().execute(
+        "SELECT id, date, category, amount, description FROM expenses WHERE description = 'C'"
+    ).fetchone())
+    new_row = (old_row[0], '2025-04-29', '日用品', 2500.0, 'C')
+
+    update_expense(new_row[0], *new_row[1:])
+    summary.apply_edit(old_row, new_row)
+
+    reloaded = MonthSummary.load(2025, 4)
+    assert summary.category_totals == reloaded.category_totals == {'食費': 1000.0, '交通費': 300.0, '日用品': 2500.0}
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""接続に適用するPRAGMA設定（PRAGMA_PROFILE）の確認と、以前の設定との速さの比較
+
+計測は pytest --benchmark -s tests/test_pragmas.py で実行・表示する。
+"""
+import sqlite3
+import time
+
+import pytest
+
+from db_utils import PRAGMA_PROFILE, apply_pragmas, get_db_connection, import_expenses
+from conftest import EXPENSES_SCHEMA
+
+
+# 以前の接続（PRAGMAを何も設定しない sqlite3 の既定値）
+BASELINE_PROFILE = {'journal_mode': 'DELETE', 'synchronous': 'FULL'}
+
+
+def test_connection_uses_profile(expense_db):
+    conn = get_db_connection()
+    assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    assert conn.execute('PRAGMA synchronous').fetchone()[0] == 1   # NORMAL
+    assert conn.execute('PRAGMA temp_store').fetchone()[0] == 2    # MEMORY
+    assert conn.execute('PRAGMA cache_size').fetchone()[0] == PRAGMA_PROFILE['cache_size']
+
+
+def test_reader_does_not_block_writer(expense_db):
+    reader = sqlite3.connect(expense_db, timeout=0)
+    try:
+        reader.execute('BEGIN')
+        assert reader.execute('SELECT COUNT(*) FROM expenses').fetchone()[0] == 0
+
+        # 読み取り中のトランザクションがあっても、待たずに書き込める
+        assert import_expenses([('2025-04-01', '食費', 100, 'A')]) == (1, 0)
+        # 読み取り側は始めたときの状態を読み続ける
+        assert reader.execute('SELECT COUNT(*) FROM expenses').fetchone()[0] == 0
+        reader.rollback()
+        assert reader.execute('SELECT COUNT(*) FROM expenses').fetchone()[0] == 1
+    finally:
+        reader.close()
+
+
+def _benchmark(db_path, profile):
+    """(1行ずつ確定する追加, まとめての取込, 月の集計) にかかった秒数"""
+    conn = sqlite3.connect(db_path)
+    apply_pragmas(conn, profile)
+    conn.executescript(EXPENSES_SCHEMA)
+    try:
+        start = time.perf_counter()
+        for i in range(300):
+            conn.execute(
+                'INSERT INTO expenses (date, category, amount, description) VALUES (?, ?, ?, ?)',
+                (f'2025-04-{i % 28 + 1:02d}', '食費', i, f'手入力{i}')
+            )
+            conn.commit()
+        single = time.perf_counter() - start
+
+        rows = [(f'2025-{i % 12 + 1:02d}-{i % 28 + 1:02d}', '食費', i, f'明細{i}') for i in range(30000)]
+        start = time.perf_counter()
+        with conn:
+            conn.executemany(
+                'INSERT INTO expenses (date, category, amount, description) VALUES (?, ?, ?, ?)', rows
+            )
+        bulk = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for month in range(1, 13):
+            end = f'2025-{month + 1:02d}-01' if month < 12 else '2026-01-01'
+            conn.execute(
+                'SELECT category, SUM(amount) FROM expenses WHERE date >= ? AND date < ? GROUP BY category',
+                (f'2025-{month:02d}-01', end)
+            ).fetchall()
+        refresh = time.perf_counter() - start
+    finally:
+        conn.close()
+    return single, bulk, refresh
+
+
+@pytest.mark.benchmark
+def test_profile_benchmark(tmp_path):
+    """以前の設定と PRAGMA_PROFILE の速さを比べて表示する
+
+    1行ごとの確定（手入力・一括変更）は WAL + synchronous=NORMAL で fsync が減る分だけ速くなる。
+    tmpfs のように fsync が何もしない場所では差が出ない。
+    """
+    baseline = _benchmark(str(tmp_path / 'baseline.db'), BASELINE_PROFILE)
+    tuned = _benchmark(str(tmp_path / 'tuned.db'), PRAGMA_PROFILE)
+
+    print()
+    for label, before, after in zip(('1行ずつ確定 300件', 'まとめて取込 30000件', '月の集計 12か月'),
+                                    baseline, tuned):
+        print(f'{label}: {before:.3f}s -> {after:.3f}s')
+
+
+def test_custom_profile(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / 'custom.db'))
+    try:
+        apply_pragmas(conn, {'synchronous': 'OFF', 'cache_size': -2000})
+        assert conn.execute('PRAGMA synchronous').fetchone()[0] == 0
+        assert conn.execute('PRAGMA cache_size').fetchone()[0] == -2000
+        assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'delete'
+    finally:
+        conn.close()
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""QueryScheduler のデバウンス（続いた依頼は最後の1件だけ実行）と取り消し"""
+import os
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('PyQt5')
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PyQt5.QtCore import QCoreApplication  # noqa: E402
+from PyQt5.QtWidgets import QApplication  # noqa: E402
+
+from db_utils import execute_query  # noqa: E402
+from query_scheduler import QueryScheduler  # noqa: E402
+
+# 終わらない問い合わせ（取り消されたら SQLite の interrupt で止まる）
+ENDLESS_QUERY = 'WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c) SELECT COUNT(*) FROM c'
+
+
+@pytest.fixture
+def scheduler(expense_db):
+    app = QApplication.instance() or QApplication([])  # noqa: F841
+    scheduler = QueryScheduler()
+    yield scheduler
+    scheduler.shutdown(timeout_ms=5000)
+
+
+def wait_until(predicate, timeout=5.0):
+    """GUIスレッドのイベントを処理しながら predicate() が真になるのを待つ"""
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        QCoreApplication.processEvents()
+        time.sleep(0.005)
+    return True
+
+
+def settle(seconds=0.2):
+    """遅れて届く結果が無いことを確かめるため、しばらくイベントを処理する"""
+    wait_until(lambda: False, timeout=seconds)
+
+
+def test_rapid_requests_run_only_the_last_one(scheduler):
+    ran = []
+    results = []
+    for text in ['コ', 'コン', 'コンビ', 'コンビニ']:
+        scheduler.schedule('search', lambda text=text: ran.append(text) or text, results.append, delay_ms=50)
+    assert scheduler.is_busy('search')
+    assert wait_until(lambda: results)
+    settle()
+    assert ran == ['コンビニ']
+    assert results == ['コンビニ']
+    assert not scheduler.is_busy('search')
+
+
+def test_cancel_before_the_delay(scheduler):
+    ran = []
+    scheduler.schedule('search', lambda: ran.append(1), ran.append, delay_ms=50)
+    scheduler.cancel('search')
+    assert not scheduler.is_busy('search')
+    settle()
+    assert ran == []
+
+
+def test_new_request_discards_the_running_one(scheduler):
+    started = threading.Event()
+    release = threading.Event()
+    results = []
+
+    def slow():
+        started.set()
+        release.wait(5)
+        return 'old'
+
+    scheduler.schedule('table', slow, results.append)
+    assert wait_until(started.is_set)
+    scheduler.schedule('table', lambda: 'new', results.append)
+    release.set()
+    assert wait_until(lambda: results)
+    settle()
+    assert results == ['new']
+
+
+def test_cancel_interrupts_running_sql(scheduler):
+    started = threading.Event()
+    outcome = []
+    errors = []
+
+    def endless():
+        started.set()
+        try:
+            return execute_query(ENDLESS_QUERY, fetch_one=True)
+        except Exception as e:
+            outcome.append(e)
+            raise
+
+    scheduler.schedule('table', endless, outcome.append, error_callback=errors.append)
+    assert wait_until(started.is_set)
+    time.sleep(0.05)  # SQL の実行に入るのを待つ
+    scheduler.cancel('table')
+    assert wait_until(lambda: outcome)
+    assert 'interrupt' in str(outcome[0])
+    settle()
+    assert errors == []  # 取り消した依頼のエラーは知らせない
+
+    # 同じワーカー・接続で次の問い合わせは普通に実行できる
+    results = []
+    scheduler.schedule('table', lambda: execute_query('SELECT COUNT(*) FROM expenses', fetch_one=True)[0],
+                       results.append)
+    assert wait_until(lambda: results)
+    assert results == [0]
+
+
+def test_keys_are_independent(scheduler):
+    results = []
+    scheduler.schedule('table', lambda: 'table', results.append, delay_ms=30)
+    scheduler.schedule('summary', lambda: 'summary', results.append, delay_ms=30)
+    assert wait_until(lambda: len(results) == 2)
+    assert sorted(results) == ['summary', 'table']
+
+
+def test_errors_go_to_error_callback(scheduler):
+    errors = []
+    scheduler.schedule('table', lambda: execute_query('SELECT * FROM no_such_table'), errors.append,
+                       error_callback=errors.append)
+    assert wait_until(lambda: errors)
+    assert 'no_such_table' in errors[0]
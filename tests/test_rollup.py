@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""月別・カテゴリ別の集計テーブル（monthly_category_totals）がトリガーで expenses と一致し続けること"""
+import pytest
+
+from db_utils import (
+    delete_expenses, get_db_connection, import_expenses, init_monthly_category_totals, insert_expense,
+    recategorize_expenses, shift_expense_dates, update_expense,
+)
+
+
+def rollup():
+    return get_db_connection().execute('''
+        SELECT year, month, category, total, count
+        FROM monthly_category_totals
+        ORDER BY year, month, category
+    ''').fetchall()
+
+
+def group_by():
+    """expenses を直接 GROUP BY した、集計テーブルにあるべき内容"""
+    return get_db_connection().execute('''
+        SELECT CAST(strftime('%Y', date) AS INTEGER) AS year,
+               CAST(strftime('%m', date) AS INTEGER) AS month,
+               category, SUM(amount), COUNT(*)
+        FROM expenses
+        WHERE strftime('%Y', date) IS NOT NULL
+        GROUP BY 1, 2, 3
+        ORDER BY 1, 2, 3
+    ''').fetchall()
+
+
+@pytest.fixture
+def rollup_db(expense_db):
+    init_monthly_category_totals()
+    import_expenses([
+        ('2025-03-31', '食費', 100, 'A'),
+        ('2025-04-01', '食費', 200, 'B'),
+        ('2025-04-15', '交通費', 300, 'C'),
+        ('2025-04-30 23:59:59', '食費', 400, 'D'),
+        ('2025/04/10', '食費', 999, '読めない日付'),  # 集計されない
+        ('2025-05-01', '娯楽', 500, 'E'),
+    ])
+    return expense_db
+
+
+def test_existing_expenses_are_rolled_up_on_first_init(expense_db):
+    import_expenses([('2025-04-01', '食費', 200, 'B'), ('2025-04-02', '食費', 300, 'C')])
+    init_monthly_category_totals()
+    assert rollup() == [(2025, 4, '食費', 500.0, 2)]
+    init_monthly_category_totals()  # 2回目以降は作り直さない（足し直して倍にならない）
+    assert rollup() == [(2025, 4, '食費', 500.0, 2)]
+
+
+def test_insert(rollup_db):
+    assert (2025, 4, '食費', 600.0, 2) in rollup()
+    insert_expense('2025-04-20', '食費', 50, '手入力')
+    insert_expense('2025-06-01', '健康', 70, '新しい月とカテゴリ')
+    assert rollup() == group_by()
+    assert (2025, 4, '食費', 650.0, 3) in rollup()
+
+
+def test_update(rollup_db):
+    expense_id = get_db_connection().execute("SELECT id FROM expenses WHERE description = 'C'").fetchone()[0]
+    update_expense(expense_id, '2025-05-02', '食費', 350, 'C')
+    assert rollup() == group_by()
+    # 交通費の最後の1件が抜けたので、その行は消える
+    assert not [row for row in rollup() if row[2] == '交通費']
+
+
+def test_update_from_unreadable_date(rollup_db):
+    expense_id = get_db_connection().execute(
+        "SELECT id FROM expenses WHERE description = '読めない日付'"
+    ).fetchone()[0]
+    update_expense(expense_id, '2025-04-10', '食費', 999, '読めない日付')
+    assert rollup() == group_by()
+    assert (2025, 4, '食費', 1599.0, 3) in rollup()
+
+
+def test_recategorize(rollup_db):
+    assert recategorize_expenses('外食', where="e.category = '食費'") == 4
+    assert rollup() == group_by()
+
+
+def test_delete(rollup_db):
+    assert delete_expenses(where='e.amount >= ?', params=(300,)) == 4
+    assert rollup() == group_by()
+    assert rollup() == [(2025, 3, '食費', 100.0, 1), (2025, 4, '食費', 200.0, 1)]
+
+
+def test_shift_across_months(rollup_db):
+    ids = [row[0] for row in get_db_connection().execute(
+        "SELECT id FROM expenses WHERE description IN ('A', 'D', 'E')"
+    )]
+    assert shift_expense_dates(1, ids=ids) == 3
+    assert rollup() == group_by()
+    assert (2025, 3, '食費') not in [row[:3] for row in rollup()]
+    assert shift_expense_dates(-1, ids=ids) == 3
+    assert rollup() == group_by()
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""全文検索インデックスへの反映は支出を書き込む側で行い、検索（ExpenseQuery）は書き込まない"""
+import pytest
+
+pytest.importorskip('PyQt5')
+
+from db_utils import (  # noqa: E402
+    get_db_connection, import_expenses, insert_expense, recategorize_expenses, update_expense,
+)
+from expense_query import ExpenseQuery  # noqa: E402
+from conftest import CATEGORIES_SCHEMA  # noqa: E402
+
+# main_window.BudgetApp.init_database と同じ全文検索インデックスとトリガー
+SEARCH_INDEX_SCHEMA = '''
+    CREATE VIRTUAL TABLE expenses_fts USING fts5(description, category, tokenize='trigram');
+    CREATE TABLE expenses_fts_pending (expense_id INTEGER PRIMARY KEY);
+    CREATE TRIGGER trg_expenses_fts_queue_insert
+    AFTER INSERT ON expenses
+    BEGIN
+        INSERT OR IGNORE INTO expenses_fts_pending (expense_id) VALUES (NEW.id);
+    END;
+    CREATE TRIGGER trg_expenses_fts_queue_update
+    AFTER UPDATE OF id, description, category ON expenses
+    BEGIN
+        DELETE FROM expenses_fts WHERE rowid = OLD.id;
+        INSERT OR IGNORE INTO expenses_fts_pending (expense_id) VALUES (NEW.id);
+    END;
+    CREATE TRIGGER trg_expenses_fts_delete
+    AFTER DELETE ON expenses
+    BEGIN DELETE FROM expenses_fts WHERE rowid = OLD.id; END;
+'''
+
+
+@pytest.fixture
+def search_db(expense_db):
+    get_db_connection().executescript(CATEGORIES_SCHEMA + SEARCH_INDEX_SCHEMA)
+    return expense_db
+
+
+def found(keyword):
+    return [row[4] for row in ExpenseQuery(keyword=keyword).fetch_page(0, 100)]
+
+
+def pending_count():
+    return get_db_connection().execute('SELECT COUNT(*) FROM expenses_fts_pending').fetchone()[0]
+
+
+def test_hand_entered_expense_is_searchable(search_db):
+    insert_expense('2025-04-01', '食費', 500, 'ｺﾝﾋﾞﾆ 弁当')
+    assert pending_count() == 0
+    assert found('コンビニ') == ['ｺﾝﾋﾞﾆ 弁当']
+
+
+def test_imported_expenses_are_searchable(search_db):
+    import_expenses([('2025-04-01', '食費', 500, 'クレジットカード: スーパー丸正')])
+    assert pending_count() == 0
+    assert found('スーパー') == ['クレジットカード: スーパー丸正']
+
+
+def test_edited_expense_is_searchable_by_new_text(search_db):
+    expense_id = insert_expense('2025-04-01', '食費', 500, 'コンビニ')
+    update_expense(expense_id, '2025-04-01', '食費', 500, 'ドラッグストア')
+    assert found('コンビニ') == []
+    assert found('ドラッグ') == ['ドラッグストア']
+
+
+def test_recategorized_expenses_are_searchable_by_new_category(search_db):
+    expense_id = insert_expense('2025-04-01', '食費', 500, '薬')
+    assert recategorize_expenses('健康管理費', ids=[expense_id]) == 1
+    assert pending_count() == 0
+    assert found('健康管理') == ['薬']
+
+
+def test_search_does_not_write(search_db):
+    insert_expense('2025-04-01', '食費', 500, 'コンビニ')
+    # アプリ外（sqlite3 コマンドなど）からの書き込みは、次の起動時まで索引待ちのまま
+    get_db_connection().execute(
+        "INSERT INTO expenses (date, category, amount, description) VALUES ('2025-04-02', '食費', 300, 'コンビニ')"
+    )
+    conn = get_db_connection()
+    before = conn.total_changes
+    query = ExpenseQuery(year=2025, month=4, keyword='コンビニ', sort='カテゴリ別')
+    assert query.count() == 1
+    query.summary()
+    query.group_summaries()
+    query.fetch_page(0, 100)
+    ExpenseQuery(keyword='コンビニ', sort='関連度順').fetch_page(0, 100)
+    assert conn.total_changes == before
+    assert pending_count() == 1
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""sheet_fetch の条件付き取得と rows_since をローカルのHTTPサーバーで確かめる"""
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from sheet_fetch import fetch_sheet_csv, rows_since
+
+
+SHEET = '日付,金額,店舗名\n2025/03/01,500,A\n2025/03/05,1200,B\n2025/03/09,800,C\n'
+
+
+class SheetServer:
+    """公開CSVの代わり。ETag / Last-Modified を返し、条件付きリクエストには 304 を返す"""
+
+    def __init__(self):
+        self.body = SHEET
+        self.etag = '"v1"'
+        self.requests = []  # 受け取ったリクエストヘッダー
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests.append(dict(self.headers))
+                if self.headers.get('If-None-Match') == server.etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                data = server.body.encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/csv')
+                self.send_header('Content-Length', str(len(data)))
+                self.send_header('ETag', server.etag)
+                self.send_header('Last-Modified', 'Sat, 01 Mar 2025 00:00:00 GMT')
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.httpd.server_address[1]}/sheet.csv'
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def server():
+    server = SheetServer()
+    yield server
+    server.close()
+
+
+def test_first_fetch_saves_body(server, tmp_path):
+    text, unchanged = fetch_sheet_csv(server.url, cache_dir=tmp_path)
+
+    assert (text, unchanged) == (SHEET, False)
+    assert 'If-None-Match' not in server.requests[0]
+    assert sorted(p.suffix for p in tmp_path.iterdir()) == ['.csv', '.json']
+
+
+def test_not_modified_reuses_saved_body(server, tmp_path):
+    fetch_sheet_csv(server.url, cache_dir=tmp_path)
+    text, unchanged = fetch_sheet_csv(server.url, cache_dir=tmp_path)
+
+    assert (text, unchanged) == (SHEET, True)
+    assert server.requests[1]['If-None-Match'] == '"v1"'
+    assert server.requests[1]['If-Modified-Since'] == 'Sat, 01 Mar 2025 00:00:00 GMT'
+
+
+def test_changed_sheet_replaces_saved_body(server, tmp_path):
+    fetch_sheet_csv(server.url, cache_dir=tmp_path)
+    server.body = SHEET + '2025/03/12,300,D\n'
+    server.etag = '"v2"'
+
+    assert fetch_sheet_csv(server.url, cache_dir=tmp_path) == (server.body, False)
+    # 次は新しい ETag で問い合わせ、新しい本文が使われる
+    assert fetch_sheet_csv(server.url, cache_dir=tmp_path) == (server.body, True)
+    assert server.requests[2]['If-None-Match'] == '"v2"'
+
+
+def test_missing_saved_body_fetches_again(server, tmp_path):
+    fetch_sheet_csv(server.url, cache_dir=tmp_path)
+    for path in tmp_path.glob('*.csv'):
+        path.unlink()
+
+    assert fetch_sheet_csv(server.url, cache_dir=tmp_path) == (SHEET, False)
+    assert 'If-None-Match' not in server.requests[1]
+
+
+def test_rows_since_keeps_header_and_rows_from_since():
+    text = rows_since(SHEET, '日付', '%Y/%m/%d', '2025-03-05')
+    assert text == '日付,金額,店舗名\n2025/03/05,1200,B\n2025/03/09,800,C\n'
+
+
+def test_rows_since_keeps_unreadable_dates():
+    sheet = SHEET + '不明,100,X\n2025/02/28,100,Y\n'
+    text = rows_since(sheet, '日付', '%Y/%m/%d', '2025-03-09')
+    assert text == '日付,金額,店舗名\n2025/03/09,800,C\n不明,100,X\n'
+
+
+def test_rows_since_without_since_or_column_returns_text():
+    assert rows_since(SHEET, '日付', '%Y/%m/%d', None) == SHEET
+    assert rows_since(SHEET, '利用日', '%Y/%m/%d', '2025-03-05') == SHEET